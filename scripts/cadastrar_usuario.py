@@ -5,11 +5,15 @@ Script Interativo para Cadastro de Usuários
 Sistema de Consultas Médicas - Sistemas Distribuídos
 """
 
+import csv
 import sys
 import requests
 
 # Configuração da API
 API_URL = "http://localhost:5000/users"
+API_URL_LOTE = f"{API_URL}/bulk"
+# Usuários enviados por chamada no cadastro a partir de arquivo
+TAMANHO_LOTE = 500
 
 # Cores para output
 class Colors:
@@ -154,6 +158,72 @@ def criar_usuario(nome, cpf, email, senha, role, telefone=None):
         print_error(f"Erro inesperado: {str(e)}")
         return False
 
+def criar_usuarios_arquivo(caminho, tamanho_lote=TAMANHO_LOTE):
+    """
+    Cadastra os usuários de um arquivo CSV usando POST /users/bulk.
+    Colunas: nome,cpf,email,senha,role[,telefone] (com cabeçalho)
+    """
+    try:
+        with open(caminho, newline='', encoding='utf-8') as arquivo:
+            usuarios = []
+            for linha in csv.DictReader(arquivo):
+                usuario = {
+                    "name": linha.get("nome", "").strip(),
+                    "cpf": linha.get("cpf", "").strip(),
+                    "email": linha.get("email", "").strip(),
+                    "password": linha.get("senha", "").strip(),
+                    "role": linha.get("role", "").strip().upper()
+                }
+                if linha.get("telefone"):
+                    usuario["phone"] = linha["telefone"].strip()
+                usuarios.append(usuario)
+    except OSError as e:
+        print_error(f"Não foi possível ler o arquivo: {e}")
+        return False
+    
+    if not usuarios:
+        print_error("Arquivo sem usuários!")
+        return False
+    
+    criados = 0
+    falhas = 0
+    for inicio in range(0, len(usuarios), tamanho_lote):
+        lote = usuarios[inicio:inicio + tamanho_lote]
+        print_info(f"Enviando usuários {inicio + 1} a {inicio + len(lote)} de {len(usuarios)}...")
+        try:
+            response = requests.post(API_URL_LOTE, json={"users": lote}, timeout=300)
+        except requests.exceptions.ConnectionError:
+            print_error("Não foi possível conectar à API!")
+            return False
+        except requests.exceptions.Timeout:
+            print_error("Timeout ao conectar com a API!")
+            return False
+        
+        if response.status_code != 200:
+            print_error(f"Erro no lote! Status: {response.status_code}")
+            try:
+                print(response.json())
+            except:
+                print(response.text)
+            return False
+        
+        data = response.json()
+        criados += data.get('created', 0)
+        falhas += data.get('failed', 0)
+        for resultado in data.get('results', []):
+            if not resultado.get('success'):
+                usuario = lote[resultado['index']]
+                print_error(f"Linha {inicio + resultado['index'] + 2} ({usuario.get('email')}): "
+                            f"{resultado.get('message')}")
+    
+    print(f"\n{Colors.GREEN}{'='*60}")
+    print(f"✅ {criados} USUÁRIO(S) CADASTRADO(S)")
+    print(f"{'='*60}{Colors.END}")
+    if falhas:
+        print_error(f"{falhas} linha(s) com erro")
+    print()
+    return falhas == 0
+
 def modo_interativo():
     """Modo interativo com prompts"""
     print_header()
@@ -190,8 +260,10 @@ def modo_linha_comando():
         print("  • DOCTOR       - Médico")
         print("  • RECEPTIONIST - Recepcionista")
         print("  • ADMIN        - Administrador")
+        print(f"  python cadastrar_usuario.py --arquivo <usuarios.csv>")
         print(f"\n{Colors.YELLOW}Exemplo:{Colors.END}")
         print('  python cadastrar_usuario.py "João Silva" "123.456.789-00" "joao@email.com" "senha123" "PATIENT" "85999999999"')
+        print("  python cadastrar_usuario.py --arquivo pacientes.csv   # colunas: nome,cpf,email,senha,role,telefone")
         print(f"\n{Colors.CYAN}💡 Dica: Execute sem argumentos para usar o modo interativo!{Colors.END}\n")
         return False
     
@@ -217,6 +289,8 @@ def main():
         # Se não houver argumentos, usar modo interativo
         if len(sys.argv) == 1:
             sucesso = modo_interativo()
+        elif sys.argv[1] in ['--arquivo', '-a'] and len(sys.argv) > 2:
+            sucesso = criar_usuarios_arquivo(sys.argv[2])
         else:
             sucesso = modo_linha_comando()
         
@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Teste de carga do fluxo completo (testar-sistema-completo.py em paralelo)
+Cada clínica virtual é uma thread com sessão HTTP própria: cadastra seu
+médico e depois repete o fluxo paciente → agendamento → pagamento →
+confirmação. A latência de cada passo é registrada separadamente e somada
+por serviço (usuários, agendamento, pagamentos), apontando o gargalo do
+sistema como um todo.
+
+Uso:
+    python carga_sistema_completo.py --clinicas 10 --duracao 60
+    python carga_sistema_completo.py --clinicas 20 --taxa 5 --rampa 30 --json carga.json
+
+Com --taxa a chegada de fluxos é em malha aberta (fluxos/s no total,
+crescendo linearmente durante a rampa) e a latência do fluxo conta desde o
+instante de chegada; sem ela, cada clínica executa um fluxo após o outro e
+a rampa apenas escalona o início das clínicas.
+"""
+
+import argparse
+import itertools
+import json
+import math
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+import requests
+from utils import Colors, print_header, print_success, print_error, print_info
+
+# Configurações
+BASE_URL_USUARIOS = os.getenv('BASE_URL_USUARIOS', "http://localhost:5000")
+BASE_URL_AGENDAMENTO = os.getenv('BASE_URL_AGENDAMENTO', "http://localhost:8080")
+BASE_URL_PAGAMENTOS = os.getenv('BASE_URL_PAGAMENTOS', "http://localhost:8000")
+
+# Passos do fluxo e o serviço que atende cada um
+PASSOS = (
+    ('criar_medico', 'usuarios'),
+    ('criar_paciente', 'usuarios'),
+    ('criar_agendamento', 'agendamento'),
+    ('criar_pagamento', 'pagamentos'),
+    ('confirmar_pagamento', 'pagamentos')
+)
+# Domínio dos emails criados pela carga
+DOMINIO_CARGA = 'carga.local'
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, int(round(fraction * len(values) + 0.5)) - 1))
+    return values[index]
+
+def summarize(latencies):
+    values = sorted(latencies)
+    return {
+        'p50_ms': round(percentile(values, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(values, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(values, 0.99) * 1000, 3),
+        'max_ms': round(values[-1] * 1000, 3) if values else 0.0,
+        'mean_ms': round(sum(values) / len(values) * 1000, 3) if values else 0.0
+    }
+
+def formatar_cpf(numero):
+    digitos = f'{numero:011d}'[-11:]
+    return f'{digitos[:3]}.{digitos[3:6]}.{digitos[6:9]}-{digitos[9:]}'
+
+class PassoFalhou(Exception):
+    """Um passo do fluxo não retornou sucesso"""
+
+class Registro:
+    """Latências e erros por passo, fluxos concluídos e tempo em fila"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.passos = {passo: [] for passo, _ in PASSOS}
+        self.erros = {passo: Counter() for passo, _ in PASSOS}
+        self.fluxos = []
+        self.fila = []
+        self.falhas = Counter()  # passo em que o fluxo foi abortado
+
+    def passo(self, passo, latencia, erro=None):
+        with self.lock:
+            self.passos[passo].append(latencia)
+            if erro:
+                self.erros[passo][erro] += 1
+
+    def fluxo(self, latencia, espera, falhou_em=None):
+        with self.lock:
+            self.fila.append(espera)
+            if falhou_em:
+                self.falhas[falhou_em] += 1
+            else:
+                self.fluxos.append(latencia)
+
+class Clinica:
+    """Clínica virtual: um médico e um fluxo por vez, com sessão HTTP persistente"""
+
+    def __init__(self, indice, execucao, sequencia, registro, timeout):
+        self.indice = indice
+        self.execucao = execucao
+        self.sequencia = sequencia
+        self.registro = registro
+        self.timeout = timeout
+        self.http = requests.Session()
+        self.medico = None
+        # Horários consecutivos de 30 min a partir de amanhã, 08:00
+        amanha = datetime.now() + timedelta(days=1)
+        self.proximo_horario = amanha.replace(hour=8, minute=0, second=0, microsecond=0)
+
+    def chamar(self, passo, metodo, url, payload=None):
+        """Executa um passo e registra a latência; retorna o JSON da resposta"""
+        inicio = time.perf_counter()
+        erro = None
+        try:
+            response = self.http.request(metodo, url, json=payload, timeout=self.timeout)
+            if response.status_code not in (200, 201):
+                erro = f'HTTP {response.status_code}'
+                return None
+            return response.json()
+        except requests.Timeout:
+            erro = 'timeout'
+            return None
+        except Exception as e:
+            erro = type(e).__name__
+            return None
+        finally:
+            self.registro.passo(passo, time.perf_counter() - inicio, erro)
+
+    def criar_usuario(self, passo, role):
+        numero = next(self.sequencia)
+        payload = {
+            "name": f"Carga {role.title()} {self.execucao}-{numero}",
+            "cpf": formatar_cpf(self.execucao * 10 ** 6 + numero),
+            "email": f"carga.{self.execucao}.{numero}@{DOMINIO_CARGA}",
+            "password": "senha123",
+            "role": role,
+            "phone": "85999999999"
+        }
+        data = self.chamar(passo, 'POST', f"{BASE_URL_USUARIOS}/users", payload)
+        if data is None:
+            raise PassoFalhou(passo)
+        return data.get('id') or data.get('user', {}).get('id'), payload['email']
+
+    def preparar(self):
+        """Cadastra o médico da clínica (fora das latências de fluxo)"""
+        self.medico = self.criar_usuario('criar_medico', 'DOCTOR')
+
+    def executar_fluxo(self):
+        """Paciente → agendamento → pagamento → confirmação"""
+        paciente_id, paciente_email = self.criar_usuario('criar_paciente', 'PATIENT')
+        medico_id, medico_email = self.medico
+        data_hora = self.proximo_horario
+        self.proximo_horario += timedelta(minutes=30)
+        agendamento = self.chamar('criar_agendamento', 'POST', f"{BASE_URL_AGENDAMENTO}/api/agendamentos", {
+            "pacienteId": paciente_id,
+            "pacienteEmail": paciente_email,
+            "medicoId": medico_id,
+            "medicoEmail": medico_email,
+            "especialidade": "Cardiologia",
+            "dataHora": data_hora.strftime('%Y-%m-%dT%H:%M:%S')
+        })
+        if not agendamento or not agendamento.get('id'):
+            raise PassoFalhou('criar_agendamento')
+        pagamento = self.chamar('criar_pagamento', 'POST', f"{BASE_URL_PAGAMENTOS}/api/payloads", {
+            "agendamento_id": agendamento['id'],
+            "total": 150.00,
+            "payment_method": "pix",
+            "customer_email": paciente_email
+        })
+        if not pagamento or not pagamento.get('id'):
+            raise PassoFalhou('criar_pagamento')
+        if self.chamar('confirmar_pagamento', 'POST',
+                       f"{BASE_URL_PAGAMENTOS}/api/payloads/{pagamento['id']}/pay") is None:
+            raise PassoFalhou('confirmar_pagamento')
+
+    def fechar(self):
+        self.http.close()
+
+def instante_chegada(k, taxa, rampa):
+    """
+    Instante (s) da k-ésima chegada com a taxa crescendo linearmente de 0 a
+    `taxa` em `rampa` segundos: inverte N(t) = taxa·t²/(2·rampa) na rampa e
+    N(t) = taxa·(t − rampa/2) depois dela.
+    """
+    if rampa > 0 and k <= taxa * rampa / 2:
+        return math.sqrt(2 * rampa * k / taxa)
+    return k / taxa + rampa / 2
+
+def executar_carga(args):
+    """Executa a carga com `args.clinicas` clínicas; retorna o resultado"""
+    registro = Registro()
+    execucao = args.execucao or random.randrange(10 ** 4, 10 ** 5)
+    sequencia = itertools.count(1)
+    parar = threading.Event()
+    chegadas = queue.Queue()
+    inicio = time.perf_counter()
+    prazo = inicio + args.duracao
+    restantes = [args.fluxos] if args.fluxos else None
+    restantes_lock = threading.Lock()
+
+    def reservar():
+        if restantes is None:
+            return True
+        with restantes_lock:
+            if restantes[0] <= 0:
+                return False
+            restantes[0] -= 1
+            return True
+
+    def gerar_chegadas():
+        """Malha aberta: enfileira cada fluxo no instante previsto"""
+        for k in itertools.count(1):
+            agendado = inicio + instante_chegada(k, args.taxa, args.rampa)
+            if agendado >= prazo or not reservar():
+                break
+            espera = agendado - time.perf_counter()
+            if espera > 0 and parar.wait(espera):
+                break
+            chegadas.put(agendado)
+        for _ in range(args.clinicas):
+            chegadas.put(None)
+
+    def trabalhar(indice):
+        clinica = Clinica(indice, execucao, sequencia, registro, args.timeout)
+        if not args.taxa:
+            # Malha fechada: a rampa escalona o início das clínicas
+            if parar.wait(args.rampa * indice / args.clinicas):
+                return
+        try:
+            try:
+                clinica.preparar()
+            except PassoFalhou:
+                print_error(f"Clínica {indice}: falha ao cadastrar o médico")
+                return
+            while not parar.is_set():
+                if args.taxa:
+                    agendado = chegadas.get()
+                    if agendado is None:
+                        break
+                else:
+                    agendado = time.perf_counter()
+                    if agendado >= prazo or not reservar():
+                        break
+                espera = time.perf_counter() - agendado
+                falhou_em = None
+                try:
+                    clinica.executar_fluxo()
+                except PassoFalhou as e:
+                    falhou_em = str(e)
+                registro.fluxo(time.perf_counter() - agendado, espera, falhou_em)
+        finally:
+            clinica.fechar()
+
+    threads = [threading.Thread(target=trabalhar, args=(i,), daemon=True) for i in range(args.clinicas)]
+    if args.taxa:
+        threads.append(threading.Thread(target=gerar_chegadas, daemon=True))
+    for thread in threads:
+        thread.start()
+    try:
+        for thread in threads:
+            thread.join()
+    except KeyboardInterrupt:
+        print(f"\n{Colors.YELLOW}⚠️  Interrompido: aguardando os fluxos em andamento...{Colors.END}")
+        parar.set()
+        for _ in range(args.clinicas):
+            chegadas.put(None)
+        for thread in threads:
+            thread.join()
+    decorrido = max(1e-9, time.perf_counter() - inicio)
+    return resumir(registro, execucao, decorrido)
+
+def resumir(registro, execucao, decorrido):
+    passos = {}
+    servicos = {}
+    for passo, servico in PASSOS:
+        latencias = registro.passos[passo]
+        erros = registro.erros[passo]
+        passos[passo] = dict(servico=servico, requisicoes=len(latencias),
+                             erros=sum(erros.values()), **summarize(latencias),
+                             tipos_erro=dict(erros.most_common()))
+        if passo == 'criar_medico':
+            # Preparação das clínicas: não faz parte do fluxo repetido
+            continue
+        total = servicos.setdefault(servico, {'tempo_total_s': 0.0, 'requisicoes': 0, 'erros': 0})
+        total['tempo_total_s'] += sum(latencias)
+        total['requisicoes'] += len(latencias)
+        total['erros'] += sum(erros.values())
+    tempo_fluxo = sum(s['tempo_total_s'] for s in servicos.values())
+    for servico in servicos.values():
+        servico['fracao_do_fluxo'] = round(servico['tempo_total_s'] / tempo_fluxo, 4) if tempo_fluxo else 0.0
+        servico['tempo_total_s'] = round(servico['tempo_total_s'], 3)
+    gargalo = max(servicos, key=lambda s: servicos[s]['fracao_do_fluxo']) if tempo_fluxo else None
+
+    concluidos = len(registro.fluxos)
+    falhos = sum(registro.falhas.values())
+    return {
+        'execucao': execucao,
+        'decorrido_s': round(decorrido, 3),
+        'fluxos': concluidos,
+        'fluxos_falhos': falhos,
+        'fluxos_por_s': round(concluidos / decorrido, 2),
+        'fluxo': summarize(registro.fluxos),
+        'fila': summarize(registro.fila),
+        'falhas_por_passo': dict(registro.falhas.most_common()),
+        'passos': passos,
+        'servicos': servicos,
+        'gargalo': gargalo
+    }
+
+def print_relatorio(resultado):
+    header = f"{'passo':<22}{'serviço':<13}{'req':>7}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}{'erros':>7}"
+    print()
+    print(header)
+    print('-' * len(header))
+    for passo, r in resultado['passos'].items():
+        print(f"{passo:<22}{r['servico']:<13}{r['requisicoes']:>7}{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}"
+              f"{r['p99_ms']:>9.1f}{r['max_ms']:>9.1f}{r['erros']:>7}")
+    fluxo = resultado['fluxo']
+    print(f"{'fluxo completo':<35}{resultado['fluxos']:>7}{fluxo['p50_ms']:>9.1f}{fluxo['p95_ms']:>9.1f}"
+          f"{fluxo['p99_ms']:>9.1f}{fluxo['max_ms']:>9.1f}{resultado['fluxos_falhos']:>7}")
+    fila = resultado['fila']
+    print(f"{'espera na fila':<42}{fila['p50_ms']:>9.1f}{fila['p95_ms']:>9.1f}"
+          f"{fila['p99_ms']:>9.1f}{fila['max_ms']:>9.1f}")
+    print('(latências em ms)')
+
+    print(f"\n{Colors.CYAN}Tempo do fluxo por serviço:{Colors.END}")
+    for nome, servico in sorted(resultado['servicos'].items(), key=lambda i: -i[1]['fracao_do_fluxo']):
+        print(f"  • {nome:<12} {servico['fracao_do_fluxo'] * 100:5.1f}%  "
+              f"({servico['tempo_total_s']:.1f}s em {servico['requisicoes']} req, {servico['erros']} erro(s))")
+    for passo, r in resultado['passos'].items():
+        for erro, quantidade in r['tipos_erro'].items():
+            print(f"  ⚠️  {passo}: {quantidade}x {erro}")
+
+    print()
+    print_info(f"{resultado['fluxos']} fluxo(s) concluído(s) em {resultado['decorrido_s']:.1f}s "
+               f"({resultado['fluxos_por_s']:.2f} fluxos/s)")
+    if resultado['gargalo']:
+        print_info(f"Gargalo: serviço de {resultado['gargalo']}")
+
+def verificar_servicos():
+    """Verifica se os três serviços respondem antes de iniciar a carga"""
+    servicos = {
+        "Usuários": f"{BASE_URL_USUARIOS}/health",
+        "Agendamento": f"{BASE_URL_AGENDAMENTO}/actuator/health",
+        "Pagamentos": f"{BASE_URL_PAGAMENTOS}/api/health"
+    }
+    todos_ok = True
+    for nome, url in servicos.items():
+        try:
+            response = requests.get(url, timeout=5)
+            if response.status_code < 500:
+                print_success(f"{nome}: Disponível")
+                continue
+            print_error(f"{nome}: Erro {response.status_code}")
+        except Exception as e:
+            print_error(f"{nome}: Não disponível - {str(e)}")
+        todos_ok = False
+    return todos_ok
+
+def main():
+    parser = argparse.ArgumentParser(description='Teste de carga do fluxo completo do sistema')
+    parser.add_argument('--clinicas', type=int, default=10, help='clínicas virtuais simultâneas')
+    parser.add_argument('--taxa', type=float, default=0,
+                        help='fluxos/s no total (0 = cada clínica o mais rápido possível)')
+    parser.add_argument('--rampa', type=float, default=0,
+                        help='segundos até atingir a taxa (ou até todas as clínicas iniciarem)')
+    parser.add_argument('--duracao', type=float, default=60, help='segundos de carga')
+    parser.add_argument('--fluxos', type=int, default=0, help='limite de fluxos no total')
+    parser.add_argument('--timeout', type=float, default=30, help='timeout (s) por requisição')
+    parser.add_argument('--execucao', type=int, default=0,
+                        help='identificador usado nos emails/CPFs criados (padrão: aleatório)')
+    parser.add_argument('--json', help='grava o resultado em JSON')
+    args = parser.parse_args()
+    if args.clinicas < 1 or args.taxa < 0 or args.rampa < 0 or args.duracao <= 0:
+        parser.error('--clinicas e --duracao devem ser positivos; --taxa e --rampa, não negativos')
+
+    print_header("TESTE DE CARGA DO FLUXO COMPLETO")
+    if not verificar_servicos():
+        print_info("Execute: docker compose up -d")
+        sys.exit(1)
+    modo = f"{args.taxa:g} fluxos/s" if args.taxa else "malha fechada"
+    print_info(f"{args.clinicas} clínica(s), {modo}, rampa de {args.rampa:g}s, {args.duracao:g}s de carga")
+
+    resultado = executar_carga(args)
+    resultado['configuracao'] = {
+        'clinicas': args.clinicas,
+        'taxa': args.taxa or None,
+        'rampa_s': args.rampa,
+        'duracao_s': args.duracao
+    }
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as output:
+            json.dump(resultado, output, indent=2, ensure_ascii=False)
+        print_success(f"Resultado gravado em {args.json}")
+    print_relatorio(resultado)
+
+if __name__ == "__main__":
+    main()
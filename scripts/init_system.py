@@ -11,6 +11,7 @@ import sys
 from utils import Colors, print_header, print_success, print_error, print_info
 
 API_USUARIOS = "http://servico-usuario-interface:5000/users"
+API_USUARIOS_LOTE = f"{API_USUARIOS}/bulk"
 # Nota: Usamos o nome do serviço no Docker (servico-usuario-interface) em vez de localhost
 
 def esperar_servico(url, nome, max_retries=30):
@@ -63,6 +64,29 @@ def criar_usuario_se_nao_existir(nome, cpf, email, senha, role, telefone=None):
         print_error(f"Erro de conexão ao criar {nome}: {str(e)}")
         return False
 
+def criar_usuarios_em_lote(usuarios):
+    """Cria os usuários em uma única chamada a POST /users/bulk"""
+    try:
+        print_info(f"Criando {len(usuarios)} usuários em lote...")
+        response = requests.post(API_USUARIOS_LOTE, json={"users": usuarios}, timeout=120)
+        
+        if response.status_code != 200:
+            print_error(f"Erro no cadastro em lote: {response.status_code} - {response.text}")
+            return False
+        
+        for resultado in response.json().get('results', []):
+            nome = usuarios[resultado['index']]['name']
+            if resultado.get('success'):
+                print_success(f"Usuário {nome} criado com sucesso!")
+            elif "já cadastrado" in resultado.get('message', ''):
+                print_info(f"Usuário {nome} já existe.")
+            else:
+                print_error(f"Erro ao criar {nome}: {resultado.get('message')}")
+        return True
+    except Exception as e:
+        print_error(f"Erro de conexão no cadastro em lote: {str(e)}")
+        return False
+
 def main():
     print_header("INICIALIZAÇÃO DO SISTEMA (SEED)")
     
@@ -75,43 +99,32 @@ def main():
     # 2. Criar Usuários Iniciais
     print(f"\n{Colors.BOLD}Populando Banco de Dados...{Colors.END}")
     
-    # Admin
-    criar_usuario_se_nao_existir(
-        "Administrador do Sistema", 
-        "000.000.000-00", 
-        "admin@email.com", 
-        "admin123", 
-        "ADMIN"
-    )
-    
-    # Médico Exemplo
-    criar_usuario_se_nao_existir(
-        "Dr. House", 
-        "111.111.111-11", 
-        "house@email.com", 
-        "senha123", 
-        "DOCTOR",
-        "85999991111"
-    )
-    
-    # Paciente Exemplo
-    criar_usuario_se_nao_existir(
-        "Paciente Teste", 
-        "222.222.222-22", 
-        "paciente@email.com", 
-        "senha123", 
-        "PATIENT",
-        "85988882222"
-    )
+    usuarios = [
+        # Admin
+        {"name": "Administrador do Sistema", "cpf": "000.000.000-00",
+         "email": "admin@email.com", "password": "admin123", "role": "ADMIN"},
+        # Médico Exemplo
+        {"name": "Dr. House", "cpf": "111.111.111-11", "email": "house@email.com",
+         "password": "senha123", "role": "DOCTOR", "phone": "85999991111"},
+        # Paciente Exemplo
+        {"name": "Paciente Teste", "cpf": "222.222.222-22", "email": "paciente@email.com",
+         "password": "senha123", "role": "PATIENT", "phone": "85988882222"},
+        # Recepcionista Exemplo
+        {"name": "Ana Recepcionista", "cpf": "333.333.333-33", "email": "ana@email.com",
+         "password": "senha123", "role": "RECEPTIONIST"},
+    ]
     
-    # Recepcionista Exemplo
-    criar_usuario_se_nao_existir(
-        "Ana Recepcionista", 
-        "333.333.333-33", 
-        "ana@email.com", 
-        "senha123", 
-        "RECEPTIONIST"
-    )
+    # Cadastro em lote; sem a rota /users/bulk, cria um a um
+    if not criar_usuarios_em_lote(usuarios):
+        for usuario in usuarios:
+            criar_usuario_se_nao_existir(
+                usuario["name"],
+                usuario["cpf"],
+                usuario["email"],
+                usuario["password"],
+                usuario["role"],
+                usuario.get("phone")
+            )
     
     print_success("\nInicialização concluída! O sistema está pronto para uso.")
 
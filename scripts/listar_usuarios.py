@@ -116,8 +116,12 @@ def autenticar_usuario(email: Optional[str] = None, senha: Optional[str] = None)
         print_error(f"Erro na autenticação: {str(e)}")
         return None
 
-def listar_usuarios(token: Optional[str] = None) -> List[Dict]:
-    """Busca todos os usuários da API"""
+def listar_usuarios(token: Optional[str] = None, cursor: Optional[str] = None,
+                    limite: Optional[int] = None) -> List[Dict]:
+    """
+    Busca os usuários da API.
+    Sem cursor, percorre todas as páginas; com cursor, busca apenas a página indicada.
+    """
     try:
         print_info("Buscando usuários...")
         
@@ -125,29 +129,53 @@ def listar_usuarios(token: Optional[str] = None) -> List[Dict]:
         if token:
             headers["Authorization"] = f"Bearer {token}"
         
-        response = requests.get(API_URL, headers=headers, timeout=10)
+        usuarios = []
+        pagina_unica = cursor is not None
+        params = {}
+        if limite:
+            params["limit"] = limite
         
-        if response.status_code == 200:
-            data = response.json()
+        while True:
+            if cursor:
+                params["cursor"] = cursor
+            # O total só é necessário na primeira página
+            if usuarios:
+                params["total"] = 0
             
-            # Verificar se é uma lista ou um objeto com lista
-            if isinstance(data, dict):
-                usuarios = data.get('users', data.get('data', []))
-            else:
-                usuarios = data
+            response = requests.get(API_URL, headers=headers, params=params, timeout=10)
             
-            return usuarios if isinstance(usuarios, list) else []
-        elif response.status_code == 401:
-            print_error("Erro de autenticação (401)!")
-            print_info("Você precisa estar autenticado para listar usuários.")
-            return []
-        else:
-            print_error(f"Erro ao buscar usuários! Status: {response.status_code}")
-            try:
-                print(f"Resposta: {response.json()}")
-            except:
-                print(f"Resposta: {response.text}")
-            return []
+            if response.status_code == 200:
+                data = response.json()
+                
+                # Verificar se é uma lista ou um objeto com lista
+                if isinstance(data, dict):
+                    pagina = data.get('users', data.get('data', []))
+                    cursor = data.get('next_cursor')
+                else:
+                    pagina = data
+                    cursor = None
+                
+                usuarios.extend(pagina if isinstance(pagina, list) else [])
+                
+                if pagina_unica:
+                    if cursor:
+                        print_info(f"Próxima página: --cursor {cursor}")
+                    break
+                if not cursor:
+                    break
+            elif response.status_code == 401:
+                print_error("Erro de autenticação (401)!")
+                print_info("Você precisa estar autenticado para listar usuários.")
+                return []
+            else:
+                print_error(f"Erro ao buscar usuários! Status: {response.status_code}")
+                try:
+                    print(f"Resposta: {response.json()}")
+                except:
+                    print(f"Resposta: {response.text}")
+                return []
+        
+        return usuarios
             
     except requests.exceptions.ConnectionError:
         print_error("Não foi possível conectar à API!")
@@ -255,6 +283,8 @@ def main():
         filtro_tipo = None
         email = None
         senha = None
+        cursor = None
+        limite = None
         
         i = 1
         while i < len(sys.argv):
@@ -277,11 +307,14 @@ def main():
                 print("  ADMIN                        Filtra apenas administradores")
                 print("  --email <email>              Email para autenticação")
                 print("  --senha <senha>              Senha para autenticação")
+                print("  --cursor <cursor>            Busca apenas a página indicada pelo cursor")
+                print("  --limite <n>                 Usuários por página")
                 print(f"\n{Colors.YELLOW}Exemplos:{Colors.END}")
                 print("  python listar_usuarios.py")
                 print("  python listar_usuarios.py -d")
                 print("  python listar_usuarios.py DOCTOR")
                 print('  python listar_usuarios.py --email "admin@email.com" --senha "senha123"')
+                print("  python listar_usuarios.py --limite 50 --cursor eyJhZnRlciI6IDUwfQ==")
                 print()
                 return
             elif arg in ['--EMAIL', '-E'] and i + 1 < len(sys.argv):
@@ -290,6 +323,12 @@ def main():
             elif arg in ['--SENHA', '-S', '--PASSWORD', '-P'] and i + 1 < len(sys.argv):
                 senha = sys.argv[i + 1]
                 i += 2
+            elif arg in ['--CURSOR', '-C'] and i + 1 < len(sys.argv):
+                cursor = sys.argv[i + 1]
+                i += 2
+            elif arg in ['--LIMITE', '-L', '--LIMIT'] and i + 1 < len(sys.argv):
+                limite = int(sys.argv[i + 1])
+                i += 2
             else:
                 i += 1
         
@@ -300,7 +339,7 @@ def main():
             sys.exit(1)
         
         # Buscar usuários
-        usuarios = listar_usuarios(token)
+        usuarios = listar_usuarios(token, cursor, limite)
         
         if not usuarios:
             sys.exit(1)
@@ -0,0 +1,204 @@
+"""
+Servidor asyncio para o Serviço de Usuários
+Alternativa ao modelo de uma thread por conexão: o accept/leitura/escrita
+roda em um event loop e o trabalho bloqueante (MySQL, bcrypt) é enviado
+para um executor de tamanho fixo.
+"""
+import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import protocol
+from worker_pool import overloaded_response, WORKER_QUEUE_SIZE, QUEUE_DEADLINE
+
+# Número de threads que executam UserService.handle_request
+ASYNC_WORKERS = int(os.getenv('ASYNC_WORKERS', 32))
+# Número máximo de requisições em processamento simultâneo
+ASYNC_MAX_CONCURRENCY = int(os.getenv('ASYNC_MAX_CONCURRENCY', 64))
+
+class AsyncUserServer:
+    """Servidor socket baseado em asyncio"""
+
+    def __init__(self, service, host, port, workers=ASYNC_WORKERS,
+                 max_concurrency=ASYNC_MAX_CONCURRENCY, queue_size=WORKER_QUEUE_SIZE,
+                 queue_deadline=QUEUE_DEADLINE):
+        self.service = service
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='user-worker')
+        self.max_concurrency = max_concurrency
+        self.queue_size = queue_size
+        self.queue_deadline = queue_deadline
+        self.semaphore = None
+        self.connections = 0
+        self.in_flight = 0
+        self.waiting = 0
+        self.completed = 0
+        self.shed_queue_full = 0
+        self.shed_deadline = 0
+
+    async def acquire(self):
+        """Aguarda uma vaga de execução respeitando a fila e o prazo de espera"""
+        if self.waiting >= self.queue_size:
+            self.shed_queue_full += 1
+            return False
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), self.queue_deadline)
+            return True
+        except asyncio.TimeoutError:
+            self.shed_deadline += 1
+            return False
+        finally:
+            self.waiting -= 1
+
+    async def dispatch(self, request_data, writer, framed, encoding=protocol.ENCODING_JSON):
+        """
+        Executa a requisição no executor respeitando o limite de concorrência
+        e envia a resposta (a vaga fica ocupada até o fim de um streaming).
+        """
+        if not await self.acquire():
+            await self.send(writer, overloaded_response(), framed, encoding)
+            return
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            try:
+                response = await loop.run_in_executor(
+                    self.executor, self.service.handle_request, request_data
+                )
+            except Exception as e:
+                response = {'success': False, 'message': str(e)}
+            await self.send(writer, response, framed, encoding)
+        finally:
+            self.in_flight -= 1
+            self.completed += 1
+            self.semaphore.release()
+
+    async def send(self, writer, response, framed, encoding):
+        """Envia a resposta no modo da conexão"""
+        if isinstance(response, protocol.StreamResponse):
+            if framed:
+                await self.send_stream(writer, response, encoding)
+                return
+            response.close()
+            response = protocol.STREAM_UNSUPPORTED
+        if framed:
+            writer.write(protocol.encode_frame(response, encoding))
+        else:
+            writer.write(protocol.encode_payload(response))
+        await writer.drain()
+
+    async def send_stream(self, writer, stream, encoding):
+        """
+        Envia uma StreamResponse. Cada bloco é produzido no executor (leitura
+        do banco) e o próximo só é pedido após o drain do anterior.
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                chunk = await loop.run_in_executor(self.executor, next, stream.chunks, None)
+                if chunk is None:
+                    break
+                writer.write(protocol.encode_raw_frame(
+                    chunk, protocol.ENCODING_NDJSON, protocol.FLAG_STREAM
+                ))
+                await writer.drain()
+        finally:
+            await loop.run_in_executor(self.executor, stream.close)
+        writer.write(protocol.encode_frame(stream.summary, encoding))
+        await writer.drain()
+
+    async def serve_framed(self, reader, writer, prefix):
+        """Atende várias requisições na mesma conexão"""
+        while True:
+            frame = await asyncio.wait_for(
+                protocol.read_frame_async(reader, prefix), protocol.CONNECTION_IDLE_TIMEOUT
+            )
+            prefix = b''
+            if frame is None:
+                return
+            request_data, encoding, _ = frame
+            await self.dispatch(request_data, writer, True, encoding)
+
+    async def serve_legacy(self, reader, writer, prefix):
+        """Atende uma única requisição no modo legado"""
+        request_data = await asyncio.wait_for(
+            protocol.read_legacy_async(reader, prefix), protocol.CONNECTION_IDLE_TIMEOUT
+        )
+        if request_data is None:
+            return
+        await self.dispatch(request_data, writer, False)
+
+    async def handle_connection(self, reader, writer):
+        """Gerencia conexão com um cliente"""
+        address = writer.get_extra_info('peername')
+        self.connections += 1
+        framed = False
+        try:
+            try:
+                prefix = await asyncio.wait_for(
+                    reader.readexactly(len(protocol.MAGIC)), protocol.CONNECTION_IDLE_TIMEOUT
+                )
+            except asyncio.IncompleteReadError:
+                return
+
+            if prefix == protocol.MAGIC:
+                framed = True
+                await self.serve_framed(reader, writer, prefix)
+            else:
+                await self.serve_legacy(reader, writer, prefix)
+        except asyncio.TimeoutError:
+            print(f"Conexão ociosa encerrada: {address}")
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            print(f"Erro ao processar requisição de {address}: {e}")
+            error_response = {'success': False, 'message': str(e)}
+            try:
+                if framed:
+                    writer.write(protocol.encode_frame(error_response))
+                else:
+                    writer.write(protocol.encode_payload(error_response))
+                await writer.drain()
+            except ConnectionError:
+                pass
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    def stats(self):
+        """Retorna contadores do servidor"""
+        return {
+            'engine': 'asyncio',
+            'connections': self.connections,
+            'in_flight': self.in_flight,
+            'max_concurrency': self.max_concurrency,
+            'workers': self.workers,
+            'queue_size': self.queue_size,
+            'queue_depth': self.waiting,
+            'queue_deadline': self.queue_deadline,
+            'completed': self.completed,
+            'shed_queue_full': self.shed_queue_full,
+            'shed_deadline': self.shed_deadline,
+            'shed_total': self.shed_queue_full + self.shed_deadline
+        }
+
+    async def serve_forever(self):
+        """Abre o socket e atende conexões até ser cancelado"""
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        server = await asyncio.start_server(
+            self.handle_connection, self.host, self.port, reuse_address=True
+        )
+        print(f"Servidor asyncio rodando em {self.host}:{self.port} "
+              f"(workers={self.workers}, concorrência={self.max_concurrency})")
+        print("Aguardando conexões...")
+        async with server:
+            await server.serve_forever()
+
+    def run(self):
+        """Executa o servidor no event loop principal"""
+        try:
+            asyncio.run(self.serve_forever())
+        finally:
+            self.executor.shutdown(wait=False)
@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+"""
+Gerador de carga e benchmark de latência do Serviço de Usuários
+Fala o protocolo socket diretamente (protocol.py), sem a interface REST.
+Cada cliente virtual é uma thread com conexão persistente própria.
+
+Uso:
+    python benchmark.py --scenarios auth_storm,hot_get_user --concurrency 16 --duration 20
+    python benchmark.py --scenarios list_users --table-sizes 100,1000,5000
+    python benchmark.py --scenarios mixed --rate 500 --json resultado.json
+    python benchmark.py --scenarios list_users --encoding msgpack
+
+Cenários: auth_storm, hot_get_user, verify_token, list_users, mixed.
+Com --rate a carga é em malha aberta: a latência é medida a partir do
+instante agendado, então filas no serviço aparecem nos percentis.
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import sys
+import threading
+import time
+from collections import Counter
+import protocol
+
+HOST = os.getenv('USER_SERVICE_HOST', 'localhost')
+PORT = int(os.getenv('USER_SERVICE_PORT', 5001))
+
+SCENARIOS = ('auth_storm', 'hot_get_user', 'verify_token', 'list_users', 'mixed')
+# Usuários criados para o benchmark (emails bench<N>@bench.local)
+BENCH_PASSWORD = 'bench123'
+BENCH_DOMAIN = 'bench.local'
+# Pesos padrão do cenário mixed (ação=peso)
+DEFAULT_MIX = 'get_user=60,list_users=15,authenticate=10,verify_token=10,update_user=5'
+
+class ServiceClient:
+    """Conexão persistente com o serviço no protocolo com framing"""
+
+    def __init__(self, host, port, timeout, encoding='json'):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.encoding = encoding
+        self.negotiated = protocol.ENCODING_JSON
+        self.sock = None
+
+    def call(self, action, data=None):
+        if self.sock is None:
+            self.sock = socket.create_connection((self.host, self.port), self.timeout)
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            if self.encoding != 'json':
+                self.negotiated = protocol.handshake(self.sock, self.encoding)
+        try:
+            protocol.write_frame(self.sock, {'action': action, 'data': data or {}}, self.negotiated)
+            frame = protocol.read_frame(self.sock)
+            if frame is None:
+                raise ConnectionError('conexão encerrada pelo serviço')
+            return frame[0]
+        except Exception:
+            self.close()
+            raise
+
+    def close(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
+
+def bench_user(index):
+    return {
+        'name': f'Bench {index}',
+        'cpf': f'{index:011d}'[-11:],
+        'email': f'bench{index}@{BENCH_DOMAIN}',
+        'password': BENCH_PASSWORD,
+        'role': 'PATIENT'
+    }
+
+def table_size(client):
+    response = client.call('list_users', {'limit': 1, 'include_total': True})
+    return response.get('total', 0)
+
+def seed_users(client, count):
+    """Garante pelo menos `count` usuários bench (já existentes são ignorados)"""
+    created = 0
+    for start in range(0, count, 1000):
+        rows = [bench_user(i) for i in range(start, min(start + 1000, count))]
+        response = client.call('bulk_create_users', {'users': rows})
+        for attempt in range(5):
+            if not response.get('overloaded'):
+                break
+            time.sleep(2 ** attempt)
+            response = client.call('bulk_create_users', {'users': rows})
+        if not response.get('success'):
+            raise RuntimeError(f"Falha ao criar usuários: {response.get('message')}")
+        created += response.get('created', 0)
+    return created
+
+def bench_ids(client, count):
+    """Ids dos primeiros `count` usuários bench"""
+    ids = []
+    for index in range(count):
+        response = client.call('authenticate', {'email': f'bench{index}@{BENCH_DOMAIN}',
+                                                'password': BENCH_PASSWORD})
+        if response.get('success'):
+            ids.append(response['user']['id'])
+    return ids
+
+class Workload:
+    """Gera a próxima requisição (ação, dados) de um cenário"""
+
+    def __init__(self, scenario, context, mix=None):
+        self.scenario = scenario
+        self.context = context
+        self.mix = mix or {}
+
+    def next(self, rng):
+        scenario = self.scenario
+        if scenario == 'mixed':
+            actions, weights = zip(*self.mix.items())
+            scenario = rng.choices(actions, weights)[0]
+        ctx = self.context
+        if scenario in ('auth_storm', 'authenticate'):
+            index = rng.randrange(ctx['users'])
+            return 'authenticate', {'email': f'bench{index}@{BENCH_DOMAIN}', 'password': BENCH_PASSWORD}
+        if scenario == 'hot_get_user':
+            return 'get_user', {'user_id': rng.choice(ctx['hot_ids'])}
+        if scenario == 'get_user':
+            return 'get_user', {'user_id': rng.choice(ctx['ids'])}
+        if scenario == 'verify_token':
+            return 'verify_token', {'token': ctx['token']}
+        if scenario == 'list_users':
+            return 'list_users', {'limit': ctx['page_size'], 'include_total': True}
+        if scenario == 'update_user':
+            return 'update_user', {'user_id': rng.choice(ctx['ids']),
+                                   'phone': f'85{rng.randrange(10 ** 9):09d}'}
+        raise ValueError(f'Cenário desconhecido: {scenario}')
+
+class Recorder:
+    """Latências e erros de uma execução"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.by_action = {}
+        self.errors = Counter()
+
+    def record(self, action, latency, error=None):
+        with self.lock:
+            self.latencies.append(latency)
+            self.by_action.setdefault(action, []).append(latency)
+            if error:
+                self.errors[error] += 1
+
+def classify(response):
+    """Tipo de erro de uma resposta (None = sucesso)"""
+    if response.get('success'):
+        return None
+    if response.get('overloaded'):
+        return 'overloaded'
+    return f"failed: {str(response.get('message', ''))[:60]}"
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, int(round(fraction * len(values) + 0.5)) - 1))
+    return values[index]
+
+def summarize(latencies):
+    values = sorted(latencies)
+    return {
+        'p50_ms': round(percentile(values, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(values, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(values, 0.99) * 1000, 3),
+        'max_ms': round(values[-1] * 1000, 3) if values else 0.0,
+        'mean_ms': round(sum(values) / len(values) * 1000, 3) if values else 0.0
+    }
+
+def run_load(args, workload):
+    """Executa a carga com `args.concurrency` clientes; retorna o resultado"""
+    recorder = Recorder()
+    stop = threading.Event()
+    warmup_end = time.perf_counter() + args.warmup
+    deadline = warmup_end + args.duration
+    remaining = [args.requests] if args.requests else None
+    remaining_lock = threading.Lock()
+    # Malha aberta: cada cliente recebe uma fração da taxa total
+    interval = args.concurrency / args.rate if args.rate else 0.0
+
+    def take():
+        if remaining is None:
+            return True
+        with remaining_lock:
+            if remaining[0] <= 0:
+                return False
+            remaining[0] -= 1
+            return True
+
+    def worker(index):
+        rng = random.Random(args.seed + index)
+        client = ServiceClient(args.host, args.port, args.timeout, args.encoding)
+        scheduled = time.perf_counter() + rng.random() * interval
+        try:
+            while not stop.is_set():
+                now = time.perf_counter()
+                if now >= deadline:
+                    break
+                if interval:
+                    if scheduled > now:
+                        time.sleep(scheduled - now)
+                    start = scheduled
+                    scheduled += interval
+                else:
+                    start = now
+                measured = start >= warmup_end
+                if measured and not take():
+                    break
+                action, data = workload.next(rng)
+                try:
+                    error = classify(client.call(action, data))
+                except socket.timeout:
+                    error = 'timeout'
+                except Exception as e:
+                    error = type(e).__name__
+                if measured:
+                    recorder.record(action, time.perf_counter() - start, error)
+        finally:
+            client.close()
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(args.concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    try:
+        for thread in threads:
+            thread.join()
+    except KeyboardInterrupt:
+        stop.set()
+        for thread in threads:
+            thread.join()
+    elapsed = max(1e-9, time.perf_counter() - max(started, warmup_end))
+
+    total = len(recorder.latencies)
+    errors = sum(recorder.errors.values())
+    result = {
+        'requests': total,
+        'errors': errors,
+        'error_rate': round(errors / total, 4) if total else 0.0,
+        'throughput_rps': round(total / elapsed, 1),
+        'elapsed_s': round(elapsed, 3),
+        **summarize(recorder.latencies),
+        'error_breakdown': dict(recorder.errors.most_common()),
+        'actions': {
+            action: dict(requests=len(values), **summarize(values))
+            for action, values in sorted(recorder.by_action.items())
+        }
+    }
+    return result
+
+def parse_mix(value):
+    mix = {}
+    for item in value.split(','):
+        action, _, weight = item.partition('=')
+        mix[action.strip()] = float(weight or 1)
+    unknown = set(mix) - {'get_user', 'list_users', 'authenticate', 'verify_token', 'update_user'}
+    if unknown:
+        raise ValueError(f"Ações inválidas no mix: {', '.join(sorted(unknown))}")
+    return mix
+
+def print_table(results):
+    header = f"{'cenário':<22}{'req':>8}{'req/s':>10}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}{'erros':>8}"
+    print()
+    print(header)
+    print('-' * len(header))
+    for name, result in results.items():
+        print(f"{name:<22}{result['requests']:>8}{result['throughput_rps']:>10.1f}"
+              f"{result['p50_ms']:>9.2f}{result['p95_ms']:>9.2f}{result['p99_ms']:>9.2f}"
+              f"{result['max_ms']:>9.2f}{result['errors']:>8}")
+    print('(latências em ms)')
+    for name, result in results.items():
+        for error, count in result['error_breakdown'].items():
+            print(f"  ⚠️  {name}: {count}x {error}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark do Serviço de Usuários via socket')
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                        help=f"lista separada por vírgula: {', '.join(SCENARIOS)}")
+    parser.add_argument('--concurrency', type=int, default=8, help='clientes simultâneos')
+    parser.add_argument('--rate', type=float, default=0,
+                        help='requisições/s no total (0 = o mais rápido possível)')
+    parser.add_argument('--duration', type=float, default=10, help='segundos medidos por cenário')
+    parser.add_argument('--requests', type=int, default=0, help='limite de requisições por cenário')
+    parser.add_argument('--warmup', type=float, default=2, help='segundos de aquecimento (não medidos)')
+    parser.add_argument('--timeout', type=float, default=10, help='timeout (s) por requisição')
+    parser.add_argument('--users', type=int, default=200, help='usuários bench para authenticate/get_user')
+    parser.add_argument('--hot-keys', type=int, default=1, help='ids usados em hot_get_user')
+    parser.add_argument('--table-sizes', default='100,1000',
+                        help='tamanhos mínimos da tabela para list_users')
+    parser.add_argument('--page-size', type=int, default=100, help='limit de list_users')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='pesos do cenário mixed (ação=peso,...)')
+    parser.add_argument('--encoding', choices=sorted(protocol.ENCODING_NAMES), default='json',
+                        help='codificação dos payloads, combinada no handshake')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help="grava o resultado em JSON ('-' para a saída padrão)")
+    args = parser.parse_args()
+
+    scenarios = [s.strip() for s in args.scenarios.split(',') if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"cenários inválidos: {', '.join(sorted(unknown))}")
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+    table_sizes = sorted(int(size) for size in args.table_sizes.split(',') if size.strip())
+
+    log = sys.stderr if args.json == '-' else sys.stdout
+    setup = ServiceClient(args.host, args.port, max(args.timeout, 300), args.encoding)
+    print(f"🔧 Preparando {args.users} usuários bench em {args.host}:{args.port}...", file=log)
+    created = seed_users(setup, args.users)
+    encoding = next(name for name, code in protocol.ENCODING_NAMES.items() if code == setup.negotiated)
+    if encoding != args.encoding:
+        print(f"⚠️  Codificação {args.encoding} não suportada pelas duas pontas; usando {encoding}", file=log)
+    ids = bench_ids(setup, min(args.users, 50))
+    if not ids:
+        print("❌ Não foi possível autenticar os usuários bench", file=sys.stderr)
+        sys.exit(1)
+    token = setup.call('authenticate', {'email': f'bench0@{BENCH_DOMAIN}',
+                                        'password': BENCH_PASSWORD})['token']
+    context = {
+        'users': args.users,
+        'ids': ids,
+        'hot_ids': ids[:max(1, args.hot_keys)],
+        'token': token,
+        'page_size': args.page_size
+    }
+    print(f"   {created} criado(s); tabela com {table_size(setup)} usuários", file=log)
+
+    results = {}
+    for scenario in scenarios:
+        if scenario == 'list_users':
+            for size in table_sizes:
+                if table_size(setup) < size:
+                    print(f"🔧 Aumentando a tabela para {size} usuários...", file=log)
+                    seed_users(setup, size)
+                name = f'list_users@{size}'
+                print(f"🚀 {name}", file=log)
+                results[name] = run_load(args, Workload('list_users', context))
+                results[name]['table_size'] = table_size(setup)
+            continue
+        print(f"🚀 {scenario}", file=log)
+        results[scenario] = run_load(args, Workload(scenario, context, mix))
+    setup.close()
+
+    report = {
+        'host': f'{args.host}:{args.port}',
+        'encoding': encoding,
+        'concurrency': args.concurrency,
+        'rate': args.rate or None,
+        'duration_s': args.duration,
+        'warmup_s': args.warmup,
+        'scenarios': results
+    }
+    if args.json == '-':
+        json.dump(report, sys.stdout, indent=2, ensure_ascii=False)
+        print()
+        return
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as output:
+            json.dump(report, output, indent=2, ensure_ascii=False)
+        print(f"💾 Resultado gravado em {args.json}")
+    print_table(results)
+
+if __name__ == '__main__':
+    main()
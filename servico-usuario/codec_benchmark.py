@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Comparação das codificações de payload do protocolo socket (JSON x MessagePack)
+Mede, sem rede nem banco, o tempo de serialização/desserialização e o tamanho
+de uma chamada típica de cada ação (requisição + resposta), usando as mesmas
+funções do protocolo (protocol.encode_payload/decode_payload).
+
+Uso:
+    python codec_benchmark.py
+    python codec_benchmark.py --page-sizes 100,1000,5000 --json codecs.json
+"""
+import argparse
+import json
+import sys
+import timeit
+from datetime import datetime, timedelta
+import protocol
+from models import User, UserRole
+
+def sample_user(index):
+    """Usuário como o serviço responde (User.to_dict)"""
+    created = datetime(2025, 1, 1) + timedelta(minutes=index)
+    doctor = index % 5 == 0
+    return User(
+        id=index,
+        name=f'Usuário de Teste {index}',
+        cpf=f'{index:011d}'[-11:],
+        email=f'usuario{index}@consultamedica.com',
+        role=UserRole.DOCTOR if doctor else UserRole.PATIENT,
+        phone=f'8599{index:07d}'[-11:],
+        crm=f'CRM-CE {index:06d}' if doctor else None,
+        specialty='Cardiologia' if doctor else None,
+        active=1,
+        created_at=created,
+        updated_at=created + timedelta(days=3)
+    ).to_dict()
+
+def sample_row(index):
+    """Linha de bulk_create_users como enviada pelo cliente (tipo pelo nome)"""
+    user = sample_user(index)
+    row = {field: user[field] for field in ('name', 'cpf', 'email', 'phone', 'crm', 'specialty')}
+    return dict(row, password='senha123', role=UserRole(user['role']).name)
+
+SAMPLE_TOKEN = 'eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9.' + 'x' * 120 + '.' + 'y' * 43
+
+def calls(page_sizes, bulk_size):
+    """(nome, requisição, resposta) das chamadas típicas de cada ação"""
+    user = sample_user(42)
+    result = [
+        ('authenticate',
+         {'action': 'authenticate', 'data': {'email': user['email'], 'password': 'senha123'}},
+         {'success': True, 'message': 'Autenticação realizada com sucesso',
+          'token': SAMPLE_TOKEN, 'user': user}),
+        ('get_user',
+         {'action': 'get_user', 'data': {'user_id': user['id']}},
+         {'success': True, 'user': user}),
+        ('verify_token',
+         {'action': 'verify_token', 'data': {'token': SAMPLE_TOKEN}},
+         {'success': True, 'payload': {'user_id': user['id'], 'role': user['role'],
+                                       'exp': 1767225600, 'iat': 1767139200}}),
+        ('update_user',
+         {'action': 'update_user', 'data': {'user_id': user['id'], 'phone': '85988887777'}},
+         {'success': True, 'message': 'Usuário atualizado com sucesso', 'user': user})
+    ]
+    for size in page_sizes:
+        users = [sample_user(i) for i in range(1, size + 1)]
+        result.append((
+            f'list_users@{size}',
+            {'action': 'list_users', 'data': {'limit': size, 'include_total': True}},
+            {'success': True, 'users': users, 'count': size, 'next_cursor': 'MTAwMA', 'total': size * 10}
+        ))
+    if bulk_size:
+        rows = [sample_row(i) for i in range(1, bulk_size + 1)]
+        results = [{'index': i, 'success': True, 'user_id': 1000 + i} for i in range(bulk_size)]
+        result.append((
+            f'bulk_create_users@{bulk_size}',
+            {'action': 'bulk_create_users', 'data': {'users': rows}},
+            {'success': True, 'created': bulk_size, 'failed': 0, 'results': results}
+        ))
+    return result
+
+def best_time(func, repeat):
+    """Menor tempo (s) por execução entre `repeat` medições de ~0,2 s"""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat, number)) / number
+
+def measure(request, response, encoding, repeat):
+    """Tamanho e tempos de uma chamada completa na codificação informada"""
+    encoded = [protocol.encode_payload(message, encoding) for message in (request, response)]
+    for message, payload in zip((request, response), encoded):
+        if protocol.decode_payload(payload, encoding) != message:
+            raise ValueError('A codificação alterou a mensagem')
+    encode = sum(best_time(lambda m=m: protocol.encode_payload(m, encoding), repeat)
+                 for m in (request, response))
+    decode = sum(best_time(lambda p=p: protocol.decode_payload(p, encoding), repeat)
+                 for p in encoded)
+    return {
+        'request_bytes': len(encoded[0]) + protocol.HEADER.size,
+        'response_bytes': len(encoded[1]) + protocol.HEADER.size,
+        'encode_us': round(encode * 1e6, 2),
+        'decode_us': round(decode * 1e6, 2)
+    }
+
+def print_table(results):
+    header = f"{'ação':<26}{'codif.':<9}{'bytes':>10}{'enc µs':>11}{'dec µs':>11}{'bytes':>8}{'cpu':>8}"
+    print()
+    print(header)
+    print('-' * len(header))
+    for name, encodings in results.items():
+        base = encodings['json']
+        base_bytes = base['request_bytes'] + base['response_bytes']
+        base_cpu = base['encode_us'] + base['decode_us']
+        for encoding, r in encodings.items():
+            total = r['request_bytes'] + r['response_bytes']
+            cpu = r['encode_us'] + r['decode_us']
+            print(f"{name:<26}{encoding:<9}{total:>10}{r['encode_us']:>11.1f}{r['decode_us']:>11.1f}"
+                  f"{total / base_bytes:>8.2f}{cpu / base_cpu:>8.2f}")
+    print('(requisição + resposta por chamada; colunas finais relativas ao JSON)')
+
+def main():
+    parser = argparse.ArgumentParser(description='Compara as codificações do protocolo socket')
+    parser.add_argument('--page-sizes', default='100,1000', help='tamanhos de página de list_users')
+    parser.add_argument('--bulk-size', type=int, default=500, help='usuários em bulk_create_users (0 = omitir)')
+    parser.add_argument('--repeat', type=int, default=5, help='medições por mensagem (vale a menor)')
+    parser.add_argument('--json', help="grava o resultado em JSON ('-' para a saída padrão)")
+    args = parser.parse_args()
+
+    encodings = [name for name in ('json', 'msgpack') if name in protocol.SUPPORTED_ENCODINGS]
+    log = sys.stderr if args.json == '-' else sys.stdout
+    if len(encodings) == 1:
+        print("⚠️  Pacote msgpack não instalado: medindo apenas JSON", file=log)
+    page_sizes = [int(size) for size in args.page_sizes.split(',') if size.strip()]
+
+    results = {}
+    for name, request, response in calls(page_sizes, args.bulk_size):
+        print(f"⏱️  {name}", file=log)
+        results[name] = {
+            encoding: measure(request, response, protocol.ENCODING_NAMES[encoding], args.repeat)
+            for encoding in encodings
+        }
+
+    if args.json == '-':
+        json.dump(results, sys.stdout, indent=2, ensure_ascii=False)
+        print()
+        return
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as output:
+            json.dump(results, output, indent=2, ensure_ascii=False)
+        print(f"💾 Resultado gravado em {args.json}")
+    print_table(results)
+
+if __name__ == '__main__':
+    main()
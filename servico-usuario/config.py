@@ -0,0 +1,9 @@
+"""
+Configurações compartilhadas do Serviço de Usuários
+Lidas do ambiente uma única vez; importar este módulo não cria engine,
+conexões nem threads.
+"""
+import os
+
+# Modo offline: SQLite no lugar do MySQL e broker em memória no lugar do RabbitMQ
+OFFLINE_MODE = os.getenv('OFFLINE_MODE', 'false').lower() in ('1', 'true', 'yes')
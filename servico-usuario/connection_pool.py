@@ -0,0 +1,217 @@
+"""
+Pool de conexões persistentes com o Serviço de Usuários
+Mantém conexões TCP aquecidas (protocolo com framing) para que cada
+chamada da interface REST não pague um novo handshake.
+"""
+import os
+import select
+import socket
+import threading
+import time
+import protocol
+
+# Número máximo de conexões abertas com o serviço
+POOL_MAX_SIZE = int(os.getenv('USER_SERVICE_POOL_SIZE', 16))
+# Tempo máximo (s) que uma conexão pode ficar ociosa no pool
+POOL_MAX_IDLE = float(os.getenv('USER_SERVICE_POOL_MAX_IDLE', 60))
+# Tempo máximo (s) aguardando uma conexão livre
+POOL_WAIT_TIMEOUT = float(os.getenv('USER_SERVICE_POOL_WAIT_TIMEOUT', 5))
+# Codificação preferida dos payloads: 'json' (padrão) ou 'msgpack', combinada
+# com o serviço no handshake de cada conexão nova
+POOL_ENCODING = os.getenv('USER_SERVICE_ENCODING', 'json')
+
+# Ações sem efeito no banco, reenviadas em outra conexão mesmo depois de enviadas
+READ_ONLY_ACTIONS = frozenset({
+    'get_user', 'list_users', 'authenticate', 'verify_token', 'stats', 'metrics', 'hello'
+})
+
+class PoolTimeout(Exception):
+    """Nenhuma conexão livre dentro do tempo limite"""
+
+class PooledConnection:
+    """Conexão com o serviço mantida pelo pool"""
+
+    def __init__(self, sock, encoding=protocol.ENCODING_JSON):
+        self.sock = sock
+        self.encoding = encoding
+        self.last_used = time.monotonic()
+        self.uses = 0
+
+    def is_healthy(self):
+        """Verifica se o serviço não encerrou a conexão enquanto estava ociosa"""
+        try:
+            readable, _, _ = select.select([self.sock], [], [], 0)
+        except (OSError, ValueError):
+            return False
+        # Ociosa e legível: o serviço fechou a conexão (ou enviou dados inesperados)
+        return not readable
+
+    def close(self):
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+class ConnectionPool:
+    """Pool thread-safe de conexões com o Serviço de Usuários"""
+
+    def __init__(self, host, port, max_size=POOL_MAX_SIZE, max_idle=POOL_MAX_IDLE,
+                 wait_timeout=POOL_WAIT_TIMEOUT, socket_timeout=10, encoding=POOL_ENCODING):
+        self.host = host
+        self.port = port
+        self.max_size = max_size
+        self.max_idle = max_idle
+        self.wait_timeout = wait_timeout
+        self.socket_timeout = socket_timeout
+        self.encoding = encoding
+        self.idle = []
+        self.size = 0
+        self.condition = threading.Condition()
+        # Métricas
+        self.created = 0
+        self.reused = 0
+        self.discarded = 0
+        self.timeouts = 0
+        self.waits = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.socket_timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if self.encoding == 'json':
+            return PooledConnection(sock)
+        try:
+            return PooledConnection(sock, protocol.handshake(sock, self.encoding))
+        except Exception:
+            sock.close()
+            raise
+
+    def acquire(self):
+        """Obtém uma conexão saudável do pool (ou abre uma nova)"""
+        start = time.monotonic()
+        deadline = start + self.wait_timeout
+        with self.condition:
+            while True:
+                while self.idle:
+                    conn = self.idle.pop()
+                    expired = time.monotonic() - conn.last_used > self.max_idle
+                    if not expired and conn.is_healthy():
+                        self.reused += 1
+                        self._record_wait(start)
+                        return conn
+                    self.size -= 1
+                    self.discarded += 1
+                    conn.close()
+                if self.size < self.max_size:
+                    self.size += 1
+                    self._record_wait(start)
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise PoolTimeout('Nenhuma conexão livre com o serviço')
+                self.condition.wait(remaining)
+        try:
+            conn = self._connect()
+        except Exception:
+            with self.condition:
+                self.size -= 1
+                self.condition.notify()
+            raise
+        with self.condition:
+            self.created += 1
+        return conn
+
+    def _record_wait(self, start):
+        waited = time.monotonic() - start
+        self.waits += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+
+    def release(self, conn, reusable=True):
+        """Devolve a conexão ao pool ou a descarta"""
+        with self.condition:
+            if reusable:
+                conn.last_used = time.monotonic()
+                self.idle.append(conn)
+            else:
+                self.size -= 1
+                self.discarded += 1
+                conn.close()
+            self.condition.notify()
+
+    def request(self, message, timeout=None, raw=False):
+        """
+        Envia uma mensagem e aguarda a resposta usando uma conexão do pool.
+        `timeout` substitui o tempo limite padrão do socket (ex.: ações em lote).
+        Com raw=True retorna (payload, codificação) sem desserializar.
+        """
+        for attempt in range(2):
+            conn = self.acquire()
+            conn.uses += 1
+            reusable = False
+            sent = False
+            try:
+                conn.sock.settimeout(timeout or self.socket_timeout)
+                protocol.write_frame(conn.sock, message, conn.encoding)
+                sent = True
+                frame = protocol.read_raw_frame(conn.sock)
+                if frame is None:
+                    raise ConnectionResetError('Conexão encerrada pelo serviço')
+                reusable = True
+                payload, encoding, _ = frame
+                if raw:
+                    return payload, encoding
+                return protocol.decode_payload(payload, encoding)
+            except (BrokenPipeError, ConnectionResetError):
+                # Uma conexão reaproveitada pode ter sido encerrada pelo serviço
+                # enquanto estava ociosa: tenta uma vez com outra conexão, mas
+                # só se o envio falhou ou a ação é de leitura (uma escrita já
+                # enviada pode ter sido aplicada pelo serviço)
+                retry = not sent or message.get('action') in READ_ONLY_ACTIONS
+                if conn.uses == 1 or attempt == 1 or not retry:
+                    raise
+            finally:
+                self.release(conn, reusable)
+
+    def stream(self, message):
+        """
+        Envia uma requisição de streaming e gera os frames da resposta como
+        (payload, codificação, flags), até o frame sem FLAG_STREAM.
+        A conexão só volta ao pool se a resposta for lida por completo.
+        """
+        conn = self.acquire()
+        conn.uses += 1
+        reusable = False
+        try:
+            conn.sock.settimeout(self.socket_timeout)
+            protocol.write_frame(conn.sock, message, conn.encoding)
+            while True:
+                frame = protocol.read_raw_frame(conn.sock)
+                if frame is None:
+                    raise ConnectionResetError('Conexão encerrada pelo serviço')
+                final = not frame[2] & protocol.FLAG_STREAM
+                reusable = final
+                yield frame
+                if final:
+                    return
+        finally:
+            self.release(conn, reusable)
+
+    def stats(self):
+        """Retorna ocupação do pool e tempos de espera"""
+        with self.condition:
+            return {
+                'max_size': self.max_size,
+                'encoding': self.encoding,
+                'size': self.size,
+                'idle': len(self.idle),
+                'in_use': self.size - len(self.idle),
+                'created': self.created,
+                'reused': self.reused,
+                'discarded': self.discarded,
+                'timeouts': self.timeouts,
+                'avg_wait': round(self.total_wait / self.waits, 6) if self.waits else 0.0,
+                'max_wait': round(self.max_wait, 6)
+            }
@@ -1,13 +1,28 @@
 """
 Configuração do banco de dados
+O pool de conexões é configurável pelo ambiente e instrumentado: tempo de
+espera no checkout, conexões em uso e eventos de overflow aparecem na ação
+'stats' (seção 'database').
+Com DB_REPLICA_URLS, leituras vão para réplicas cujo atraso medido está
+dentro do limite; chaves escritas recentemente continuam no primário.
+Com OFFLINE_MODE o banco padrão é um arquivo SQLite em WAL, sem MySQL.
 """
+import itertools
 import os
+import tempfile
+import threading
+import time
 import pymysql
 pymysql.install_as_MySQLdb()  # Permite que PyMySQL seja usado como MySQLdb
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, exc, select, update, insert
+from sqlalchemy.engine import Engine, make_url
 from sqlalchemy.orm import sessionmaker, scoped_session
-from models import Base
+from sqlalchemy.pool import QueuePool, StaticPool
+from config import OFFLINE_MODE
+from models import Base, ReplicaHeartbeat
+from migrations import migrate
+from tracing import tracer
 
 # Configuração do banco de dados
 DB_HOST = os.getenv('DB_HOST', 'db')
@@ -16,17 +31,477 @@ DB_NAME = os.getenv('DB_NAME', 'consultamedica')
 DB_USER = os.getenv('DB_USER', 'user')
 DB_PASSWORD = os.getenv('DB_PASSWORD', 'userpassword')
 
-DATABASE_URL = os.getenv('DATABASE_URL', f'mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}')
+# Banco usado no modo offline (DATABASE_URL continua tendo precedência): arquivo
+# SQLite em WAL no diretório temporário; 'sqlite://' (memória, uma sessão por
+# vez) só quando pedido, ex.: nos testes
+OFFLINE_DATABASE_URL = os.getenv(
+    'OFFLINE_DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'servico-usuario.db')
+)
+
+DATABASE_URL = os.getenv('DATABASE_URL', OFFLINE_DATABASE_URL if OFFLINE_MODE else
+                         f'mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}')
+
+# Conexões mantidas abertas no pool (acompanha WORKER_POOL_SIZE)
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 32))
+# Conexões extras abertas sob pico, fechadas ao serem devolvidas
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 16))
+# Tempo máximo (s) aguardando uma conexão livre antes de falhar
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 10))
+# Idade máxima (s) de uma conexão; abaixo do wait_timeout do MySQL
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800))
+# Ping no checkout: 'always', 'idle' (padrão, só conexões ociosas) ou 'never'
+DB_PRE_PING = os.getenv('DB_PRE_PING', 'idle')
+# Ociosidade (s) a partir da qual a política 'idle' testa a conexão
+DB_PRE_PING_IDLE = float(os.getenv('DB_PRE_PING_IDLE', 30))
+# Tempo máximo (ms) de cada instrução; 0 desativa (MySQL: só SELECT)
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', 0))
+# SQLite em arquivo: espera (ms) por um lock de escrita antes de falhar
+DB_SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('DB_SQLITE_BUSY_TIMEOUT_MS', 5000))
+
+# URLs das réplicas de leitura, separadas por vírgula (vazio = só o primário)
+DB_REPLICA_URLS = [url.strip() for url in os.getenv('DB_REPLICA_URLS', '').split(',') if url.strip()]
+# Atraso máximo (s) de uma réplica para continuar recebendo leituras
+DB_REPLICA_MAX_LAG = float(os.getenv('DB_REPLICA_MAX_LAG', 2))
+# Intervalo (s) entre batimentos/medições de atraso das réplicas
+DB_REPLICA_CHECK_INTERVAL = float(os.getenv('DB_REPLICA_CHECK_INTERVAL', 1))
+# Janela (s) após uma escrita em que leituras da mesma chave vão ao primário;
+# cobre o atraso máximo aceito mais a granularidade da medição
+DB_READ_YOUR_WRITES_WINDOW = float(os.getenv(
+    'DB_READ_YOUR_WRITES_WINDOW', DB_REPLICA_MAX_LAG + DB_REPLICA_CHECK_INTERVAL
+))
+
+# Limites (ms) do histograma de espera no checkout
+WAIT_BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000)
+
+class PoolMetrics:
+    """Contadores do pool de conexões"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checkouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.wait_buckets = [0] * (len(WAIT_BUCKETS_MS) + 1)
+        self.timeouts = 0
+        self.overflow_events = 0
+        self.peak_checked_out = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.pre_pings = 0
+        self.pre_ping_failures = 0
+
+    def checkout(self, wait, checked_out, overflowed):
+        wait_ms = wait * 1000
+        bucket = next((i for i, limit in enumerate(WAIT_BUCKETS_MS) if wait_ms <= limit),
+                      len(WAIT_BUCKETS_MS))
+        with self.lock:
+            self.checkouts += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+            self.wait_buckets[bucket] += 1
+            self.peak_checked_out = max(self.peak_checked_out, checked_out)
+            if overflowed:
+                self.overflow_events += 1
+
+    def count(self, name):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def snapshot(self):
+        with self.lock:
+            buckets, total = {}, 0
+            for limit, hits in zip(list(WAIT_BUCKETS_MS) + ['+Inf'], self.wait_buckets):
+                total += hits
+                buckets[str(limit)] = total
+            return {
+                'checkouts': self.checkouts,
+                'wait_avg_ms': round(self.wait_total / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                'wait_max_ms': round(self.wait_max * 1000, 3),
+                'wait_total_s': round(self.wait_total, 6),
+                'wait_buckets_ms': buckets,
+                'timeouts': self.timeouts,
+                'overflow_events': self.overflow_events,
+                'peak_checked_out': self.peak_checked_out,
+                'connects': self.connects,
+                'invalidations': self.invalidations,
+                'pre_pings': self.pre_pings,
+                'pre_ping_failures': self.pre_ping_failures
+            }
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool que mede a espera por uma conexão livre"""
+
+    metrics = None
+
+    def _do_get(self):
+        before = self.overflow()
+        start = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except exc.TimeoutError:
+            self.metrics.count('timeouts')
+            raise
+        # Nova conexão além de pool_size: overflow
+        overflow = self.overflow()
+        self.metrics.checkout(time.perf_counter() - start, self.checkedout(),
+                              overflow > before and overflow > 0)
+        return conn
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+def statement_timeout_sql(dialect):
+    """Instrução que limita o tempo de cada consulta na sessão"""
+    if dialect == 'mysql':
+        # max_execution_time só se aplica a SELECT
+        return f'SET SESSION max_execution_time = {DB_STATEMENT_TIMEOUT_MS}'
+    if dialect == 'postgresql':
+        return f'SET statement_timeout = {DB_STATEMENT_TIMEOUT_MS}'
+    return None
+
+def instrument(engine, metrics):
+    """Registra os eventos do pool: conexões, invalidações, ping e timeout"""
+    timeout_sql = statement_timeout_sql(engine.dialect.name) if DB_STATEMENT_TIMEOUT_MS > 0 else None
+
+    @event.listens_for(engine, 'connect')
+    def on_connect(dbapi_conn, record):
+        metrics.count('connects')
+        if timeout_sql:
+            cursor = dbapi_conn.cursor()
+            cursor.execute(timeout_sql)
+            cursor.close()
+            dbapi_conn.commit()
+
+    @event.listens_for(engine, 'invalidate')
+    def on_invalidate(dbapi_conn, record, exception):
+        metrics.count('invalidations')
+
+    @event.listens_for(engine, 'checkin')
+    def on_checkin(dbapi_conn, record):
+        record.info['last_checkin'] = time.monotonic()
+
+    if DB_PRE_PING != 'idle':
+        return
+
+    @event.listens_for(engine, 'checkout')
+    def on_checkout(dbapi_conn, record, proxy):
+        # Só testa conexões paradas há mais de DB_PRE_PING_IDLE segundos
+        last = record.info.get('last_checkin')
+        if last is None or time.monotonic() - last < DB_PRE_PING_IDLE:
+            return
+        metrics.count('pre_pings')
+        try:
+            cursor = dbapi_conn.cursor()
+            cursor.execute('SELECT 1')
+            cursor.close()
+        except Exception:
+            metrics.count('pre_ping_failures')
+            # O pool descarta a conexão e tenta outra
+            raise exc.DisconnectionError()
+
+def trace_queries():
+    """Registra um span 'db.query' para cada instrução executada dentro de um trace"""
+
+    @event.listens_for(Engine, 'before_cursor_execute')
+    def start_query_span(conn, cursor, statement, parameters, context, executemany):
+        context.trace_span = tracer.child_span(
+            'db.query',
+            **{'db.system': conn.dialect.name,
+               'db.host': conn.engine.url.host or conn.engine.url.database,
+               'db.statement': statement[:500]}
+        )
+
+    @event.listens_for(Engine, 'after_cursor_execute')
+    def end_query_span(conn, cursor, statement, parameters, context, executemany):
+        span = getattr(context, 'trace_span', None)
+        if span is not None:
+            span.set('db.rows', cursor.rowcount)
+            span.end()
+
+    @event.listens_for(Engine, 'handle_error')
+    def fail_query_span(exception_context):
+        span = getattr(exception_context.execution_context, 'trace_span', None)
+        if span is not None:
+            span.end(error=exception_context.original_exception)
+
+if tracer.enabled:
+    trace_queries()
+
+class SerializedStaticPool(StaticPool):
+    """
+    StaticPool que entrega a conexão única a uma sessão por vez
+    O SQLite em memória só existe nessa conexão; sem a trava, sessões de
+    threads diferentes (workers, relay da outbox) intercalariam suas
+    transações nela. Quem não consegue a conexão em DB_POOL_TIMEOUT
+    recebe o mesmo TimeoutError do QueuePool.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.available = threading.Condition()
+        self.checked_out = False
+        self.metrics = PoolMetrics()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        with self.available:
+            if not self.available.wait_for(lambda: not self.checked_out, DB_POOL_TIMEOUT):
+                self.metrics.count('timeouts')
+                raise exc.TimeoutError(
+                    f'Conexão SQLite em memória ocupada há mais de {DB_POOL_TIMEOUT}s'
+                )
+            self.checked_out = True
+        self.metrics.checkout(time.perf_counter() - start, 1, False)
+        try:
+            return super()._do_get()
+        except Exception:
+            self._do_return_conn(None)
+            raise
+
+    def _do_return_conn(self, record):
+        # Pode ser devolvida por outra thread (streaming no executor assíncrono)
+        with self.available:
+            self.checked_out = False
+            self.available.notify()
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+def sqlite_profile(engine):
+    """
+    Ajusta cada conexão SQLite em arquivo para acesso concorrente: WAL
+    (leitores não bloqueiam o escritor), fsync reduzido e espera por locks
+    em vez de 'database is locked'.
+    """
+    @event.listens_for(engine, 'connect')
+    def configure(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute(f'PRAGMA busy_timeout={DB_SQLITE_BUSY_TIMEOUT_MS}')
+        cursor.close()
+
+def build_engine(url):
+    """Cria a engine com o pool configurado pelo ambiente"""
+    parsed = make_url(url)
+    sqlite = parsed.get_backend_name() == 'sqlite'
+    if sqlite and parsed.database in (None, '', ':memory:'):
+        # Banco em memória: uma única conexão, senão cada thread veria um
+        # banco vazio próprio; as sessões a usam uma de cada vez
+        engine = create_engine(url, echo=False, poolclass=SerializedStaticPool,
+                               connect_args={'check_same_thread': False})
+        return engine, engine.pool.metrics
+
+    metrics = PoolMetrics()
+    engine = create_engine(
+        url,
+        echo=False,
+        poolclass=InstrumentedQueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_PRE_PING == 'always',
+        connect_args={'check_same_thread': False} if sqlite else {}
+    )
+    engine.pool.metrics = metrics
+    instrument(engine, metrics)
+    if sqlite:
+        sqlite_profile(engine)
+    return engine, metrics
 
 # Criar engine
-engine = create_engine(DATABASE_URL, pool_pre_ping=True, echo=False)
+engine, pool_metrics = build_engine(DATABASE_URL)
 
 # Criar sessão
-SessionLocal = scoped_session(sessionmaker(autocommit=False, autoflush=False, bind=engine))
+SessionFactory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = scoped_session(SessionFactory)
+
+def pool_stats():
+    """Retorna configuração, ocupação e contadores do pool de conexões"""
+    stats = {
+        'backend': engine.dialect.name,
+        'pre_ping': DB_PRE_PING,
+        'statement_timeout_ms': DB_STATEMENT_TIMEOUT_MS
+    }
+    pool = engine.pool
+    if isinstance(pool, SerializedStaticPool):
+        return dict(stats, pool=type(pool).__name__, checked_out=int(pool.checked_out),
+                    **pool_metrics.snapshot())
+    return dict(
+        stats,
+        pool_size=pool.size(),
+        max_overflow=DB_MAX_OVERFLOW,
+        recycle=DB_POOL_RECYCLE,
+        checked_out=pool.checkedout(),
+        checked_in=pool.checkedin(),
+        overflow=max(0, pool.overflow()),
+        **pool_metrics.snapshot()
+    )
+
+class Replica:
+    """Réplica de leitura com engine, sessões e último atraso medido"""
+
+    def __init__(self, url):
+        self.url = url
+        self.engine, self.metrics = build_engine(url)
+        self.sessions = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+        self.lag = None  # None = desconhecido ou inacessível
+        self.reads = 0
+        self.errors = 0
+
+    def healthy(self):
+        return self.lag is not None and self.lag <= DB_REPLICA_MAX_LAG
+
+    def stats(self):
+        stats = {
+            'url': self.engine.url.render_as_string(hide_password=True),
+            'lag_s': round(self.lag, 3) if self.lag is not None else None,
+            'healthy': self.healthy(),
+            'reads': self.reads,
+            'errors': self.errors
+        }
+        if isinstance(self.engine.pool, QueuePool):
+            stats['checked_out'] = self.engine.pool.checkedout()
+            stats['checkouts'] = self.metrics.checkouts
+        return stats
+
+class ReplicaRouter:
+    """
+    Escolhe o banco de cada leitura.
+    Uma thread grava um batimento no primário e o lê em cada réplica; o
+    atraso é a idade do batimento visto na réplica. Leituras vão para as
+    réplicas saudáveis em rodízio; sem réplica saudável, ou logo após uma
+    escrita na mesma chave (read-your-writes), vão para o primário.
+    """
+
+    def __init__(self, urls=DB_REPLICA_URLS):
+        self.replicas = [Replica(url) for url in urls]
+        self.rotation = itertools.count()
+        self.lock = threading.Lock()
+        self.recent_writes = {}  # chave -> instante em que deixa de ser recente
+        self.thread = None
+        self.stopping = threading.Event()
+        # Métricas
+        self.primary_reads = 0
+        self.sticky_reads = 0
+        self.fallbacks = 0
+
+    def start(self):
+        """Inicia a medição de atraso (sem réplicas, não faz nada)"""
+        if not self.replicas or self.thread is not None:
+            return
+        self.thread = threading.Thread(target=self._run, name='replica-lag', daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while not self.stopping.is_set():
+            self.check_lag()
+            self.stopping.wait(DB_REPLICA_CHECK_INTERVAL)
+
+    def check_lag(self):
+        """Grava o batimento no primário e mede o atraso de cada réplica"""
+        now_ms = int(time.time() * 1000)
+        try:
+            with engine.begin() as conn:
+                updated = conn.execute(
+                    update(ReplicaHeartbeat).where(ReplicaHeartbeat.id == 1).values(beat_ms=now_ms)
+                ).rowcount
+                if not updated:
+                    conn.execute(insert(ReplicaHeartbeat).values(id=1, beat_ms=now_ms))
+        except Exception as e:
+            # Sem batimento novo o atraso medido cresce e as réplicas saem do rodízio
+            print(f"⚠️  Erro ao gravar batimento de réplica: {e}", flush=True)
+        for replica in self.replicas:
+            try:
+                with replica.engine.connect() as conn:
+                    beat_ms = conn.execute(
+                        select(ReplicaHeartbeat.beat_ms).where(ReplicaHeartbeat.id == 1)
+                    ).scalar()
+                replica.lag = max(0.0, time.time() - beat_ms / 1000) if beat_ms else None
+            except Exception as e:
+                if replica.lag is not None:
+                    print(f"⚠️  Réplica inacessível ({replica.stats()['url']}): {e}", flush=True)
+                replica.lag = None
+                replica.errors += 1
+
+    def mark_written(self, *keys):
+        """Mantém as leituras das chaves no primário durante a janela"""
+        if not self.replicas:
+            return
+        until = time.monotonic() + DB_READ_YOUR_WRITES_WINDOW
+        with self.lock:
+            for key in keys:
+                self.recent_writes[key] = until
+            if len(self.recent_writes) > 10000:
+                now = time.monotonic()
+                self.recent_writes = {k: t for k, t in self.recent_writes.items() if t > now}
+
+    def choose(self, keys):
+        """Retorna a réplica para a leitura ou None para o primário"""
+        if not self.replicas:
+            return None
+        if keys:
+            now = time.monotonic()
+            with self.lock:
+                sticky = any(self.recent_writes.get(key, 0) > now for key in keys)
+            if sticky:
+                self.sticky_reads += 1
+                return None
+        healthy = [replica for replica in self.replicas if replica.healthy()]
+        if not healthy:
+            self.fallbacks += 1
+            return None
+        replica = healthy[next(self.rotation) % len(healthy)]
+        replica.reads += 1
+        return replica
+
+    def read_session(self, *keys):
+        """Sessão para leitura das chaves (réplica ou a sessão do primário)"""
+        replica = self.choose(keys)
+        if replica is None:
+            self.primary_reads += 1
+            return get_db()
+        return replica.sessions()
+
+    def new_read_session(self):
+        """Sessão de leitura própria, fora do escopo da thread (ex.: streaming)"""
+        replica = self.choose(())
+        if replica is None:
+            self.primary_reads += 1
+            return new_session()
+        return replica.sessions()
+
+    def stats(self):
+        """Retorna atraso, saúde e leituras por réplica"""
+        with self.lock:
+            recent = len(self.recent_writes)
+        return {
+            'replicas': [replica.stats() for replica in self.replicas],
+            'healthy': sum(replica.healthy() for replica in self.replicas),
+            'max_lag_s': DB_REPLICA_MAX_LAG,
+            'read_your_writes_window_s': DB_READ_YOUR_WRITES_WINDOW,
+            'primary_reads': self.primary_reads,
+            'sticky_reads': self.sticky_reads,
+            'fallbacks': self.fallbacks,
+            'recent_writes': recent
+        }
+
+    def stop(self):
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join(DB_REPLICA_CHECK_INTERVAL + 1)
+        for replica in self.replicas:
+            replica.engine.dispose()
 
 def init_db():
-    """Inicializa o banco de dados criando todas as tabelas"""
+    """Inicializa o banco de dados criando as tabelas e aplicando as migrações"""
     Base.metadata.create_all(bind=engine)
+    migrate(engine)
     print("Banco de dados inicializado!")
 
 def get_db():
@@ -38,6 +513,13 @@ def get_db():
         db.close()
         raise e
 
+def new_session():
+    """Retorna uma sessão própria, fora do escopo da thread (ex.: streaming)"""
+    return SessionFactory()
+
 def close_db():
     """Fecha a sessão do banco de dados"""
-    SessionLocal.remove()
\ No newline at end of file
+    SessionLocal.remove()
+
+# Roteamento de leituras entre primário e réplicas
+replicas = ReplicaRouter()
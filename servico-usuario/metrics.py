@@ -0,0 +1,192 @@
+"""
+Registro de métricas no formato texto do Prometheus
+Usado pelo serviço (ação 'metrics') e pela interface REST (GET /metrics).
+Sem dependências externas: contadores, gauges e histogramas com rótulos.
+"""
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Limites (s) dos histogramas de latência
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def format_labels(names, values, extra=()):
+    pairs = [f'{name}="{escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric:
+    """Base das métricas: valores por combinação de rótulos"""
+
+    type = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def header(self):
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.type}']
+
+    def render(self):
+        with self.lock:
+            items = sorted(self.values.items())
+        return self.header() + [
+            f'{self.name}{format_labels(self.labels, key)} {format_value(value)}'
+            for key, value in items
+        ]
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, *labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def inc(self, *labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value, *labels):
+        with self.lock:
+            self.values[labels] = value
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        with self.lock:
+            entry = self.values.get(labels)
+            if entry is None:
+                # [contagem por faixa..., soma, total]
+                entry = self.values[labels] = [0] * len(self.buckets) + [0.0, 0]
+            for index, limit in enumerate(self.buckets):
+                if value <= limit:
+                    entry[index] += 1
+                    break
+            entry[-2] += value
+            entry[-1] += 1
+
+    def render(self):
+        with self.lock:
+            items = sorted((key, list(entry)) for key, entry in self.values.items())
+        lines = self.header()
+        for key, entry in items:
+            cumulative = 0
+            for limit, hits in zip(self.buckets, entry):
+                cumulative += hits
+                lines.append(f'{self.name}_bucket{format_labels(self.labels, key, [("le", format_value(float(limit)))])} {cumulative}')
+            lines.append(f'{self.name}_bucket{format_labels(self.labels, key, [("le", "+Inf")])} {entry[-1]}')
+            lines.append(f'{self.name}_sum{format_labels(self.labels, key)} {format_value(entry[-2])}')
+            lines.append(f'{self.name}_count{format_labels(self.labels, key)} {entry[-1]}')
+        return lines
+
+class MetricsRegistry:
+    """Conjunto de métricas renderizado em uma única página"""
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.register(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=()):
+        return self.register(Gauge(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+class RequestMetrics:
+    """
+    Contagem, erros, latência e requisições em andamento por rótulo
+    (ação no serviço, rota ou ação remota na interface REST).
+    """
+
+    def __init__(self, registry, prefix, labels, what):
+        self.requests = registry.counter(f'{prefix}_requests_total', f'{what} recebidas', labels)
+        self.errors = registry.counter(f'{prefix}_errors_total', f'{what} com erro, por tipo',
+                                       tuple(labels) + ('type',))
+        self.latency = registry.histogram(f'{prefix}_latency_seconds', f'Latência de {what.lower()}', labels)
+        self.in_flight = registry.gauge(f'{prefix}_in_flight', f'{what} em andamento', labels)
+
+    def start(self, *labels):
+        """Registra o início da requisição; retorna o instante para finish()"""
+        self.requests.inc(*labels)
+        self.in_flight.inc(*labels)
+        return time.perf_counter()
+
+    def finish(self, start, *labels):
+        self.latency.observe(time.perf_counter() - start, *labels)
+        self.in_flight.dec(*labels)
+
+    @contextmanager
+    def track(self, *labels):
+        """Mede o bloco; uma exceção conta como erro do tipo 'exception'"""
+        start = self.start(*labels)
+        try:
+            yield
+        except Exception:
+            self.errors.inc(*labels, 'exception')
+            raise
+        finally:
+            self.finish(start, *labels)
+
+    def error(self, error_type, *labels):
+        self.errors.inc(*labels, error_type)
+
+def response_error_type(response):
+    """Classifica uma resposta do serviço: None (sucesso), 'overloaded' ou 'failed'"""
+    if not isinstance(response, dict) or response.get('success', True):
+        return None
+    return 'overloaded' if response.get('overloaded') else 'failed'
+
+def render_stats(prefix, stats):
+    """Converte os valores numéricos da ação 'stats' em gauges"""
+    lines = []
+
+    def walk(name, value):
+        if isinstance(value, bool):
+            value = int(value)
+        if isinstance(value, (int, float)):
+            metric = re.sub(r'[^a-zA-Z0-9_]', '_', name).strip('_')
+            lines.append(f'# TYPE {prefix}_{metric} gauge')
+            lines.append(f'{prefix}_{metric} {format_value(value)}')
+        elif isinstance(value, dict):
+            for key, child in value.items():
+                walk(f'{name}_{key}', child)
+
+    for section, values in stats.items():
+        walk(section, values)
+    return '\n'.join(lines) + '\n' if lines else ''
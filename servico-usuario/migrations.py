@@ -0,0 +1,236 @@
+"""
+Migrações versionadas do banco do Serviço de Usuários
+Cada migração é aplicada uma única vez e registrada em schema_migrations.
+Índices são criados sem bloquear escritas quando o banco permite
+(MySQL: ALGORITHM=INPLACE, LOCK=NONE; PostgreSQL: CONCURRENTLY).
+
+Uso:
+    python migrations.py migrate   # aplica as migrações pendentes
+    python migrations.py status    # lista migrações aplicadas e pendentes
+    python migrations.py explain   # verifica os planos das consultas principais
+"""
+import re
+import sys
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, DateTime, MetaData, Table, inspect, text
+
+metadata = MetaData()
+
+schema_migrations = Table(
+    'schema_migrations', metadata,
+    Column('version', Integer, primary_key=True),
+    Column('name', String(100), nullable=False),
+    Column('applied_at', DateTime, nullable=False)
+)
+
+# Lock consultivo que impede duas réplicas de migrarem ao mesmo tempo (MySQL)
+MIGRATION_LOCK = 'usuarios_schema_migrations'
+
+def create_index(engine, name, table, columns):
+    """Cria o índice (se ainda não existir) sem bloquear escritas na tabela"""
+    existing = {index['name'] for index in inspect(engine).get_indexes(table)}
+    if name in existing:
+        print(f"   índice {name} já existe")
+        return
+    column_list = ', '.join(columns)
+    dialect = engine.dialect.name
+    if dialect == 'mysql':
+        statement = f'CREATE INDEX {name} ON {table} ({column_list}) ALGORITHM=INPLACE LOCK=NONE'
+        with engine.begin() as conn:
+            conn.execute(text(statement))
+    elif dialect == 'postgresql':
+        # CONCURRENTLY não pode rodar dentro de uma transação
+        statement = f'CREATE INDEX CONCURRENTLY {name} ON {table} ({column_list})'
+        with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            conn.execute(text(statement))
+    else:
+        with engine.begin() as conn:
+            conn.execute(text(f'CREATE INDEX {name} ON {table} ({column_list})'))
+    print(f"   índice {name} criado")
+
+def add_column(engine, table, column, definition):
+    """Adiciona a coluna (se ainda não existir) sem bloquear escritas na tabela"""
+    existing = {col['name'] for col in inspect(engine).get_columns(table)}
+    if column in existing:
+        print(f"   coluna {table}.{column} já existe")
+        return
+    statement = f'ALTER TABLE {table} ADD COLUMN {column} {definition}'
+    if engine.dialect.name == 'mysql':
+        statement += ', ALGORITHM=INPLACE, LOCK=NONE'
+    with engine.begin() as conn:
+        conn.execute(text(statement))
+    print(f"   coluna {table}.{column} criada")
+
+def migration_baseline(engine):
+    """Tabelas criadas por Base.metadata.create_all (app_users, outbox)"""
+
+def migration_list_indexes(engine):
+    # Filtros de list_users (role, active) com paginação por id
+    create_index(engine, 'ix_app_users_role_active_id', 'app_users', ['role', 'active', 'id'])
+    create_index(engine, 'ix_app_users_active_id', 'app_users', ['active', 'id'])
+
+def migration_sync_search_indexes(engine):
+    # Sincronização incremental (updated_at) e busca por nome
+    create_index(engine, 'ix_app_users_updated_at', 'app_users', ['updated_at'])
+    create_index(engine, 'ix_app_users_name', 'app_users', ['name'])
+
+def migration_outbox_traceparent(engine):
+    # Contexto de rastreamento repassado nos headers AMQP pelo relay
+    add_column(engine, 'outbox', 'traceparent', 'VARCHAR(55) NULL')
+
+def migration_outbox_claim(engine):
+    # Reserva de lotes pelo relay, que publica sem manter a transação aberta
+    add_column(engine, 'outbox', 'claimed_until', 'DATETIME NULL')
+
+# (versão, nome, função) em ordem de aplicação; nunca altere uma migração já publicada
+MIGRATIONS = [
+    (1, 'baseline', migration_baseline),
+    (2, 'list_users_indexes', migration_list_indexes),
+    (3, 'sync_search_indexes', migration_sync_search_indexes),
+    (4, 'outbox_traceparent', migration_outbox_traceparent),
+    (5, 'outbox_claim', migration_outbox_claim),
+]
+
+def applied_versions(engine):
+    """Retorna as versões já aplicadas"""
+    metadata.create_all(bind=engine, tables=[schema_migrations])
+    with engine.connect() as conn:
+        return {row.version for row in conn.execute(schema_migrations.select())}
+
+def migrate(engine):
+    """Aplica as migrações pendentes em ordem"""
+    if engine.dialect.name != 'mysql':
+        return apply_pending(engine)
+    # Conexão dedicada ao lock (no SQLite em memória há uma única conexão)
+    with engine.connect() as lock_conn:
+        acquired = lock_conn.execute(
+            text('SELECT GET_LOCK(:name, 60)'), {'name': MIGRATION_LOCK}
+        ).scalar()
+        if not acquired:
+            raise RuntimeError('Outra instância está aplicando as migrações')
+        try:
+            return apply_pending(engine)
+        finally:
+            lock_conn.execute(text('SELECT RELEASE_LOCK(:name)'), {'name': MIGRATION_LOCK})
+
+def apply_pending(engine):
+    """Aplica e registra as migrações ainda não aplicadas"""
+    done = applied_versions(engine)
+    pending = [m for m in MIGRATIONS if m[0] not in done]
+    for version, name, apply in pending:
+        print(f"🔧 Aplicando migração {version}: {name}")
+        apply(engine)
+        with engine.begin() as conn:
+            conn.execute(schema_migrations.insert().values(
+                version=version, name=name, applied_at=datetime.utcnow()
+            ))
+    if pending:
+        print(f"✅ {len(pending)} migração(ões) aplicada(s)")
+    return [m[0] for m in pending]
+
+def status(engine):
+    """Retorna [(versão, nome, aplicada)]"""
+    done = applied_versions(engine)
+    return [(version, name, version in done) for version, name, _ in MIGRATIONS]
+
+# Consultas principais do serviço, verificadas com EXPLAIN:
+# (nome, SQL, tabela, colunas iniciais do índice que o plano deve usar)
+HOT_QUERIES = [
+    ('list_users por role/active',
+     "SELECT id, name, email FROM app_users WHERE role = 'PATIENT' AND active = 1 "
+     "AND id > 0 ORDER BY id LIMIT 100",
+     'app_users', ('role', 'active', 'id')),
+    ('list_users por active',
+     "SELECT id, name, email FROM app_users WHERE active = 1 AND id > 0 ORDER BY id LIMIT 100",
+     'app_users', ('active', 'id')),
+    ('authenticate por email',
+     "SELECT id FROM app_users WHERE email = 'admin@email.com'",
+     'app_users', ('email',)),
+    ('duplicidade por cpf',
+     "SELECT id FROM app_users WHERE cpf = '000.000.000-00'",
+     'app_users', ('cpf',)),
+    ('sincronização por updated_at',
+     "SELECT id FROM app_users WHERE updated_at > '2024-01-01' ORDER BY updated_at LIMIT 100",
+     'app_users', ('updated_at',)),
+    ('busca por nome',
+     "SELECT id FROM app_users WHERE name LIKE 'Mar%' LIMIT 100",
+     'app_users', ('name',)),
+    ('outbox pendente',
+     "SELECT id FROM outbox WHERE published_at IS NULL ORDER BY id LIMIT 200",
+     'outbox', ('published_at',)),
+]
+
+def expected_indexes(engine, conn, table, columns):
+    """Nomes dos índices da tabela que começam pelas colunas informadas"""
+    # No SQLite os índices das colunas UNIQUE são automáticos (sqlite_autoindex_*)
+    options = {'include_auto_indexes': True} if engine.dialect.name == 'sqlite' else {}
+    return {
+        index['name'] for index in inspect(conn).get_indexes(table, **options)
+        if tuple(index['column_names'][:len(columns)]) == tuple(columns)
+    }
+
+def uses_index(engine, conn, sql, table, indexes):
+    """Indica se o plano da consulta usa um dos índices esperados na tabela"""
+    dialect = engine.dialect.name
+    if dialect == 'mysql':
+        rows = conn.execute(text(f'EXPLAIN {sql}')).mappings().all()
+        # 'ALL' é scan da tabela e 'index' percorre o índice inteiro; a chave
+        # escolhida precisa ser a esperada (PRIMARY sempre é possível com id > 0)
+        return all(
+            row['type'] not in ('ALL', 'index') and row['key'] in indexes
+            for row in rows if row['table'] == table
+        )
+    if dialect == 'postgresql':
+        # Sem seq scan o plano ainda pode cair na chave primária: o nome importa
+        conn.execute(text('SET LOCAL enable_seqscan = off'))
+        plan = '\n'.join(row[0] for row in conn.execute(text(f'EXPLAIN {sql}')))
+        used = set(re.findall(r'(?:Index Scan|Index Only Scan) using (\S+)', plan))
+        used |= set(re.findall(r'Bitmap Index Scan on (\S+)', plan))
+        return bool(used & indexes)
+    rows = conn.execute(text(f'EXPLAIN QUERY PLAN {sql}')).all()
+    used = {
+        match.group(1) for row in rows
+        for match in [re.search(r'USING (?:COVERING )?INDEX (\S+)', row[-1])] if match
+    }
+    return bool(used & indexes)
+
+def check_query_plans(engine):
+    """Executa EXPLAIN nas consultas principais; retorna as que não usam o índice esperado"""
+    failures = []
+    with engine.connect() as conn:
+        for name, sql, table, columns in HOT_QUERIES:
+            try:
+                with conn.begin():
+                    indexes = expected_indexes(engine, conn, table, columns)
+                    ok = bool(indexes) and uses_index(engine, conn, sql, table, indexes)
+            except Exception as e:
+                print(f"❌ {name}: {e}")
+                failures.append(name)
+                continue
+            expected = ', '.join(sorted(indexes)) or f"nenhum índice em ({', '.join(columns)})"
+            print(f"{'✅' if ok else '❌'} {name} ({expected})")
+            if not ok:
+                failures.append(name)
+    return failures
+
+def main():
+    from database import engine, init_db
+
+    command = sys.argv[1] if len(sys.argv) > 1 else 'migrate'
+    if command == 'migrate':
+        init_db()
+    elif command == 'status':
+        for version, name, applied in status(engine):
+            print(f"{version:>4}  {'aplicada' if applied else 'pendente':<9} {name}")
+    elif command == 'explain':
+        failures = check_query_plans(engine)
+        if failures:
+            print(f"❌ {len(failures)} consulta(s) sem índice: {', '.join(failures)}")
+            sys.exit(1)
+        print("✅ Todas as consultas principais usam índice")
+    else:
+        print(__doc__)
+        sys.exit(2)
+
+if __name__ == '__main__':
+    main()
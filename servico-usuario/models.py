@@ -2,7 +2,7 @@
 Modelos de dados para o Serviço de Usuários
 """
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, DateTime, Enum
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, Enum, Text, Index
 from sqlalchemy.ext.declarative import declarative_base
 import enum
 
@@ -18,6 +18,13 @@ class UserRole(enum.Enum):
 class User(Base):
     """Modelo de Usuário"""
     __tablename__ = 'app_users'
+    # Índices das consultas principais (em bancos existentes, criados por migrations.py)
+    __table_args__ = (
+        Index('ix_app_users_role_active_id', 'role', 'active', 'id'),
+        Index('ix_app_users_active_id', 'active', 'id'),
+        Index('ix_app_users_updated_at', 'updated_at'),
+        Index('ix_app_users_name', 'name'),
+    )
     
     id = Column(Integer, primary_key=True, autoincrement=True)
     name = Column(String(100), nullable=False)
@@ -34,6 +41,23 @@ class User(Base):
     crm = Column(String(20))
     specialty = Column(String(100))
     
+    # Campos expostos nas respostas (nunca inclui password_hash)
+    PUBLIC_FIELDS = (
+        'id', 'name', 'cpf', 'email', 'role', 'phone', 'crm', 'specialty',
+        'active', 'created_at', 'updated_at'
+    )
+    
+    @staticmethod
+    def format_field(name, value):
+        """Formata o valor de uma coluna como em to_dict"""
+        if name == 'role':
+            return value.value if isinstance(value, UserRole) else value
+        if name == 'active':
+            return bool(value)
+        if name in ('created_at', 'updated_at'):
+            return value.isoformat() if value else None
+        return value
+    
     def to_dict(self):
         """Converte o objeto para dicionário"""
         return {
@@ -48,4 +72,24 @@ class User(Base):
             'active': bool(self.active),
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
-        }
\ No newline at end of file
+        }
+
+class OutboxMessage(Base):
+    """Notificação gravada na mesma transação da alteração do usuário"""
+    __tablename__ = 'outbox'
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    key = Column(String(100), nullable=False)  # destinatário (ordem de publicação)
+    payload = Column(Text, nullable=False)  # JSON publicado em notificacoes_exchange
+    created_at = Column(DateTime, default=datetime.utcnow)
+    published_at = Column(DateTime, index=True)  # NULL = pendente
+    attempts = Column(Integer, default=0)
+    traceparent = Column(String(55))  # contexto de rastreamento da requisição de origem
+    claimed_until = Column(DateTime)  # reserva do lote por um relay (NULL = livre)
+
+class ReplicaHeartbeat(Base):
+    """Batimento gravado no primário; lido nas réplicas para medir o atraso"""
+    __tablename__ = 'replica_heartbeat'
+    
+    id = Column(Integer, primary_key=True)
+    beat_ms = Column(BigInteger, nullable=False)  # epoch em milissegundos
@@ -0,0 +1,216 @@
+"""
+Relay da tabela outbox para o RabbitMQ
+As notificações são gravadas na tabela outbox na mesma transação da
+alteração do usuário. Esta thread lê as pendentes em lotes, publica em
+notificacoes_exchange e marca como publicadas somente após a confirmação
+do broker; cada lote confirmado é um checkpoint (commit) no banco. O lote é
+reservado (claimed_until) em uma transação curta, e a espera pelas
+confirmações acontece sem transação aberta.
+"""
+import os
+import json
+import threading
+from datetime import datetime, timedelta
+from concurrent.futures import wait
+from sqlalchemy import or_, update
+from models import OutboxMessage
+from database import new_session
+
+# Número máximo de mensagens lidas da outbox por lote
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', 200))
+# Intervalo (s) entre varreduras quando não há aviso de novos commits
+OUTBOX_POLL_INTERVAL = float(os.getenv('OUTBOX_POLL_INTERVAL', 1))
+# Tempo máximo (s) aguardando as confirmações de um lote
+OUTBOX_CONFIRM_TIMEOUT = float(os.getenv('OUTBOX_CONFIRM_TIMEOUT', 10))
+# Validade (s) da reserva de um lote; depois dela outro relay pode publicá-lo
+OUTBOX_CLAIM_TIMEOUT = float(os.getenv('OUTBOX_CLAIM_TIMEOUT', OUTBOX_CONFIRM_TIMEOUT * 3))
+# Espera (s) após um lote com falhas (broker indisponível)
+OUTBOX_RETRY_INTERVAL = float(os.getenv('OUTBOX_RETRY_INTERVAL', 5))
+# Tempo (h) que mensagens publicadas ficam na tabela antes da limpeza
+OUTBOX_RETENTION_HOURS = float(os.getenv('OUTBOX_RETENTION_HOURS', 24))
+
+class OutboxRelay:
+    """Publica as mensagens pendentes da outbox com entrega at-least-once"""
+
+    def __init__(self, publisher, batch_size=OUTBOX_BATCH_SIZE):
+        self.publisher = publisher
+        self.batch_size = batch_size
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+        self.thread = None
+        # Publicações aguardando confirmação: id da mensagem -> Future
+        self.inflight = {}
+        self.last_cleanup = datetime.utcnow()
+        # Métricas
+        self.relayed = 0
+        self.failed = 0
+        self.batches = 0
+        self.errors = 0
+        self.last_checkpoint = None
+        self.oldest_pending_age = 0.0
+
+    def start(self):
+        """Inicia a thread do relay"""
+        self.thread = threading.Thread(target=self._run, name='outbox-relay', daemon=True)
+        self.thread.start()
+
+    def wake(self):
+        """Avisa que há novas mensagens (chamado após um commit)"""
+        self.wakeup.set()
+
+    def _run(self):
+        while not self.stopping.is_set():
+            self.wakeup.wait(OUTBOX_POLL_INTERVAL)
+            self.wakeup.clear()
+            try:
+                # Continua enquanto houver lotes cheios e sem falhas
+                while not self.stopping.is_set():
+                    count, complete = self.relay_batch()
+                    if not complete:
+                        self.stopping.wait(OUTBOX_RETRY_INTERVAL)
+                        break
+                    if count < self.batch_size:
+                        break
+                self.cleanup()
+            except Exception as e:
+                self.errors += 1
+                print(f"⚠️  Erro no relay da outbox: {e}", flush=True)
+                self.stopping.wait(OUTBOX_RETRY_INTERVAL)
+
+    def relay_batch(self):
+        """
+        Publica um lote de mensagens pendentes.
+        Retorna (mensagens lidas, se todas foram confirmadas).
+        """
+        messages = self.claim_batch()
+        if not messages:
+            self.oldest_pending_age = 0.0
+            return 0, True
+
+        # Publicação e espera pelas confirmações sem transação aberta
+        self.oldest_pending_age = (datetime.utcnow() - messages[0]['created_at']).total_seconds()
+        for message in messages:
+            # Uma mensagem ainda sem confirmação não é enfileirada de novo
+            if message['id'] not in self.inflight:
+                self.inflight[message['id']] = self.publisher.enqueue(
+                    json.loads(message['payload']), message['key'], message['traceparent']
+                )
+        futures = [self.inflight[message['id']] for message in messages]
+        wait(futures, timeout=OUTBOX_CONFIRM_TIMEOUT)
+
+        published, rejected, unconfirmed = [], [], []
+        for message in messages:
+            future = self.inflight[message['id']]
+            if not future.done():
+                unconfirmed.append(message['id'])
+                continue
+            del self.inflight[message['id']]
+            if future.result():
+                published.append(message['id'])
+            else:
+                rejected.append(message['id'])
+
+        now = datetime.utcnow()
+        self.checkpoint(published, rejected, unconfirmed, now)
+        self.relayed += len(published)
+        self.failed += len(rejected)
+        self.batches += 1
+        self.last_checkpoint = now.isoformat()
+        return len(messages), not rejected and not unconfirmed
+
+    def claim_batch(self):
+        """
+        Reserva um lote de mensagens pendentes em uma transação curta.
+        A reserva expira após OUTBOX_CLAIM_TIMEOUT, então mensagens de um
+        relay que caiu antes do checkpoint voltam a ser publicadas.
+        """
+        db = new_session()
+        try:
+            now = datetime.utcnow()
+            # SKIP LOCKED permite vários relays (réplicas) sem disputa pelo mesmo lote
+            messages = (db.query(OutboxMessage)
+                        .filter(OutboxMessage.published_at.is_(None),
+                                or_(OutboxMessage.claimed_until.is_(None),
+                                    OutboxMessage.claimed_until < now))
+                        .order_by(OutboxMessage.id)
+                        .limit(self.batch_size)
+                        .with_for_update(skip_locked=True)
+                        .all())
+            claimed = [{
+                'id': message.id,
+                'key': message.key,
+                'payload': message.payload,
+                'traceparent': message.traceparent,
+                'created_at': message.created_at
+            } for message in messages]
+            if claimed:
+                db.execute(update(OutboxMessage)
+                           .where(OutboxMessage.id.in_([m['id'] for m in claimed]))
+                           .values(claimed_until=now + timedelta(seconds=OUTBOX_CLAIM_TIMEOUT)))
+            db.commit()
+            return claimed
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def checkpoint(self, published, rejected, unconfirmed, now):
+        """Marca as confirmadas como publicadas e libera a reserva das demais"""
+        db = new_session()
+        try:
+            if published:
+                db.execute(update(OutboxMessage)
+                           .where(OutboxMessage.id.in_(published))
+                           .values(published_at=now, claimed_until=None))
+            if rejected:
+                db.execute(update(OutboxMessage)
+                           .where(OutboxMessage.id.in_(rejected))
+                           .values(attempts=OutboxMessage.attempts + 1, claimed_until=None))
+            if unconfirmed:
+                db.execute(update(OutboxMessage)
+                           .where(OutboxMessage.id.in_(unconfirmed))
+                           .values(claimed_until=None))
+            # Checkpoint: as mensagens confirmadas não serão publicadas de novo
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def cleanup(self):
+        """Remove mensagens publicadas além do período de retenção"""
+        now = datetime.utcnow()
+        if now - self.last_cleanup < timedelta(minutes=10):
+            return
+        self.last_cleanup = now
+        db = new_session()
+        try:
+            limit = now - timedelta(hours=OUTBOX_RETENTION_HOURS)
+            db.query(OutboxMessage).filter(
+                OutboxMessage.published_at.isnot(None),
+                OutboxMessage.published_at < limit
+            ).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def stats(self):
+        """Retorna contadores do relay"""
+        return {
+            'relayed': self.relayed,
+            'failed': self.failed,
+            'inflight': len(self.inflight),
+            'batches': self.batches,
+            'errors': self.errors,
+            'last_checkpoint': self.last_checkpoint,
+            'oldest_pending_age': round(self.oldest_pending_age, 3)
+        }
+
+    def stop(self, timeout=5):
+        """Encerra o relay"""
+        self.stopping.set()
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
@@ -0,0 +1,160 @@
+"""
+Executor dedicado para hash de senhas (bcrypt)
+O bcrypt roda em um pool de processos separado e limitado, com fila e
+métricas próprias, para que rajadas de login/cadastro não consumam a CPU
+das ações baratas (get_user, verify_token).
+"""
+import os
+import threading
+from collections import deque
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import bcrypt
+from worker_pool import OverloadedError
+
+# 'process' (padrão) ou 'thread'
+HASH_EXECUTOR = os.getenv('HASH_EXECUTOR', 'process')
+# Número de processos dedicados ao bcrypt
+HASH_WORKERS = int(os.getenv('HASH_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+# Número máximo de operações aguardando um processo livre
+HASH_QUEUE_SIZE = int(os.getenv('HASH_QUEUE_SIZE', 64))
+# Tempo máximo (ms) aguardando uma vaga na fila antes de recusar
+HASH_QUEUE_TIMEOUT = int(os.getenv('HASH_QUEUE_TIMEOUT_MS', 2000)) / 1000.0
+# Senhas por tarefa em hash_many (cada bloco ocupa uma vaga da fila)
+HASH_BULK_CHUNK = int(os.getenv('HASH_BULK_CHUNK', 8))
+# Blocos de um mesmo hash_many em andamento ao mesmo tempo (padrão: HASH_WORKERS)
+HASH_BULK_IN_FLIGHT = int(os.getenv('HASH_BULK_IN_FLIGHT', HASH_WORKERS))
+
+def _hashpw(password):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+
+def _hashpw_many(passwords):
+    return [_hashpw(password) for password in passwords]
+
+def _checkpw(password, password_hash):
+    return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+
+class PasswordHasher:
+    """Executa bcrypt em um pool isolado e limitado"""
+
+    def __init__(self, workers=HASH_WORKERS, queue_size=HASH_QUEUE_SIZE,
+                 queue_timeout=HASH_QUEUE_TIMEOUT, executor=HASH_EXECUTOR,
+                 bulk_in_flight=HASH_BULK_IN_FLIGHT):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        # Um lote nunca ocupa todas as vagas: sobra fila para login e cadastro
+        self.bulk_in_flight = max(1, min(bulk_in_flight, workers + queue_size - 1))
+        if executor == 'thread':
+            self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bcrypt')
+        else:
+            self.executor = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context('spawn')
+            )
+        self.executor_type = executor
+        # Vagas = processos ocupados + operações aguardando na fila
+        self.slots = threading.BoundedSemaphore(workers + queue_size)
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+    def _reject(self):
+        with self.lock:
+            self.rejected += 1
+        raise OverloadedError('Fila de hash de senhas cheia')
+
+    def _submit(self, fn, *args):
+        """Envia a tarefa ao pool ocupando uma vaga da fila"""
+        if not self.slots.acquire(timeout=self.queue_timeout):
+            self._reject()
+        return self._start(fn, *args)
+
+    def _start(self, fn, *args):
+        """Envia a tarefa ao pool com a vaga já ocupada"""
+        with self.lock:
+            self.pending += 1
+        start = time.monotonic()
+        try:
+            future = self.executor.submit(fn, *args)
+        except Exception:
+            self._finish(start, True)
+            raise
+        future.add_done_callback(
+            lambda f: self._finish(start, f.cancelled() or f.exception() is not None)
+        )
+        return future
+
+    def _finish(self, start, failed):
+        elapsed = time.monotonic() - start
+        self.slots.release()
+        with self.lock:
+            self.pending -= 1
+            self.completed += 1
+            self.errors += failed
+            self.total_time += elapsed
+            self.max_time = max(self.max_time, elapsed)
+
+    def _run(self, fn, *args):
+        return self._submit(fn, *args).result()
+
+    def hash(self, password):
+        """Gera hash da senha"""
+        return self._run(_hashpw, password)
+
+    def hash_many(self, passwords):
+        """
+        Gera os hashes de várias senhas em paralelo.
+        As senhas são divididas em blocos de HASH_BULK_CHUNK; cada bloco ocupa
+        uma vaga da fila, como uma operação individual, mas no máximo
+        `bulk_in_flight` blocos do lote ficam no pool ao mesmo tempo. Sem vaga,
+        o lote espera seus próprios blocos terminarem em vez de falhar no meio;
+        em caso de erro os blocos ainda não executados são cancelados.
+        """
+        futures = []
+        in_flight = deque()
+        try:
+            for i in range(0, len(passwords), HASH_BULK_CHUNK):
+                while len(in_flight) >= self.bulk_in_flight:
+                    in_flight.popleft().result()
+                while not self.slots.acquire(timeout=self.queue_timeout):
+                    if not in_flight:
+                        self._reject()
+                    in_flight.popleft().result()
+                future = self._start(_hashpw_many, passwords[i:i + HASH_BULK_CHUNK])
+                futures.append(future)
+                in_flight.append(future)
+            return [password_hash for future in futures for password_hash in future.result()]
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+
+    def verify(self, password, password_hash):
+        """Verifica se a senha corresponde ao hash"""
+        return self._run(_checkpw, password, password_hash)
+
+    def stats(self):
+        """Retorna ocupação da fila e tempos do pool de hash"""
+        with self.lock:
+            return {
+                'executor': self.executor_type,
+                'workers': self.workers,
+                'queue_size': self.queue_size,
+                'bulk_in_flight': self.bulk_in_flight,
+                'pending': self.pending,
+                'queue_depth': max(0, self.pending - self.workers),
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'errors': self.errors,
+                'avg_time': round(self.total_time / self.completed, 4) if self.completed else 0.0,
+                'max_time': round(self.max_time, 4)
+            }
+
+    def shutdown(self):
+        """Encerra o pool"""
+        self.executor.shutdown(wait=False)
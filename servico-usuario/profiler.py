@@ -0,0 +1,209 @@
+"""
+Profiling sob demanda de handle_request
+Ativado pela ação administrativa 'profile' por N segundos ou N requisições,
+opcionalmente só para uma ação. Dois modos:
+- 'deterministic': cProfile em cada requisição; grava <ação>.pstats
+- 'sampling': amostra as pilhas das threads em atendimento a cada
+  PROFILE_SAMPLE_INTERVAL; grava <ação>.folded (formato collapsed stacks,
+  uma pilha por linha com a contagem, para flamegraph.pl/speedscope)
+Desligado, o custo é uma verificação de atributo por requisição.
+"""
+import cProfile
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+
+# Diretório onde cada sessão grava seus arquivos
+PROFILE_DIR = os.getenv('PROFILE_DIR', '/tmp/profiles')
+# Duração máxima (s) de uma sessão de profiling
+PROFILE_MAX_SECONDS = float(os.getenv('PROFILE_MAX_SECONDS', 300))
+# Intervalo (s) entre amostras no modo 'sampling'
+PROFILE_SAMPLE_INTERVAL = float(os.getenv('PROFILE_SAMPLE_INTERVAL', 0.005))
+
+MODES = ('deterministic', 'sampling')
+
+class ProfileSession:
+    """Uma sessão de profiling: limites, filtro e resultados por ação"""
+
+    def __init__(self, mode, seconds, requests, action):
+        self.mode = mode
+        self.action = action
+        self.requests = requests
+        self.seconds = seconds
+        self.started = time.time()
+        self.name = time.strftime('%Y%m%d-%H%M%S') + f'-{mode}'
+        self.profiled = 0
+        self.skipped = 0
+        self.samples = 0
+        self.stats = {}  # ação -> pstats.Stats (deterministic)
+        self.stacks = {}  # ação -> Counter de pilhas (sampling)
+        self.lock = threading.Lock()
+        self.finished = threading.Event()
+
+    def accepts(self, action):
+        # A própria ação de controle não entra no resultado
+        return action != 'profile' and (self.action is None or self.action == action)
+
+    def summary(self):
+        return {
+            'name': self.name,
+            'mode': self.mode,
+            'action': self.action,
+            'seconds': self.seconds,
+            'requests': self.requests,
+            'elapsed': round(time.time() - self.started, 3),
+            'profiled': self.profiled,
+            'skipped': self.skipped,
+            'samples': self.samples
+        }
+
+class RequestProfiler:
+    """Controla a sessão ativa e envolve as requisições enquanto ela durar"""
+
+    def __init__(self, directory=PROFILE_DIR):
+        self.directory = directory
+        self.session = None  # None = desligado
+        self.lock = threading.Lock()
+        # cProfile só pode medir uma requisição por vez (Python 3.12+)
+        self.cprofile_lock = threading.Lock()
+        self.cprofile_owner = None
+        self.active_threads = {}  # thread id -> ação (sampling)
+        self.last_result = None
+
+    def start(self, mode='sampling', seconds=None, requests=None, action=None):
+        """Inicia uma sessão; termina após `seconds` ou `requests` requisições"""
+        if mode not in MODES:
+            raise ValueError(f"Modo inválido: use {' ou '.join(MODES)}")
+        seconds = min(float(seconds or PROFILE_MAX_SECONDS), PROFILE_MAX_SECONDS)
+        requests = int(requests) if requests else None
+        if seconds <= 0 or (requests is not None and requests < 1):
+            raise ValueError('seconds e requests devem ser positivos')
+        with self.lock:
+            if self.session is not None:
+                raise ValueError('Já existe uma sessão de profiling ativa')
+            session = ProfileSession(mode, seconds, requests, action)
+            self.session = session
+        threading.Thread(target=self._control, args=(session,), name='profiler', daemon=True).start()
+        print(f"🔬 Profiling iniciado: {session.summary()}", flush=True)
+        return session.summary()
+
+    def _control(self, session):
+        """Encerra a sessão no prazo; no modo sampling, coleta as amostras"""
+        deadline = session.started + session.seconds
+        while not session.finished.is_set() and time.time() < deadline:
+            if session.mode == 'sampling':
+                self._sample(session)
+                session.finished.wait(PROFILE_SAMPLE_INTERVAL)
+            else:
+                session.finished.wait(deadline - time.time())
+        self.stop(session)
+
+    def _sample(self, session):
+        frames = sys._current_frames()
+        for thread_id, action in list(self.active_threads.items()):
+            frame = frames.get(thread_id)
+            stack = []
+            # Da função atual até a entrada da requisição (exclusive)
+            while frame is not None and frame.f_code is not RequestProfiler.call.__code__:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            if not stack:
+                continue
+            key = ';'.join(reversed(stack))
+            with session.lock:
+                session.stacks.setdefault(action, Counter())[key] += 1
+                session.samples += 1
+
+    def call(self, action, func, *args):
+        """Executa a requisição sob a sessão ativa"""
+        session = self.session
+        if session is None or not session.accepts(action):
+            return func(*args)
+        if session.mode == 'sampling':
+            thread_id = threading.get_ident()
+            if thread_id in self.active_threads:
+                # Sub-requisição de um batch: já está na pilha amostrada
+                return func(*args)
+            self.active_threads[thread_id] = action
+            try:
+                return func(*args)
+            finally:
+                del self.active_threads[thread_id]
+                self._count(session)
+
+        if self.cprofile_owner == threading.get_ident():
+            # Sub-requisição de um batch: já medida pelo profile da requisição externa
+            return func(*args)
+        if not self.cprofile_lock.acquire(blocking=False):
+            with session.lock:
+                session.skipped += 1
+            return func(*args)
+        self.cprofile_owner = threading.get_ident()
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+            try:
+                return func(*args)
+            finally:
+                profile.disable()
+        finally:
+            self.cprofile_owner = None
+            self.cprofile_lock.release()
+            with session.lock:
+                if action in session.stats:
+                    session.stats[action].add(profile)
+                else:
+                    session.stats[action] = pstats.Stats(profile)
+            self._count(session)
+
+    def _count(self, session):
+        with session.lock:
+            session.profiled += 1
+            done = session.requests is not None and session.profiled >= session.requests
+        if done:
+            session.finished.set()
+
+    def stop(self, session=None):
+        """Encerra a sessão (a atual, se não indicada) e grava os arquivos"""
+        with self.lock:
+            session = session or self.session
+            if session is None or self.session is not session:
+                return self.last_result
+            self.session = None
+        session.finished.set()
+        result = dict(session.summary(), files=self._write(session))
+        self.last_result = result
+        print(f"🔬 Profiling encerrado: {len(result['files'])} arquivo(s) em {self.directory}", flush=True)
+        return result
+
+    def _write(self, session):
+        directory = os.path.join(self.directory, session.name)
+        os.makedirs(directory, exist_ok=True)
+        files = []
+        with session.lock:
+            for action, stats in session.stats.items():
+                path = os.path.join(directory, f'{action}.pstats')
+                stats.dump_stats(path)
+                files.append(path)
+            for action, stacks in session.stacks.items():
+                path = os.path.join(directory, f'{action}.folded')
+                with open(path, 'w', encoding='utf-8') as output:
+                    for stack, count in stacks.most_common():
+                        output.write(f'{stack} {count}\n')
+                files.append(path)
+        return files
+
+    def status(self):
+        """Retorna a sessão ativa (se houver) e o resultado da última"""
+        session = self.session
+        return {
+            'active': session.summary() if session is not None else None,
+            'last': self.last_result
+        }
+
+# Singleton instance
+profiler = RequestProfiler()
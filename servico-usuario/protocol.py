@@ -0,0 +1,313 @@
+"""
+Protocolo de comunicação do Serviço de Usuários
+Framing com prefixo de tamanho e versão, permitindo várias
+requisições/respostas na mesma conexão TCP.
+
+Formato do cabeçalho (9 bytes, big-endian):
+    MAGIC (2 bytes) | VERSÃO (1) | CODIFICAÇÃO (1) | FLAGS (1) | TAMANHO (4)
+
+Uma resposta em streaming é uma sequência de frames NDJSON com FLAG_STREAM,
+encerrada por um frame sem a flag (resumo da resposta).
+
+O payload é JSON por padrão. Com o pacote msgpack instalado, MessagePack
+também é aceito; o cliente descobre o suporte do serviço pela ação 'hello'
+(handshake, sempre em JSON) e o serviço responde cada frame na codificação
+da requisição.
+
+Conexões cujo primeiro par de bytes não é o MAGIC são tratadas no modo
+legado (JSON puro, uma requisição por conexão).
+"""
+import os
+import asyncio
+import json
+import struct
+
+try:
+    import msgpack
+except ImportError:  # opcional: sem ele, só JSON
+    msgpack = None
+
+MAGIC = b'US'
+VERSION = 1
+HEADER = struct.Struct('!2sBBBI')
+
+# Codificações de payload
+ENCODING_JSON = 0
+# Um documento JSON por linha (frames de streaming)
+ENCODING_NDJSON = 1
+# MessagePack (requer o pacote msgpack)
+ENCODING_MSGPACK = 2
+
+# Nomes usados no handshake
+ENCODING_NAMES = {'json': ENCODING_JSON, 'msgpack': ENCODING_MSGPACK}
+# Codificações de payload aceitas por este processo, em ordem de preferência
+SUPPORTED_ENCODINGS = ['msgpack', 'json'] if msgpack is not None else ['json']
+
+# Flags do cabeçalho
+# Outros frames da mesma resposta virão em seguida
+FLAG_STREAM = 0x01
+
+# Tamanho máximo de um frame (padrão: 16 MiB)
+MAX_FRAME_SIZE = int(os.getenv('PROTOCOL_MAX_FRAME_SIZE', 16 * 1024 * 1024))
+
+# Tempo máximo (s) que uma conexão persistente pode ficar ociosa
+CONNECTION_IDLE_TIMEOUT = float(os.getenv('CONNECTION_IDLE_TIMEOUT', 300))
+
+RECV_BUFFER = 4096
+
+# Resposta a um streaming pedido em uma conexão legada
+STREAM_UNSUPPORTED = {'success': False, 'message': 'Streaming requer o protocolo com framing'}
+
+class ProtocolError(Exception):
+    """Erro de framing ou de versão do protocolo"""
+
+class StreamResponse:
+    """
+    Resposta enviada em vários frames: cada item de `chunks` (bytes NDJSON)
+    vai em um frame com FLAG_STREAM e `summary` encerra a resposta.
+    """
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.summary = {'success': True}
+
+    def close(self):
+        """Libera os recursos do gerador (ex.: sessão do banco)"""
+        self.chunks.close()
+
+class PreEncoded:
+    """
+    Resposta em que o campo `key` é montado a partir de fragmentos JSON já
+    serializados (ex.: usuários em cache), concatenados no payload sem
+    passar de novo por json.dumps. `fragments` é uma lista de (valor, json);
+    com many=False o campo é o único fragmento, não uma lista.
+    """
+
+    def __init__(self, fields, key, fragments, many=True):
+        self.fields = fields
+        self.key = key
+        self.fragments = fragments
+        self.many = many
+
+    def get(self, name, default=None):
+        return self.fields.get(name, default)
+
+    def to_dict(self):
+        """Resposta equivalente como dicionário (outras codificações)"""
+        values = [value for value, _ in self.fragments]
+        return dict(self.fields, **{self.key: values if self.many else values[0]})
+
+    def encode_json(self):
+        if self.many:
+            body = b'[' + b', '.join(encoded for _, encoded in self.fragments) + b']'
+        else:
+            body = self.fragments[0][1]
+        head = json.dumps(self.fields).encode('utf-8')[:-1]
+        separator = b', ' if self.fields else b''
+        return head + separator + json.dumps(self.key).encode('utf-8') + b': ' + body + b'}'
+
+def encode_payload(message, encoding=ENCODING_JSON):
+    """Serializa a mensagem na codificação informada"""
+    if isinstance(message, PreEncoded):
+        if encoding == ENCODING_JSON:
+            return message.encode_json()
+        message = message.to_dict()
+    if encoding == ENCODING_JSON:
+        return json.dumps(message).encode('utf-8')
+    if encoding == ENCODING_NDJSON:
+        return b''.join(json.dumps(item).encode('utf-8') + b'\n' for item in message)
+    if encoding == ENCODING_MSGPACK and msgpack is not None:
+        return msgpack.packb(message, use_bin_type=True)
+    raise ProtocolError(f'Codificação não suportada: {encoding}')
+
+def decode_payload(payload, encoding=ENCODING_JSON):
+    """Desserializa o payload na codificação informada"""
+    if encoding == ENCODING_JSON:
+        return json.loads(payload.decode('utf-8'))
+    if encoding == ENCODING_NDJSON:
+        return [json.loads(line) for line in payload.decode('utf-8').splitlines() if line]
+    if encoding == ENCODING_MSGPACK and msgpack is not None:
+        return msgpack.unpackb(payload, raw=False)
+    raise ProtocolError(f'Codificação não suportada: {encoding}')
+
+def encode_raw_frame(payload, encoding=ENCODING_JSON, flags=0):
+    """Monta um frame a partir de um payload já serializado"""
+    if len(payload) > MAX_FRAME_SIZE:
+        raise ProtocolError(f'Frame excede o tamanho máximo ({len(payload)} bytes)')
+    return HEADER.pack(MAGIC, VERSION, encoding, flags, len(payload)) + payload
+
+def encode_frame(message, encoding=ENCODING_JSON, flags=0):
+    """Monta um frame completo (cabeçalho + payload)"""
+    return encode_raw_frame(encode_payload(message, encoding), encoding, flags)
+
+def parse_header(header):
+    """Valida o cabeçalho e retorna (codificação, flags, tamanho)"""
+    magic, version, encoding, flags, length = HEADER.unpack(header)
+    if magic != MAGIC:
+        raise ProtocolError('Cabeçalho inválido')
+    if version != VERSION:
+        raise ProtocolError(f'Versão de protocolo não suportada: {version}')
+    if length > MAX_FRAME_SIZE:
+        raise ProtocolError(f'Frame excede o tamanho máximo ({length} bytes)')
+    return encoding, flags, length
+
+def split_frame(data):
+    """
+    Separa o primeiro frame completo dos bytes já recebidos (leitura sem
+    bloqueio). Retorna (payload, codificação, flags, restante) ou None se o
+    frame ainda não chegou inteiro.
+    """
+    if len(data) < HEADER.size:
+        return None
+    encoding, flags, length = parse_header(bytes(data[:HEADER.size]))
+    end = HEADER.size + length
+    if len(data) < end:
+        return None
+    return bytes(data[HEADER.size:end]), encoding, flags, data[end:]
+
+def recv_exact(sock, size):
+    """
+    Lê exatamente `size` bytes do socket.
+    Retorna None se a conexão for encerrada antes do primeiro byte.
+    """
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            if not data:
+                return None
+            raise ProtocolError('Conexão encerrada no meio de um frame')
+        data += chunk
+    return data
+
+def read_raw_frame(sock, prefix=b''):
+    """
+    Lê um frame do socket e retorna (payload, codificação, flags),
+    sem desserializar o payload.
+    `prefix` contém bytes do cabeçalho que já foram lidos.
+    Retorna None se a conexão for encerrada entre frames.
+    """
+    rest = recv_exact(sock, HEADER.size - len(prefix))
+    if rest is None:
+        if prefix:
+            raise ProtocolError('Conexão encerrada no meio de um frame')
+        return None
+    encoding, flags, length = parse_header(prefix + rest)
+    payload = recv_exact(sock, length) if length else b''
+    if payload is None:
+        raise ProtocolError('Conexão encerrada no meio de um frame')
+    return payload, encoding, flags
+
+def read_frame(sock, prefix=b''):
+    """Lê um frame do socket e retorna (mensagem, codificação, flags)"""
+    frame = read_raw_frame(sock, prefix)
+    if frame is None:
+        return None
+    payload, encoding, flags = frame
+    return decode_payload(payload, encoding), encoding, flags
+
+def write_frame(sock, message, encoding=ENCODING_JSON, flags=0):
+    """Envia uma mensagem como frame"""
+    sock.sendall(encode_frame(message, encoding, flags))
+
+def write_stream(sock, stream, encoding=ENCODING_JSON):
+    """Envia uma StreamResponse: frames NDJSON seguidos do frame de resumo"""
+    try:
+        for chunk in stream.chunks:
+            sock.sendall(encode_raw_frame(chunk, ENCODING_NDJSON, FLAG_STREAM))
+    finally:
+        stream.close()
+    write_frame(sock, stream.summary, encoding)
+
+def negotiate(offered):
+    """
+    Resposta do serviço à ação 'hello': escolhe a primeira codificação
+    oferecida pelo cliente que este processo suporta (JSON se nenhuma).
+    """
+    chosen = next((name for name in offered or () if name in SUPPORTED_ENCODINGS), 'json')
+    return {
+        'success': True,
+        'version': VERSION,
+        'encoding': chosen,
+        'encodings': SUPPORTED_ENCODINGS
+    }
+
+def handshake(sock, preferred):
+    """
+    Lado do cliente: anuncia as codificações aceitas (a preferida primeiro)
+    e retorna a combinada com o serviço. Serviços sem a ação 'hello' ou
+    sem suporte à preferida resultam em JSON.
+    """
+    offered = [name for name in (preferred, 'json') if name in SUPPORTED_ENCODINGS]
+    write_frame(sock, {'action': 'hello', 'data': {'encodings': offered}})
+    frame = read_frame(sock)
+    if frame is None:
+        raise ConnectionError('Conexão encerrada durante o handshake')
+    response = frame[0]
+    if not response.get('success'):
+        return ENCODING_JSON
+    return ENCODING_NAMES.get(response.get('encoding'), ENCODING_JSON)
+
+def try_decode_legacy(data):
+    """Tenta decodificar um documento JSON completo (modo legado)"""
+    if not data.rstrip().endswith(b'}'):
+        return None
+    try:
+        return json.loads(data.decode('utf-8'))
+    except (UnicodeDecodeError, ValueError):
+        return None
+
+def read_legacy(sock, prefix=b''):
+    """
+    Lê uma requisição no modo legado (JSON sem cabeçalho).
+    Continua lendo até que os bytes recebidos formem um JSON completo,
+    evitando o travamento quando o payload é múltiplo de 4096 bytes.
+    """
+    data = prefix
+    message = try_decode_legacy(data) if data else None
+    while message is None:
+        chunk = sock.recv(RECV_BUFFER)
+        if not chunk:
+            break
+        data += chunk
+        if len(data) > MAX_FRAME_SIZE:
+            raise ProtocolError('Requisição excede o tamanho máximo')
+        message = try_decode_legacy(data)
+    if message is None and data:
+        raise ProtocolError('Requisição JSON incompleta ou inválida')
+    return message
+
+def write_legacy(sock, message):
+    """Envia uma resposta no modo legado"""
+    sock.sendall(encode_payload(message))
+
+async def read_frame_async(reader, prefix=b''):
+    """Versão assíncrona de read_frame para asyncio.StreamReader"""
+    try:
+        rest = await reader.readexactly(HEADER.size - len(prefix))
+    except asyncio.IncompleteReadError as e:
+        if e.partial or prefix:
+            raise ProtocolError('Conexão encerrada no meio de um frame')
+        return None
+    encoding, flags, length = parse_header(prefix + rest)
+    try:
+        payload = await reader.readexactly(length) if length else b''
+    except asyncio.IncompleteReadError:
+        raise ProtocolError('Conexão encerrada no meio de um frame')
+    return decode_payload(payload, encoding), encoding, flags
+
+async def read_legacy_async(reader, prefix=b''):
+    """Versão assíncrona de read_legacy para asyncio.StreamReader"""
+    data = prefix
+    message = try_decode_legacy(data) if data else None
+    while message is None:
+        chunk = await reader.read(RECV_BUFFER)
+        if not chunk:
+            break
+        data += chunk
+        if len(data) > MAX_FRAME_SIZE:
+            raise ProtocolError('Requisição excede o tamanho máximo')
+        message = try_decode_legacy(data)
+    if message is None and data:
+        raise ProtocolError('Requisição JSON incompleta ou inválida')
+    return message
@@ -1,8 +1,15 @@
 #!/bin/bash
-echo "🔄 Aguardando banco de dados MySQL..."
-while ! nc -z db 3306; do
-  sleep 1
-done
-echo "✅ Banco de dados MySQL pronto!"
+case "$(echo "$OFFLINE_MODE" | tr '[:upper:]' '[:lower:]')" in
+  1|true|yes)
+    echo "🔌 Modo offline: sem MySQL nem RabbitMQ"
+    ;;
+  *)
+    echo "🔄 Aguardando banco de dados MySQL..."
+    while ! nc -z db 3306; do
+      sleep 1
+    done
+    echo "✅ Banco de dados MySQL pronto!"
+    ;;
+esac
 echo "🚀 Iniciando Serviço de Usuários..."
 python user_service.py
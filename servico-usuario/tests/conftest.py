@@ -0,0 +1,51 @@
+"""
+Configuração dos testes do Serviço de Usuários
+Os testes rodam no modo offline (SQLite em memória e broker em memória),
+sem MySQL nem RabbitMQ. Uso, a partir de servico-usuario/:
+
+    python -m pytest tests
+"""
+import os
+import sys
+import bcrypt
+import pytest
+
+os.environ['OFFLINE_MODE'] = 'true'
+os.environ['OFFLINE_DATABASE_URL'] = 'sqlite://'
+os.environ.pop('DATABASE_URL', None)
+os.environ.setdefault('HASH_EXECUTOR', 'thread')
+os.environ.setdefault('HASH_WORKERS', '2')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture(scope='session')
+def service():
+    """UserService sobre o SQLite em memória, com bcrypt de custo mínimo"""
+    from database import init_db, close_db
+    from user_service import UserService
+
+    gensalt = bcrypt.gensalt
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(bcrypt, 'gensalt', lambda rounds=4, prefix=b'2b': gensalt(4, prefix))
+        init_db()
+        service = UserService()
+        yield service
+        service.outbox_relay.stop()
+        service.hasher.shutdown()
+        close_db()
+
+@pytest.fixture
+def user_service(service):
+    """Serviço com as tabelas e os caches vazios ao fim de cada teste"""
+    from database import new_session
+    from models import User, OutboxMessage
+
+    yield service
+    db = new_session()
+    try:
+        db.query(OutboxMessage).delete()
+        db.query(User).delete()
+        db.commit()
+    finally:
+        db.close()
+    service.user_cache.clear()
@@ -0,0 +1,108 @@
+"""Ação batch: sessão compartilhada e caminho transacional"""
+import pytest
+import protocol
+from database import new_session
+from models import User, OutboxMessage
+
+def create(index, **overrides):
+    data = {
+        'name': f'Paciente {index}',
+        'cpf': f'{index:03d}.111.111-11',
+        'email': f'batch{index}@email.com',
+        'password': 'senha123',
+        'role': 'PATIENT'
+    }
+    data.update(overrides)
+    return {'action': 'create_user', 'data': data}
+
+def batch(service, requests, transaction=False):
+    return service.handle_request({
+        'action': 'batch', 'data': {'requests': requests, 'transaction': transaction}
+    })
+
+def get_user(service, user_id):
+    """get_user como chega ao cliente (a resposta pode vir em fragmentos JSON)"""
+    response = service.handle_request({'action': 'get_user', 'data': {'user_id': user_id}})
+    return protocol.decode_payload(protocol.encode_payload(response))
+
+def count(model):
+    db = new_session()
+    try:
+        return db.query(model).count()
+    finally:
+        db.close()
+
+def test_transaction_commits_all(user_service):
+    response = batch(user_service, [create(1), create(2)], transaction=True)
+    assert response['success'] is True
+    assert response['committed'] is True
+    assert [r['success'] for r in response['results']] == [True, True]
+    assert count(User) == 2
+    assert count(OutboxMessage) == 2
+
+def test_transaction_rolls_back_on_failure(user_service):
+    response = batch(user_service, [
+        create(1),
+        create(2, email='batch1@email.com'),  # email repetido: falha
+        create(3)
+    ], transaction=True)
+    assert response['success'] is False
+    assert response['committed'] is False
+    # Para na primeira falha, sem executar o restante
+    assert len(response['results']) == 2
+    assert response['results'][1]['success'] is False
+    assert count(User) == 0
+    assert count(OutboxMessage) == 0
+
+def test_non_transactional_keeps_successful_requests(user_service):
+    response = batch(user_service, [
+        create(1),
+        create(2, email='batch1@email.com'),
+        create(3)
+    ])
+    assert response['success'] is False
+    assert 'committed' not in response
+    assert [r['success'] for r in response['results']] == [True, False, True]
+    assert count(User) == 2
+
+def test_update_in_transaction_invalidates_cache_after_commit(user_service):
+    user_id = batch(user_service, [create(1)])['results'][0]['user']['id']
+    # Leitura coloca o usuário no cache
+    assert get_user(user_service, user_id)['user']['name'] == 'Paciente 1'
+    response = batch(user_service, [
+        {'action': 'update_user', 'data': {'user_id': user_id, 'name': 'Renomeado'}},
+        {'action': 'get_user', 'data': {'user_id': user_id}}
+    ], transaction=True)
+    assert response['success'] is True
+    # Dentro da transação a leitura vê a alteração ainda não confirmada
+    assert response['results'][1]['user']['name'] == 'Renomeado'
+    assert get_user(user_service, user_id)['user']['name'] == 'Renomeado'
+
+def test_failed_transaction_leaves_cached_user_unchanged(user_service):
+    user_id = batch(user_service, [create(1)])['results'][0]['user']['id']
+    get_user(user_service, user_id)
+    response = batch(user_service, [
+        {'action': 'update_user', 'data': {'user_id': user_id, 'name': 'Descartado'}},
+        {'action': 'get_user', 'data': {'user_id': 999999}}
+    ], transaction=True)
+    assert response['committed'] is False
+    assert get_user(user_service, user_id)['user']['name'] == 'Paciente 1'
+
+@pytest.mark.parametrize('requests, message', [
+    ([], 'vazia'),
+    ('get_user', 'vazia'),
+    ([1], 'objeto'),
+    ([{'action': 'get_user', 'data': 5}], 'objeto'),
+    ([{'action': 'batch', 'data': {'requests': []}}], 'aninhado'),
+])
+def test_invalid_batches(user_service, requests, message):
+    response = batch(user_service, requests)
+    assert response['success'] is False
+    assert message in response['message']
+
+def test_batch_size_limit(user_service, monkeypatch):
+    import user_service as module
+    monkeypatch.setattr(module, 'BATCH_MAX_SIZE', 1)
+    response = batch(user_service, [create(1), create(2)])
+    assert response['success'] is False
+    assert 'limite' in response['message']
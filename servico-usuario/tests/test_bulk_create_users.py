@@ -0,0 +1,184 @@
+"""Ação bulk_create_users e hash de senhas em lote"""
+import threading
+import time
+import pytest
+import bcrypt
+import password_hasher
+from password_hasher import PasswordHasher
+from worker_pool import OverloadedError
+from database import new_session, pool_stats
+from models import User, OutboxMessage
+
+def row(index, **overrides):
+    data = {
+        'name': f'Paciente {index}',
+        'cpf': f'{index:03d}.000.000-00',
+        'email': f'paciente{index}@email.com',
+        'password': f'senha{index}',
+        'role': 'PATIENT'
+    }
+    data.update(overrides)
+    return data
+
+def bulk(service, rows):
+    return service.handle_request({'action': 'bulk_create_users', 'data': {'users': rows}})
+
+def test_creates_users_and_notifications(user_service):
+    response = bulk(user_service, [row(i) for i in range(20)])
+    assert response['success'] is True
+    assert (response['created'], response['failed']) == (20, 0)
+    ids = [result['user_id'] for result in response['results']]
+    assert all(ids) and len(set(ids)) == 20
+
+    db = new_session()
+    try:
+        users = {u.email: u for u in db.query(User).all()}
+        assert len(users) == 20
+        user = users['paciente7@email.com']
+        assert bcrypt.checkpw(b'senha7', user.password_hash.encode('utf-8'))
+        assert db.query(OutboxMessage).count() == 20
+    finally:
+        db.close()
+
+def test_authenticate_bulk_user(user_service):
+    bulk(user_service, [row(1)])
+    response = user_service.handle_request({
+        'action': 'authenticate', 'data': {'email': 'paciente1@email.com', 'password': 'senha1'}
+    })
+    assert response['success'] is True
+
+def test_reports_each_invalid_row(user_service):
+    bulk(user_service, [row(1)])
+    response = bulk(user_service, [
+        row(2),
+        'não é um objeto',
+        row(3, password=''),
+        row(4, role='ZELADOR'),
+        row(5, email='paciente2@email.com'),  # repetido no lote
+        row(6, cpf='001.000.000-00'),         # já cadastrado
+    ])
+    assert response['success'] is True
+    assert (response['created'], response['failed']) == (1, 5)
+    results = response['results']
+    assert [r['index'] for r in results] == list(range(6))
+    assert results[0]['success'] is True
+    assert 'Linha inválida' in results[1]['message']
+    assert 'password' in results[2]['message']
+    assert 'ZELADOR' in results[3]['message']
+    assert 'repetidos no lote' in results[4]['message']
+    assert 'já cadastrados' in results[5]['message']
+
+@pytest.mark.parametrize('rows', [None, [], 'usuarios'])
+def test_rejects_empty_or_invalid_list(user_service, rows):
+    assert bulk(user_service, rows)['success'] is False
+
+def test_rejects_batch_over_limit(user_service, monkeypatch):
+    import user_service as module
+    monkeypatch.setattr(module, 'BULK_MAX_SIZE', 2)
+    response = bulk(user_service, [row(i) for i in range(3)])
+    assert response['success'] is False
+    assert 'limite' in response['message']
+
+def test_hashes_without_holding_a_connection(user_service, monkeypatch):
+    hash_many = user_service.hasher.hash_many
+    checked_out = []
+
+    def spy(passwords):
+        checked_out.append(pool_stats()['checked_out'])
+        return hash_many(passwords)
+
+    monkeypatch.setattr(user_service.hasher, 'hash_many', spy)
+    assert bulk(user_service, [row(1), row(2)])['created'] == 2
+    assert checked_out == [0]
+
+def test_concurrent_signup_fails_only_conflicting_rows(user_service, monkeypatch):
+    hash_many = user_service.hasher.hash_many
+
+    def racing(passwords):
+        # Outra requisição cadastra o mesmo email enquanto o bcrypt roda
+        hashes = hash_many(passwords)
+        db = new_session()
+        try:
+            db.add(User(name='Outro', cpf='999.000.000-00', email='paciente2@email.com',
+                        password_hash=hashes[0], role='PATIENT'))
+            db.commit()
+        finally:
+            db.close()
+        return hashes
+
+    monkeypatch.setattr(user_service.hasher, 'hash_many', racing)
+    response = bulk(user_service, [row(1), row(2), row(3)])
+    assert response['success'] is True
+    assert (response['created'], response['failed']) == (2, 1)
+    results = response['results']
+    assert results[0]['success'] and results[2]['success']
+    assert 'já cadastrados' in results[1]['message']
+
+def test_hash_many_bounds_chunks_in_flight(monkeypatch):
+    monkeypatch.setattr(password_hasher, 'HASH_BULK_CHUNK', 1)
+    hasher = PasswordHasher(workers=1, queue_size=3, queue_timeout=0.2, executor='thread',
+                            bulk_in_flight=2)
+    peak = []
+
+    def slow_hash(passwords):
+        peak.append(hasher.stats()['pending'])
+        time.sleep(0.05)
+        return [p.upper() for p in passwords]
+
+    monkeypatch.setattr(password_hasher, '_hashpw_many', slow_hash)
+    try:
+        # 12 blocos com o tempo de espera por vaga bem menor que o lote inteiro
+        assert hasher.hash_many([f'p{i}' for i in range(12)]) == [f'P{i}' for i in range(12)]
+        assert max(peak) <= 2
+        assert hasher.stats()['rejected'] == 0
+    finally:
+        hasher.shutdown()
+
+def test_hash_many_leaves_room_for_single_hashes(monkeypatch):
+    monkeypatch.setattr(password_hasher, 'HASH_BULK_CHUNK', 1)
+    monkeypatch.setattr(password_hasher, '_hashpw_many', lambda passwords: time.sleep(0.05) or passwords)
+    monkeypatch.setattr(password_hasher, '_hashpw', lambda password: password)
+    hasher = PasswordHasher(workers=1, queue_size=2, queue_timeout=0.5, executor='thread')
+    try:
+        worker = threading.Thread(target=hasher.hash_many, args=(['x'] * 20,))
+        worker.start()
+        time.sleep(0.1)
+        # O lote nunca ocupa todas as vagas: um cadastro individual é admitido
+        assert hasher.hash('y') == 'y'
+        worker.join()
+        assert hasher.stats()['rejected'] == 0
+    finally:
+        hasher.shutdown()
+
+def test_hash_many_cancels_submitted_chunks_on_error(monkeypatch):
+    monkeypatch.setattr(password_hasher, 'HASH_BULK_CHUNK', 1)
+    release = threading.Event()
+    monkeypatch.setattr(password_hasher, '_hashpw_many',
+                        lambda passwords: release.wait(5) and passwords)
+    hasher = PasswordHasher(workers=1, queue_size=4, queue_timeout=0.2, executor='thread',
+                            bulk_in_flight=4)
+    try:
+        # Outra operação ocupa o único worker: os blocos do lote ficam na fila
+        blocker = hasher._submit(password_hasher._hashpw_many, ['b'])
+        original_start = hasher._start
+        started = []
+
+        def failing_start(fn, *args):
+            if len(started) == 3:
+                raise RuntimeError('falha ao enviar')
+            future = original_start(fn, *args)
+            started.append(future)
+            return future
+
+        monkeypatch.setattr(hasher, '_start', failing_start)
+        with pytest.raises(RuntimeError):
+            hasher.hash_many(['x'] * 6)
+        # Os blocos que ainda aguardavam na fila foram cancelados
+        assert len(started) == 3
+        assert all(future.cancelled() for future in started)
+        release.set()
+        blocker.result(5)
+        assert hasher.stats()['pending'] == 0
+    finally:
+        release.set()
+        hasher.shutdown()
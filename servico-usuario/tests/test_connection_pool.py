@@ -0,0 +1,55 @@
+"""Reenvio de requisições em conexões reaproveitadas que falham"""
+import socket
+import threading
+import pytest
+import protocol
+from connection_pool import ConnectionPool
+
+@pytest.fixture
+def service():
+    """Serviço que responde a primeira requisição de cada conexão e fecha na segunda"""
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen()
+    received = []
+
+    def handle(conn):
+        with conn:
+            first = True
+            while True:
+                frame = protocol.read_frame(conn)
+                if frame is None:
+                    return
+                received.append(frame[0]['action'])
+                if not first:
+                    return
+                first = False
+                protocol.write_frame(conn, {'success': True})
+
+    def accept():
+        while True:
+            try:
+                conn, _ = listener.accept()
+            except OSError:
+                return
+            threading.Thread(target=handle, args=(conn,), daemon=True).start()
+
+    threading.Thread(target=accept, daemon=True).start()
+    yield listener.getsockname(), received
+    listener.close()
+
+def test_read_only_action_is_retried_on_another_connection(service):
+    (host, port), received = service
+    pool = ConnectionPool(host, port, socket_timeout=2)
+    assert pool.request({'action': 'get_user'})['success']
+    assert pool.request({'action': 'get_user'})['success']
+    assert received == ['get_user', 'get_user', 'get_user']
+    assert pool.stats()['created'] == 2
+
+def test_sent_write_is_not_retried(service):
+    (host, port), received = service
+    pool = ConnectionPool(host, port, socket_timeout=2)
+    assert pool.request({'action': 'get_user'})['success']
+    with pytest.raises(ConnectionResetError):
+        pool.request({'action': 'create_user'})
+    assert received == ['get_user', 'create_user']
@@ -0,0 +1,72 @@
+"""Relay da outbox: reserva do lote, checkpoint e confirmações sem transação aberta"""
+from concurrent.futures import Future
+from datetime import datetime
+import pytest
+from database import new_session, pool_stats
+from models import OutboxMessage
+from outbox_relay import OutboxRelay
+
+class FakePublisher:
+    """Publisher que registra as mensagens e resolve as confirmações pelo resultado dado"""
+
+    def __init__(self, outcomes):
+        self.outcomes = outcomes
+        self.sent = []
+        self.checked_out = []
+
+    def enqueue(self, message, key, traceparent=None):
+        self.sent.append(key)
+        self.checked_out.append(pool_stats()['checked_out'])
+        future = Future()
+        outcome = self.outcomes.get(key, True)
+        if outcome is not None:
+            future.set_result(outcome)
+        return future
+
+@pytest.fixture
+def outbox(user_service, monkeypatch):
+    """Outbox com três mensagens pendentes e o relay do serviço pausado"""
+    monkeypatch.setattr(user_service.outbox_relay, 'relay_batch', lambda: (0, True))
+    monkeypatch.setattr('outbox_relay.OUTBOX_CONFIRM_TIMEOUT', 0.05)
+    db = new_session()
+    try:
+        for key in ('a@email.com', 'b@email.com', 'c@email.com'):
+            db.add(OutboxMessage(key=key, payload='{}', created_at=datetime.utcnow(), attempts=0))
+        db.commit()
+    finally:
+        db.close()
+
+def rows():
+    db = new_session()
+    try:
+        return {m.key: m for m in db.query(OutboxMessage).all()}
+    finally:
+        db.close()
+
+def test_publishes_without_holding_a_connection(outbox):
+    publisher = FakePublisher({})
+    assert OutboxRelay(publisher).relay_batch() == (3, True)
+    assert publisher.checked_out == [0, 0, 0]
+    assert all(m.published_at and m.claimed_until is None for m in rows().values())
+
+def test_checkpoint_releases_rejected_and_unconfirmed(outbox):
+    publisher = FakePublisher({'b@email.com': False, 'c@email.com': None})
+    relay = OutboxRelay(publisher)
+    assert relay.relay_batch() == (3, False)
+    messages = rows()
+    assert messages['a@email.com'].published_at is not None
+    assert messages['b@email.com'].published_at is None
+    assert messages['b@email.com'].attempts == 1
+    assert all(m.claimed_until is None for m in messages.values())
+    assert list(relay.inflight) == [messages['c@email.com'].id]
+
+    # A mensagem sem confirmação não é enfileirada de novo
+    relay.relay_batch()
+    assert publisher.sent.count('c@email.com') == 1
+    assert publisher.sent.count('b@email.com') == 2
+
+def test_claimed_batch_is_skipped_by_other_relays(outbox):
+    first = OutboxRelay(FakePublisher({}))
+    claimed = first.claim_batch()
+    assert len(claimed) == 3
+    assert OutboxRelay(FakePublisher({})).relay_batch() == (0, True)
@@ -0,0 +1,124 @@
+"""Framing com prefixo de tamanho e decodificação do modo legado"""
+import json
+import socket
+import pytest
+import protocol
+
+@pytest.fixture
+def pair():
+    a, b = socket.socketpair()
+    a.settimeout(5)
+    b.settimeout(5)
+    yield a, b
+    a.close()
+    b.close()
+
+def test_frame_round_trip(pair):
+    a, b = pair
+    message = {'action': 'get_user', 'data': {'user_id': 7, 'nome': 'José'}}
+    protocol.write_frame(a, message)
+    assert protocol.read_frame(b) == (message, protocol.ENCODING_JSON, 0)
+
+def test_several_frames_on_one_connection(pair):
+    a, b = pair
+    messages = [{'action': 'stats', 'n': i} for i in range(3)]
+    a.sendall(b''.join(protocol.encode_frame(m) for m in messages))
+    assert [protocol.read_frame(b)[0] for _ in messages] == messages
+
+def test_read_frame_returns_none_between_frames(pair):
+    a, b = pair
+    a.close()
+    assert protocol.read_frame(b) is None
+
+def test_connection_closed_mid_frame(pair):
+    a, b = pair
+    a.sendall(protocol.encode_frame({'action': 'stats'})[:-3])
+    a.close()
+    with pytest.raises(protocol.ProtocolError):
+        protocol.read_frame(b)
+
+def test_header_with_prefix_already_read(pair):
+    a, b = pair
+    frame = protocol.encode_frame({'ok': True})
+    a.sendall(frame[2:])
+    assert protocol.read_frame(b, frame[:2])[0] == {'ok': True}
+
+def test_split_frame_partial_and_rest():
+    first = protocol.encode_frame({'n': 1})
+    second = protocol.encode_frame({'n': 2}, flags=protocol.FLAG_STREAM)
+    data = bytearray(first + second[:5])
+    assert protocol.split_frame(data[:protocol.HEADER.size - 1]) is None
+    assert protocol.split_frame(data[:len(first) - 1]) is None
+    payload, encoding, flags, rest = protocol.split_frame(data)
+    assert json.loads(payload) == {'n': 1}
+    assert (encoding, flags) == (protocol.ENCODING_JSON, 0)
+    assert rest == second[:5]
+    payload, _, flags, rest = protocol.split_frame(rest + second[5:])
+    assert json.loads(payload) == {'n': 2}
+    assert flags == protocol.FLAG_STREAM
+    assert rest == b''
+
+@pytest.mark.parametrize('header, error', [
+    (protocol.HEADER.pack(b'XX', protocol.VERSION, 0, 0, 2), 'Cabeçalho inválido'),
+    (protocol.HEADER.pack(protocol.MAGIC, 9, 0, 0, 2), 'Versão'),
+    (protocol.HEADER.pack(protocol.MAGIC, protocol.VERSION, 0, 0, protocol.MAX_FRAME_SIZE + 1),
+     'tamanho máximo'),
+])
+def test_invalid_header(header, error):
+    with pytest.raises(protocol.ProtocolError, match=error):
+        protocol.parse_header(header)
+
+def test_encode_rejects_oversized_payload(monkeypatch):
+    monkeypatch.setattr(protocol, 'MAX_FRAME_SIZE', 16)
+    with pytest.raises(protocol.ProtocolError):
+        protocol.encode_frame({'name': 'x' * 32})
+
+def test_stream_frames_end_with_summary(pair):
+    a, b = pair
+    stream = protocol.StreamResponse(chunk for chunk in (b'{"id": 1}\n', b'{"id": 2}\n'))
+    stream.summary = {'success': True, 'count': 2}
+    protocol.write_stream(a, stream)
+    frames = [protocol.read_frame(b) for _ in range(3)]
+    assert [f[0] for f in frames[:2]] == [[{'id': 1}], [{'id': 2}]]
+    assert all(f[2] & protocol.FLAG_STREAM for f in frames[:2])
+    assert frames[2] == ({'success': True, 'count': 2}, protocol.ENCODING_JSON, 0)
+
+def test_legacy_request(pair):
+    a, b = pair
+    a.sendall(b'{"action": "get_user", "data": {"user_id": 1}}')
+    assert protocol.read_legacy(b) == {'action': 'get_user', 'data': {'user_id': 1}}
+
+def test_legacy_request_multiple_of_recv_buffer(pair):
+    # Payload com tamanho múltiplo de 4096 não pode travar a leitura
+    a, b = pair
+    message = {'action': 'create_user', 'data': {'name': ''}}
+    filler = protocol.RECV_BUFFER * 3 - len(json.dumps(message))
+    message['data']['name'] = 'x' * filler
+    encoded = json.dumps(message).encode('utf-8')
+    assert len(encoded) % protocol.RECV_BUFFER == 0
+    a.sendall(encoded)
+    assert protocol.read_legacy(b) == message
+
+def test_legacy_request_split_across_sends(pair):
+    a, b = pair
+    a.sendall(b'{"action": "st')
+    a.sendall(b'ats", "data": {}}')
+    assert protocol.read_legacy(b) == {'action': 'stats', 'data': {}}
+
+def test_legacy_incomplete_request(pair):
+    a, b = pair
+    a.sendall(b'{"action": "stats"')
+    a.close()
+    with pytest.raises(protocol.ProtocolError):
+        protocol.read_legacy(b)
+
+def test_legacy_connection_closed_without_data(pair):
+    a, b = pair
+    a.close()
+    assert protocol.read_legacy(b) is None
+
+def test_try_decode_legacy():
+    assert protocol.try_decode_legacy(b'{"a": {"b": 1}}  \n') == {'a': {'b': 1}}
+    # Termina em '}' mas ainda não é um documento completo
+    assert protocol.try_decode_legacy(b'{"a": {"b": 1}') is None
+    assert protocol.try_decode_legacy(b'{"a": 1') is None
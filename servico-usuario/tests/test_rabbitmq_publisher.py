@@ -0,0 +1,69 @@
+"""Publicação em lote com publisher confirms (conexão e canal simulados)"""
+from concurrent.futures import Future
+from types import SimpleNamespace
+import pika
+from rabbitmq_publisher import PublishWorker
+
+class FakeConnection:
+    """Entrega os acks/nacks programados ao processar eventos"""
+
+    def __init__(self, worker, confirms):
+        self.worker = worker
+        self.confirms = confirms
+        self.waits = 0
+
+    def process_data_events(self, time_limit=0):
+        self.waits += 1
+        while self.confirms:
+            method = self.confirms.pop(0)
+            self.worker._on_confirm(SimpleNamespace(method=method))
+
+class FakeChannel:
+    def __init__(self, fail_at=None):
+        self.published = []
+        self.fail_at = fail_at
+
+    def basic_publish(self, exchange, routing_key, body, properties):
+        if len(self.published) == self.fail_at:
+            raise ConnectionResetError('conexão perdida')
+        self.published.append(body)
+
+def worker_with(confirms, fail_at=None):
+    config = SimpleNamespace(exchange='notificacoes_exchange', routing_key='sd/notificacoes')
+    worker = PublishWorker(config, 0, queue_size=100, batch_size=10, overflow='drop_oldest')
+    worker.channel = FakeChannel(fail_at)
+    worker.connection = FakeConnection(worker, confirms)
+    return worker
+
+def batch(size):
+    return [({'n': n}, Future(), None) for n in range(size)]
+
+def test_publishes_whole_batch_and_waits_once():
+    worker = worker_with([pika.spec.Basic.Ack(delivery_tag=4, multiple=True)])
+    items = batch(4)
+    worker._publish_batch(items)
+    assert len(worker.channel.published) == 4
+    assert worker.connection.waits == 1
+    assert [future.result() for _, future, _ in items] == [True] * 4
+    assert worker.confirmed == 4 and not worker.queue
+
+def test_requeues_only_unacked_messages(monkeypatch):
+    monkeypatch.setattr('rabbitmq_publisher.PUBLISH_CONFIRM_TIMEOUT', 0.05)
+    worker = worker_with([
+        pika.spec.Basic.Ack(delivery_tag=2, multiple=True),
+        pika.spec.Basic.Nack(delivery_tag=3, multiple=False),
+    ])
+    items = batch(5)
+    worker._publish_batch(items)
+    assert [items[i][1].result() for i in range(3)] == [True, True, False]
+    assert [payload['n'] for payload, _, _ in worker.queue] == [3, 4]
+    assert not items[3][1].done()
+    assert (worker.confirmed, worker.failed) == (2, 1)
+
+def test_connection_loss_requeues_unacked_and_unpublished():
+    worker = worker_with([], fail_at=2)
+    items = batch(4)
+    worker._publish_batch(items)
+    assert worker.connection is None
+    assert [payload['n'] for payload, _, _ in worker.queue] == [0, 1, 2, 3]
+    assert not worker.unconfirmed
@@ -0,0 +1,85 @@
+"""Verificação local de JWT, cache e revogação de tokens"""
+import time
+import jwt
+import pytest
+from token_cache import TokenVerifier
+
+KEY = 'chave-de-teste'
+
+def make_token(user_id=1, ttl=60, key=KEY, iat=None):
+    now = int(time.time()) if iat is None else iat
+    return jwt.encode({'user_id': user_id, 'role': 'paciente', 'iat': now, 'exp': now + ttl},
+                      key, algorithm='HS256')
+
+@pytest.fixture
+def verifier():
+    return TokenVerifier([KEY])
+
+def test_verify_caches_valid_token(verifier):
+    token = make_token()
+    assert verifier.verify(token)['user_id'] == 1
+    assert verifier.verify(token)['user_id'] == 1
+    stats = verifier.stats()
+    assert (stats['hits'], stats['misses'], stats['size']) == (1, 1, 1)
+
+def test_invalid_and_expired_tokens(verifier):
+    assert verifier.verify(make_token(key='outra-chave')) is None
+    assert verifier.verify(make_token(ttl=-10)) is None
+    assert verifier.stats()['size'] == 0
+
+def test_previous_key_still_accepted():
+    verifier = TokenVerifier([KEY, 'chave-antiga'])
+    assert verifier.verify(make_token(key='chave-antiga')) is not None
+
+def test_revoked_token_is_denied_until_exp(verifier):
+    token = make_token()
+    assert verifier.verify(token) is not None
+    verifier.revoke_token(token)
+    # Nem o cache nem um novo decode aceitam o token revogado
+    assert verifier.verify(token) is None
+    assert verifier.verify(token) is None
+    stats = verifier.stats()
+    assert (stats['size'], stats['revoked'], stats['revoked_tokens']) == (0, 1, 1)
+    # Outros tokens do mesmo usuário continuam válidos
+    assert verifier.verify(make_token(ttl=120)) is not None
+
+def test_revoked_token_leaves_denylist_after_exp(verifier):
+    token = make_token(ttl=1)
+    verifier.revoke_token(token)
+    time.sleep(2.1)
+    assert verifier.verify(token) is None
+    assert verifier.stats()['revoked_tokens'] == 0
+
+def test_revoke_token_not_cached_yet(verifier):
+    token = make_token()
+    verifier.revoke_token(token)
+    assert verifier.verify(token) is None
+
+def test_revoke_user_only_affects_tokens_issued_before(verifier):
+    old = make_token()
+    assert verifier.verify(old) is not None
+    verifier.revoke_user(1)
+    assert verifier.verify(old) is None
+    assert verifier.verify(make_token(user_id=2)) is not None
+    # iat tem resolução de segundos: o próximo token é emitido após a revogação
+    time.sleep(1.1)
+    assert verifier.verify(make_token()) is not None
+
+def test_expired_entry_leaves_cache(verifier):
+    token = make_token(ttl=1)
+    assert verifier.verify(token) is not None
+    time.sleep(2.1)
+    assert verifier.verify(token) is None
+    assert verifier.stats()['expired'] == 1
+
+def test_remote_fallback_without_local_key():
+    calls = []
+
+    def fallback(token):
+        calls.append(token)
+        return {'user_id': 2, 'exp': time.time() + 60}
+
+    verifier = TokenVerifier([])
+    assert verifier.verify('opaco', fallback=fallback)['user_id'] == 2
+    assert verifier.verify('opaco', fallback=fallback)['user_id'] == 2
+    assert calls == ['opaco']
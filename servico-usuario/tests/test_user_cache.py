@@ -0,0 +1,137 @@
+"""Cache de usuários: invalidação, gerações e índices por email/CPF"""
+import pytest
+import json
+import protocol
+from user_cache import UserCache, UserFragmentCache
+
+def user(user_id, name='Maria', updated_at='2025-01-01T10:00:00'):
+    return {
+        'id': user_id,
+        'name': name,
+        'email': f'usuario{user_id}@email.com',
+        'cpf': f'{user_id:011d}',
+        'updated_at': updated_at
+    }
+
+@pytest.fixture
+def cache():
+    return UserCache(max_size=3, ttl=60)
+
+def test_put_and_get(cache):
+    cache.put(user(1), cache.generation)
+    assert cache.get(1)['name'] == 'Maria'
+    assert cache.get(2) is None
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses']) == (1, 1)
+
+def test_find_id_by_email_and_cpf(cache):
+    cache.put(user(1), cache.generation)
+    assert cache.find_id(email='usuario1@email.com') == 1
+    assert cache.find_id(cpf='00000000001') == 1
+    assert cache.find_id(email='outro@email.com') is None
+
+def test_invalidate_removes_user_and_indexes(cache):
+    cache.put(user(1), cache.generation)
+    cache.invalidate(1)
+    assert cache.get(1) is None
+    assert cache.find_id(email='usuario1@email.com') is None
+    assert cache.stats()['invalidations'] == 1
+
+def test_read_started_before_invalidation_is_not_stored(cache):
+    # A leitura do banco começou antes da alteração: o resultado é antigo
+    generation = cache.generation
+    cache.invalidate(1)
+    cache.put(user(1, 'Antigo'), generation)
+    assert cache.get(1) is None
+    cache.put(user(1, 'Novo'), cache.generation)
+    assert cache.get(1)['name'] == 'Novo'
+
+def test_clear_bumps_generation(cache):
+    cache.put(user(1), cache.generation)
+    generation = cache.generation
+    cache.clear()
+    assert cache.get(1) is None
+    cache.put(user(2), generation)
+    assert cache.get(2) is None
+
+def test_remote_invalidation_counted_separately(cache):
+    cache.put(user(1), cache.generation)
+    cache.invalidate(1, remote=True)
+    assert cache.get(1) is None
+    stats = cache.stats()
+    assert (stats['invalidations'], stats['remote_invalidations']) == (0, 1)
+
+def test_lru_eviction_keeps_indexes_consistent(cache):
+    for user_id in (1, 2, 3):
+        cache.put(user(user_id), cache.generation)
+    cache.get(1)  # 2 passa a ser o menos usado
+    cache.put(user(4), cache.generation)
+    assert cache.get(2) is None
+    assert cache.find_id(email='usuario2@email.com') is None
+    assert cache.get(1) is not None
+    assert cache.stats()['evictions'] == 1
+
+def test_email_change_updates_index(cache):
+    cache.put(user(1), cache.generation)
+    changed = dict(user(1), email='novo@email.com')
+    cache.put(changed, cache.generation)
+    assert cache.find_id(email='novo@email.com') == 1
+    assert cache.find_id(email='usuario1@email.com') is None
+
+def test_ttl_expiration():
+    cache = UserCache(ttl=0)
+    cache.put(user(1), cache.generation)
+    assert cache.get(1) is None
+    assert cache.stats()['expirations'] == 1
+
+def test_fragment_lookup_by_version():
+    fragments = UserFragmentCache()
+    stored = fragments.put(user(1), fragments.generation)
+    assert json.loads(stored[1]) == user(1)
+    assert fragments.get(1, '2025-01-01T10:00:00') == stored
+    # Outra versão (updated_at) é um miss
+    assert fragments.get(1, '2025-01-02T10:00:00') is None
+    assert fragments.get(2, '2025-01-01T10:00:00') is None
+    stats = fragments.stats()
+    assert (stats['hits'], stats['stale'], stats['misses']) == (1, 1, 1)
+
+def test_fragment_ttl_expiration():
+    fragments = UserFragmentCache(ttl=0)
+    fragments.put(user(1), fragments.generation)
+    assert fragments.get(1, '2025-01-01T10:00:00') is None
+    stats = fragments.stats()
+    assert (stats['size'], stats['expirations'], stats['misses']) == (0, 1, 1)
+
+def test_fragment_older_version_does_not_replace_newer():
+    fragments = UserFragmentCache()
+    fragments.put(user(1, 'Novo', '2025-01-02T10:00:00'), fragments.generation)
+    fragments.put(user(1, 'Antigo', '2025-01-01T10:00:00'), fragments.generation)
+    assert fragments.get(1, '2025-01-02T10:00:00')[0]['name'] == 'Novo'
+
+def test_fragment_store_skipped_after_invalidation():
+    fragments = UserFragmentCache()
+    generation = fragments.generation
+    fragments.invalidate(1)
+    returned = fragments.store([user(1), user(2)], generation)
+    # Os fragmentos são devolvidos para a resposta, mas não ficam em cache
+    assert [u['id'] for u, _ in returned] == [1, 2]
+    assert fragments.stats()['size'] == 0
+
+def test_fragments_assemble_the_same_json():
+    fragments = UserFragmentCache()
+    found = fragments.store([user(1), user(2)], fragments.generation)
+    response = protocol.PreEncoded({'success': True, 'count': 2}, 'users', found)
+    assert json.loads(protocol.encode_payload(response)) == response.to_dict()
+    assert response.to_dict()['users'] == [user(1), user(2)]
+    single = protocol.PreEncoded({'success': True}, 'user', found[:1], many=False)
+    assert json.loads(protocol.encode_payload(single)) == {'success': True, 'user': user(1)}
+
+def test_invalidation_propagates_to_fragments():
+    fragments = UserFragmentCache()
+    cache = UserCache(fragments=fragments)
+    fragments.put(user(1), fragments.generation)
+    cache.invalidate(1)
+    assert fragments.get(1, '2025-01-01T10:00:00') is None
+    fragments.put(user(2), fragments.generation)
+    cache.clear()
+    assert fragments.get(2, '2025-01-01T10:00:00') is None
@@ -0,0 +1,273 @@
+"""
+Servidor com pool de threads limitado para o Serviço de Usuários
+Um laço de eventos (selectors) aceita conexões e lê os bytes sem
+bloquear; só requisições completas (frame inteiro ou JSON legado
+completo) são enfileiradas para um pool de workers de tamanho fixo, de
+modo que clientes lentos não ocupam workers. Com a fila cheia ou o prazo
+de espera esgotado, a requisição recebe uma resposta de sobrecarga.
+"""
+import os
+import queue
+import selectors
+import socket
+import threading
+import time
+import protocol
+from worker_pool import (BoundedWorkerPool, overloaded_response,
+                         WORKER_POOL_SIZE, WORKER_QUEUE_SIZE, QUEUE_DEADLINE)
+
+# Tamanho da fila de conexões pendentes do socket de escuta
+LISTEN_BACKLOG = int(os.getenv('LISTEN_BACKLOG', 128))
+
+class ClientConnection:
+    """Estado de uma conexão de cliente"""
+
+    def __init__(self, sock, address):
+        self.sock = sock
+        self.address = address
+        self.framed = None  # definido pelos primeiros bytes recebidos
+        self.encoding = protocol.ENCODING_JSON
+        self.buffer = bytearray()  # bytes recebidos ainda não atendidos
+        self.last_activity = time.monotonic()
+
+class ThreadedUserServer:
+    """Servidor socket com pool de workers limitado e controle de admissão"""
+
+    def __init__(self, service, host, port, workers=WORKER_POOL_SIZE,
+                 queue_size=WORKER_QUEUE_SIZE, queue_deadline=QUEUE_DEADLINE):
+        self.service = service
+        self.host = host
+        self.port = port
+        self.pool = BoundedWorkerPool(workers, queue_size, queue_deadline, name='user-worker')
+        self.selector = selectors.DefaultSelector()
+        self.idle = {}
+        self.rearm_queue = queue.SimpleQueue()
+        self.wakeup_r, self.wakeup_w = socket.socketpair()
+        self.wakeup_w.setblocking(False)
+        self.lock = threading.Lock()
+        self.connections = 0
+
+    def next_request(self, conn):
+        """
+        Extrai do buffer a próxima requisição completa (None se ainda falta
+        chegar algo). Frames são devolvidos como payload, decodificado pelo
+        worker; no modo legado, o JSON já decodificado.
+        """
+        if conn.framed is None:
+            # Os primeiros bytes identificam o modo do protocolo
+            if len(conn.buffer) < len(protocol.MAGIC):
+                return None
+            conn.framed = conn.buffer[:len(protocol.MAGIC)] == protocol.MAGIC
+
+        if not conn.framed:
+            if len(conn.buffer) > protocol.MAX_FRAME_SIZE:
+                raise protocol.ProtocolError('Requisição excede o tamanho máximo')
+            return protocol.try_decode_legacy(bytes(conn.buffer))
+
+        frame = protocol.split_frame(conn.buffer)
+        if frame is None:
+            return None
+        payload, conn.encoding, _, conn.buffer = frame
+        return payload
+
+    def write_response(self, conn, response):
+        """Envia a resposta no modo da conexão"""
+        if isinstance(response, protocol.StreamResponse):
+            if conn.framed:
+                protocol.write_stream(conn.sock, response, conn.encoding)
+                return
+            response.close()
+            response = protocol.STREAM_UNSUPPORTED
+        if conn.framed:
+            protocol.write_frame(conn.sock, response, conn.encoding)
+        else:
+            protocol.write_legacy(conn.sock, response)
+
+    def process(self, conn, request, handler):
+        """Executa `handler` para a requisição e devolve a conexão ao laço"""
+        keep_open = False
+        try:
+            # Só a escrita da resposta pode bloquear o worker
+            conn.sock.settimeout(protocol.CONNECTION_IDLE_TIMEOUT)
+            if conn.framed:
+                request_data = protocol.decode_payload(request, conn.encoding)
+            else:
+                request_data = request
+
+            print(f"Requisição recebida: {request_data.get('action')}")
+            try:
+                response = handler(request_data)
+            except Exception as e:
+                print(f"Erro ao processar requisição de {conn.address}: {e}")
+                response = {'success': False, 'message': str(e)}
+
+            self.write_response(conn, response)
+            # Conexões legadas atendem uma única requisição
+            keep_open = conn.framed
+        except socket.timeout:
+            print(f"Conexão encerrada (cliente não leu a resposta): {conn.address}")
+        except Exception as e:
+            print(f"Erro ao processar requisição de {conn.address}: {e}")
+            try:
+                self.write_response(conn, {'success': False, 'message': str(e)})
+            except OSError:
+                pass
+        finally:
+            if keep_open:
+                self.rearm(conn)
+            else:
+                self.close(conn)
+
+    def serve_request(self, conn, request):
+        """Atende a requisição lida da conexão"""
+        self.process(conn, request, self.service.handle_request)
+
+    def shed_request(self, conn, request):
+        """Responde com sobrecarga a uma requisição que expirou na fila"""
+        self.process(conn, request, lambda request_data: overloaded_response())
+
+    def rearm(self, conn):
+        """Devolve a conexão ao laço de eventos para a próxima requisição"""
+        conn.last_activity = time.monotonic()
+        self.rearm_queue.put(conn)
+        try:
+            self.wakeup_w.send(b'\0')
+        except BlockingIOError:
+            pass
+
+    def close(self, conn):
+        """Encerra a conexão"""
+        try:
+            conn.sock.close()
+        except OSError:
+            pass
+        with self.lock:
+            self.connections -= 1
+
+    def reply_and_close(self, conn, response):
+        """Responde sem bloquear o laço (melhor esforço) e encerra a conexão"""
+        try:
+            if conn.framed:
+                conn.sock.send(protocol.encode_frame(response, conn.encoding))
+            else:
+                conn.sock.send(protocol.encode_payload(response))
+        except OSError:
+            pass
+        finally:
+            self.close(conn)
+
+    def watch(self, conn):
+        """Registra a conexão no seletor aguardando a próxima requisição"""
+        conn.sock.setblocking(False)
+        self.idle[conn.sock] = conn
+        self.selector.register(conn.sock, selectors.EVENT_READ, conn)
+        # Requisições enviadas em sequência podem já estar no buffer
+        if conn.buffer:
+            self.try_dispatch(conn)
+
+    def unwatch(self, conn):
+        self.selector.unregister(conn.sock)
+        del self.idle[conn.sock]
+
+    def receive(self, conn):
+        """Lê os bytes disponíveis da conexão sem bloquear"""
+        try:
+            chunk = conn.sock.recv(protocol.RECV_BUFFER * 16)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            print(f"Erro ao ler de {conn.address}: {e}")
+            chunk = b''
+        if not chunk:
+            self.unwatch(conn)
+            if conn.buffer and conn.framed is False:
+                self.reply_and_close(conn, {
+                    'success': False, 'message': 'Requisição JSON incompleta ou inválida'
+                })
+            else:
+                self.close(conn)
+            return
+        conn.buffer += chunk
+        conn.last_activity = time.monotonic()
+        self.try_dispatch(conn)
+
+    def try_dispatch(self, conn):
+        """Envia a conexão ao pool de workers se houver uma requisição completa"""
+        try:
+            request = self.next_request(conn)
+        except protocol.ProtocolError as e:
+            print(f"Erro de protocolo de {conn.address}: {e}")
+            self.unwatch(conn)
+            self.reply_and_close(conn, {'success': False, 'message': str(e)})
+            return
+        if request is None:
+            return
+        self.unwatch(conn)
+        if not self.pool.submit(self.serve_request, conn, request, on_expired=self.shed_request):
+            # Fila cheia: responde com sobrecarga sem ocupar um worker
+            self.reply_and_close(conn, overloaded_response())
+
+    def accept(self, server_socket):
+        """Aceita uma nova conexão"""
+        client_socket, address = server_socket.accept()
+        print(f"Nova conexão de {address}")
+        with self.lock:
+            self.connections += 1
+        self.watch(ClientConnection(client_socket, address))
+
+    def drain_rearmed(self):
+        """Registra novamente as conexões devolvidas pelos workers"""
+        try:
+            while self.wakeup_r.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+        while not self.rearm_queue.empty():
+            self.watch(self.rearm_queue.get())
+
+    def close_idle(self):
+        """Encerra conexões ociosas além do tempo limite"""
+        limit = time.monotonic() - protocol.CONNECTION_IDLE_TIMEOUT
+        for conn in [c for c in self.idle.values() if c.last_activity < limit]:
+            self.selector.unregister(conn.sock)
+            del self.idle[conn.sock]
+            print(f"Conexão ociosa encerrada: {conn.address}")
+            self.close(conn)
+
+    def stats(self):
+        """Retorna profundidade da fila, descartes e conexões abertas"""
+        stats = self.pool.stats()
+        with self.lock:
+            stats['connections'] = self.connections
+        stats['idle_connections'] = len(self.idle)
+        stats['engine'] = 'threads'
+        return stats
+
+    def serve_forever(self):
+        """Abre o socket e atende conexões"""
+        server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server_socket.bind((self.host, self.port))
+        server_socket.listen(LISTEN_BACKLOG)
+
+        self.wakeup_r.setblocking(False)
+        self.selector.register(server_socket, selectors.EVENT_READ, None)
+        self.selector.register(self.wakeup_r, selectors.EVENT_READ, self.wakeup_r)
+
+        print(f"Servidor rodando em {self.host}:{self.port} "
+              f"(workers={self.pool.workers}, fila={self.pool.queue_size})")
+        print("Aguardando conexões...")
+
+        try:
+            while True:
+                for key, _ in self.selector.select(timeout=1.0):
+                    if key.data is None:
+                        self.accept(server_socket)
+                    elif key.data is self.wakeup_r:
+                        self.drain_rearmed()
+                    else:
+                        self.receive(key.data)
+                self.close_idle()
+        finally:
+            self.selector.close()
+            server_socket.close()
@@ -0,0 +1,181 @@
+"""
+Verificação local de tokens JWT com cache na interface REST
+Tokens HS256 são verificados com a chave compartilhada (JWT_SECRET_KEY),
+sem ida ao serviço. Payloads verificados ficam em um cache LRU limitado
+e saem do cache no instante do `exp` ou quando revogados; tokens revogados
+ficam em uma lista de bloqueio até o próprio `exp`.
+"""
+import os
+import heapq
+import threading
+import time
+from collections import OrderedDict
+import jwt
+
+# Número máximo de tokens verificados mantidos em cache
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', 10000))
+# Validade máxima dos tokens emitidos pelo serviço (usada nas revogações)
+TOKEN_MAX_AGE = int(os.getenv('TOKEN_MAX_AGE', 24 * 3600))
+
+def load_keys():
+    """
+    Carrega as chaves de verificação da configuração.
+    JWT_SECRET_KEY é a chave atual; JWT_PREVIOUS_KEYS (separadas por vírgula)
+    mantém tokens assinados com chaves antigas válidos durante uma rotação.
+    """
+    keys = []
+    current = os.getenv('JWT_SECRET_KEY')
+    if current:
+        keys.append(current)
+    previous = os.getenv('JWT_PREVIOUS_KEYS', '')
+    keys.extend(key.strip() for key in previous.split(',') if key.strip())
+    return keys
+
+class TokenVerifier:
+    """Verifica tokens HS256 localmente e memoiza os payloads válidos"""
+
+    def __init__(self, keys, max_size=TOKEN_CACHE_SIZE):
+        self.keys = keys
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.expirations = []  # heap de (exp, token)
+        self.revoked_users = {}  # user_id -> (revogado_em, válido_até)
+        self.revoked_tokens = {}  # token -> exp (bloqueado até expirar)
+        self.revocation_expirations = []  # heap de (exp, token) dos bloqueados
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+        self.revoked = 0
+
+    @property
+    def local(self):
+        """Indica se há chave para verificação local"""
+        return bool(self.keys)
+
+    def decode(self, token):
+        """Decodifica o token com as chaves configuradas (None se inválido)"""
+        for key in self.keys:
+            try:
+                return jwt.decode(token, key, algorithms=['HS256'])
+            except jwt.ExpiredSignatureError:
+                return None
+            except jwt.InvalidTokenError:
+                continue
+        return None
+
+    def verify(self, token, fallback=None):
+        """
+        Retorna o payload do token ou None.
+        Sem chave local, usa `fallback(token)` (ex.: ação verify_token do serviço).
+        """
+        now = time.time()
+        with self.lock:
+            self._purge_expired(now)
+            if token in self.revoked_tokens:
+                return None
+            entry = self.entries.get(token)
+            if entry is not None:
+                self.entries.move_to_end(token)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        if self.local:
+            payload = self.decode(token)
+        elif fallback:
+            payload = fallback(token)
+        else:
+            payload = None
+
+        if not payload or self._is_revoked(payload, now):
+            return None
+        self._store(token, payload, now)
+        return payload
+
+    def _store(self, token, payload, now):
+        exp = payload.get('exp')
+        if not isinstance(exp, (int, float)) or exp <= now:
+            return
+        with self.lock:
+            self.entries[token] = payload
+            self.entries.move_to_end(token)
+            heapq.heappush(self.expirations, (exp, token))
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def _purge_expired(self, now):
+        """Remove do cache os tokens cujo `exp` já passou"""
+        while self.expirations and self.expirations[0][0] <= now:
+            exp, token = heapq.heappop(self.expirations)
+            entry = self.entries.get(token)
+            if entry is not None and entry.get('exp') == exp:
+                del self.entries[token]
+                self.expired += 1
+        # O heap pode acumular itens de tokens já despejados pelo LRU
+        if len(self.expirations) > 2 * self.max_size:
+            self.expirations = [(e, t) for e, t in self.expirations if t in self.entries]
+            heapq.heapify(self.expirations)
+        # Token expirado já é recusado pelo decode: sai da lista de bloqueio
+        while self.revocation_expirations and self.revocation_expirations[0][0] <= now:
+            exp, token = heapq.heappop(self.revocation_expirations)
+            if self.revoked_tokens.get(token) == exp:
+                del self.revoked_tokens[token]
+
+    def _is_revoked(self, payload, now):
+        with self.lock:
+            revocation = self.revoked_users.get(payload.get('user_id'))
+            if revocation is None:
+                return False
+            revoked_at, valid_until = revocation
+            if now > valid_until:
+                del self.revoked_users[payload.get('user_id')]
+                return False
+        # Tokens emitidos após a revogação continuam válidos
+        return payload.get('iat', 0) <= revoked_at
+
+    def revoke_token(self, token):
+        """Remove um token do cache e o bloqueia até o seu `exp`"""
+        now = time.time()
+        try:
+            exp = jwt.decode(token, options={'verify_signature': False}).get('exp')
+        except jwt.InvalidTokenError:
+            exp = None
+        if not isinstance(exp, (int, float)):
+            exp = now + TOKEN_MAX_AGE
+        if exp <= now:
+            return
+        with self.lock:
+            self.entries.pop(token, None)
+            if token not in self.revoked_tokens:
+                self.revoked += 1
+            self.revoked_tokens[token] = exp
+            heapq.heappush(self.revocation_expirations, (exp, token))
+
+    def revoke_user(self, user_id):
+        """Invalida todos os tokens já emitidos para o usuário"""
+        now = time.time()
+        with self.lock:
+            self.revoked_users[user_id] = (now, now + TOKEN_MAX_AGE)
+            tokens = [t for t, p in self.entries.items() if p.get('user_id') == user_id]
+            for token in tokens:
+                del self.entries[token]
+            self.revoked += len(tokens)
+
+    def stats(self):
+        """Retorna contadores do cache de tokens"""
+        with self.lock:
+            return {
+                'mode': 'local' if self.local else 'remote',
+                'size': len(self.entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expired': self.expired,
+                'revoked': self.revoked,
+                'revoked_users': len(self.revoked_users),
+                'revoked_tokens': len(self.revoked_tokens)
+            }
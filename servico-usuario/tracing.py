@@ -0,0 +1,212 @@
+"""
+Rastreamento distribuído entre interface REST, serviço e RabbitMQ
+O contexto segue o formato W3C traceparent (00-<trace_id>-<span_id>-<flags>)
+e viaja no envelope da requisição socket (campo 'traceparent') e nos headers
+AMQP das notificações. Os spans finalizados são gravados em JSON Lines por
+uma thread própria; com TRACE_EXPORTER=none nada é criado nem propagado.
+"""
+import contextvars
+import json
+import os
+import queue
+import random
+import secrets
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# Destino dos spans: 'none' (padrão, desativado), 'file' ou 'stdout'
+TRACE_EXPORTER = os.getenv('TRACE_EXPORTER', 'none')
+# Arquivo JSON Lines com os spans (TRACE_EXPORTER=file)
+TRACE_FILE = os.getenv('TRACE_FILE', 'traces.jsonl')
+# Nome do processo gravado em cada span
+TRACE_SERVICE_NAME = os.getenv('TRACE_SERVICE_NAME', 'servico-usuario')
+# Fração dos traces iniciados aqui que são gravados (0 a 1)
+TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', 1))
+# Spans aguardando gravação; com a fila cheia são descartados
+TRACE_QUEUE_SIZE = int(os.getenv('TRACE_QUEUE_SIZE', 10000))
+
+current_span = contextvars.ContextVar('current_span', default=None)
+
+def parse_traceparent(value):
+    """Retorna (trace_id, span_id, sampled) ou None se o valor for inválido"""
+    if not isinstance(value, str):
+        return None
+    parts = value.split('-')
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16)
+        flags = int(parts[3], 16)
+    except ValueError:
+        return None
+    return parts[1], parts[2], bool(flags & 1)
+
+class Span:
+    """Trecho de um trace com início, duração, atributos e erro"""
+
+    def __init__(self, tracer, name, trace_id, parent_id, sampled, attributes):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.attributes = attributes
+        self.error = None
+        self.start = time.time()
+        self.started = time.perf_counter()
+        self.ended = False
+
+    def set(self, key, value):
+        self.attributes[key] = value
+
+    def traceparent(self):
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def end(self, error=None):
+        if self.ended:
+            return
+        self.ended = True
+        if error is not None:
+            self.error = str(error)
+        if self.sampled:
+            self.tracer.export(self, time.perf_counter() - self.started)
+
+class NoopSpan:
+    """Span usado com o rastreamento desativado"""
+
+    def set(self, key, value):
+        pass
+
+    def traceparent(self):
+        return None
+
+    def end(self, error=None):
+        pass
+
+NOOP_SPAN = NoopSpan()
+
+class Tracer:
+    """Cria spans, mantém o span atual da thread e exporta os finalizados"""
+
+    def __init__(self, service_name=TRACE_SERVICE_NAME, exporter=TRACE_EXPORTER):
+        self.service_name = service_name
+        self.exporter = exporter
+        self.enabled = exporter != 'none'
+        self.queue = queue.Queue(TRACE_QUEUE_SIZE)
+        self.thread = None
+        self.lock = threading.Lock()
+        # Métricas
+        self.exported = 0
+        self.dropped = 0
+
+    def start_span(self, name, parent=None, **attributes):
+        """
+        Inicia um span filho de `parent` (traceparent ou Span) ou, sem ele,
+        do span atual da thread; sem nenhum dos dois, inicia um trace novo.
+        """
+        if not self.enabled:
+            return NOOP_SPAN
+        if parent is None:
+            parent = current_span.get()
+        if isinstance(parent, Span):
+            context = (parent.trace_id, parent.span_id, parent.sampled)
+        else:
+            context = parse_traceparent(parent)
+        if context is None:
+            context = (secrets.token_hex(16), None, random.random() < TRACE_SAMPLE_RATE)
+        trace_id, parent_id, sampled = context
+        return Span(self, name, trace_id, parent_id, sampled, attributes)
+
+    def child_span(self, name, **attributes):
+        """Span filho do atual; None fora de um trace (ex.: threads de fundo)"""
+        parent = current_span.get()
+        if parent is None:
+            return None
+        return self.start_span(name, parent, **attributes)
+
+    def activate(self, span):
+        """Torna o span o atual da thread; retorna o token para deactivate()"""
+        return current_span.set(span) if isinstance(span, Span) else None
+
+    def deactivate(self, token):
+        if token is not None:
+            current_span.reset(token)
+
+    @contextmanager
+    def span(self, name, parent=None, **attributes):
+        """Executa o bloco dentro de um span; uma exceção fica registrada como erro"""
+        span = self.start_span(name, parent, **attributes)
+        token = self.activate(span)
+        try:
+            yield span
+        except Exception as e:
+            span.end(error=e)
+            raise
+        finally:
+            span.end()
+            self.deactivate(token)
+
+    def current_traceparent(self):
+        """Contexto a propagar a partir do span atual (None fora de um trace)"""
+        span = current_span.get()
+        return span.traceparent() if span is not None else None
+
+    def export(self, span, duration):
+        record = {
+            'trace_id': span.trace_id,
+            'span_id': span.span_id,
+            'parent_id': span.parent_id,
+            'name': span.name,
+            'service': self.service_name,
+            'start': round(span.start, 6),
+            'duration_ms': round(duration * 1000, 3),
+            'attributes': span.attributes,
+            'error': span.error
+        }
+        self.start()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def start(self):
+        """Inicia a thread de gravação (idempotente)"""
+        if self.thread is not None:
+            return
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='trace-exporter', daemon=True)
+                self.thread.start()
+
+    def _run(self):
+        output = sys.stdout if self.exporter == 'stdout' else open(TRACE_FILE, 'a', encoding='utf-8')
+        while True:
+            records = [self.queue.get()]
+            # Grava o que já estiver na fila de uma só vez
+            while len(records) < 500:
+                try:
+                    records.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                output.write(''.join(json.dumps(r, default=str) + '\n' for r in records))
+                output.flush()
+                self.exported += len(records)
+            except Exception as e:
+                self.dropped += len(records)
+                print(f"⚠️  Erro ao gravar spans: {e}", flush=True)
+
+    def stats(self):
+        """Retorna spans gravados, descartados e pendentes"""
+        return {
+            'exporter': self.exporter,
+            'exported': self.exported,
+            'dropped': self.dropped,
+            'pending': self.queue.qsize()
+        }
+
+# Singleton instance
+tracer = Tracer()
@@ -0,0 +1,340 @@
+"""
+Cache de leitura de usuários com invalidação entre réplicas
+Mantém os usuários (to_dict) em memória, indexados por id, email e CPF.
+Atualizações e desativações invalidam a entrada localmente e publicam a
+invalidação em um exchange fanout do RabbitMQ para as demais réplicas.
+Os mesmos usuários também ficam pré-serializados em JSON por versão
+(UserFragmentCache), para montar respostas sem refazer to_dict/json.dumps.
+"""
+import os
+import json
+import time
+import uuid
+import threading
+from collections import OrderedDict
+import pika
+# Modo offline: réplica única, sem RabbitMQ para propagar invalidações
+from config import OFFLINE_MODE
+
+# Número máximo de usuários em cache
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', 5000))
+# Validade (s) de uma entrada, como proteção contra invalidações perdidas
+USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL', 300))
+# Número máximo de usuários pré-serializados (get_user e páginas de list_users)
+USER_FRAGMENT_CACHE_SIZE = int(os.getenv('USER_FRAGMENT_CACHE_SIZE', 20000))
+# Exchange fanout usado para as invalidações entre réplicas
+CACHE_EXCHANGE = os.getenv('USER_CACHE_EXCHANGE', 'usuarios_cache_exchange')
+
+class UserFragmentCache:
+    """
+    Usuários (to_dict) já serializados em JSON, na versão (id, updated_at).
+    Guarda uma versão por id; uma leitura com outro updated_at é um miss.
+    Como DATETIME não tem frações de segundo, duas alterações no mesmo
+    segundo mantêm o updated_at: por isso update/delete também invalidam, e
+    cada fragmento expira após o mesmo TTL do UserCache, caso uma
+    invalidação se perca.
+    """
+
+    def __init__(self, max_size=USER_FRAGMENT_CACHE_SIZE, ttl=USER_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()  # id -> (updated_at, user, json, expira_em)
+        self.lock = threading.Lock()
+        # Mesmo papel da geração do UserCache: leituras anteriores a uma
+        # invalidação não gravam fragmentos
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def lookup(self, versions):
+        """Fragmentos (user, json) de [(id, updated_at), ...]; None onde não há a versão"""
+        found = []
+        now = time.monotonic()
+        with self.lock:
+            for user_id, updated_at in versions:
+                entry = self.entries.get(user_id)
+                if entry is not None and now > entry[3]:
+                    del self.entries[user_id]
+                    self.expirations += 1
+                    entry = None
+                if entry is None or entry[0] != updated_at:
+                    if entry is None:
+                        self.misses += 1
+                    else:
+                        self.stale += 1
+                    found.append(None)
+                    continue
+                self.entries.move_to_end(user_id)
+                self.hits += 1
+                found.append((entry[1], entry[2]))
+        return found
+
+    def get(self, user_id, updated_at):
+        return self.lookup([(user_id, updated_at)])[0]
+
+    def store(self, users, generation):
+        """
+        Serializa os usuários e os guarda, exceto se houve invalidação desde
+        `generation` ou se já há uma versão mais nova (réplica atrasada).
+        Retorna os fragmentos (user, json) na mesma ordem.
+        """
+        fragments = [(user, json.dumps(user).encode('utf-8')) for user in users]
+        expires_at = time.monotonic() + self.ttl
+        with self.lock:
+            if generation != self.generation:
+                return fragments
+            for user, encoded in fragments:
+                entry = self.entries.get(user['id'])
+                if entry is not None and (entry[0] or '') > (user['updated_at'] or ''):
+                    continue
+                self.entries[user['id']] = (user['updated_at'], user, encoded, expires_at)
+                self.entries.move_to_end(user['id'])
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+        return fragments
+
+    def put(self, user, generation):
+        return self.store([user], generation)[0]
+
+    def invalidate(self, user_id):
+        with self.lock:
+            self.generation += 1
+            self.entries.pop(user_id, None)
+            self.invalidations += 1
+
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
+
+    def stats(self):
+        """Retorna tamanho, taxa de acerto e versões desatualizadas encontradas"""
+        with self.lock:
+            lookups = self.hits + self.misses + self.stale
+            return {
+                'size': len(self.entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'stale': self.stale,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations
+            }
+
+class UserCache:
+    """Cache LRU limitado de usuários por id, com índices por email e CPF"""
+
+    def __init__(self, max_size=USER_CACHE_SIZE, ttl=USER_CACHE_TTL, fragments=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        # UserFragmentCache invalidado junto com este cache (local, remoto e clear)
+        self.fragments = fragments
+        self.entries = OrderedDict()  # id -> (user, expira_em)
+        self.by_email = {}
+        self.by_cpf = {}
+        self.lock = threading.Lock()
+        # Incrementado a cada invalidação; impede que uma leitura iniciada
+        # antes da invalidação grave dados antigos no cache
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.remote_invalidations = 0
+
+    def _remove(self, user_id):
+        entry = self.entries.pop(user_id, None)
+        if entry is None:
+            return False
+        user = entry[0]
+        if self.by_email.get(user['email']) == user_id:
+            del self.by_email[user['email']]
+        if self.by_cpf.get(user['cpf']) == user_id:
+            del self.by_cpf[user['cpf']]
+        return True
+
+    def _lookup(self, user_id):
+        entry = self.entries.get(user_id)
+        if entry is None:
+            return None
+        user, expires_at = entry
+        if time.monotonic() > expires_at:
+            self._remove(user_id)
+            self.expirations += 1
+            return None
+        self.entries.move_to_end(user_id)
+        return user
+
+    def get(self, user_id):
+        """Retorna o usuário em cache (ou None)"""
+        with self.lock:
+            user = self._lookup(user_id)
+            if user is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return user
+
+    def find_id(self, email=None, cpf=None):
+        """Retorna o id de um usuário em cache com o email ou CPF informado"""
+        with self.lock:
+            for index, key in ((self.by_email, email), (self.by_cpf, cpf)):
+                user_id = index.get(key) if key is not None else None
+                if user_id is not None and self._lookup(user_id) is not None:
+                    self.hits += 1
+                    return user_id
+            self.misses += 1
+            return None
+
+    def put(self, user, generation):
+        """Armazena o usuário, exceto se houve invalidação desde `generation`"""
+        with self.lock:
+            if generation != self.generation:
+                return
+            self._remove(user['id'])
+            self.entries[user['id']] = (user, time.monotonic() + self.ttl)
+            self.by_email[user['email']] = user['id']
+            self.by_cpf[user['cpf']] = user['id']
+            while len(self.entries) > self.max_size:
+                oldest = next(iter(self.entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate(self, user_id, remote=False):
+        """Remove o usuário do cache"""
+        with self.lock:
+            self.generation += 1
+            self._remove(user_id)
+            if remote:
+                self.remote_invalidations += 1
+            else:
+                self.invalidations += 1
+        if self.fragments is not None:
+            self.fragments.invalidate(user_id)
+
+    def clear(self):
+        """Esvazia o cache"""
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
+            self.by_email.clear()
+            self.by_cpf.clear()
+        if self.fragments is not None:
+            self.fragments.clear()
+
+    def stats(self):
+        """Retorna tamanho, taxa de acerto e contadores de despejo"""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self.entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+                'remote_invalidations': self.remote_invalidations
+            }
+
+class CacheInvalidationBus:
+    """
+    Propaga invalidações do cache entre réplicas via RabbitMQ.
+    A conexão pertence a uma thread própria; outras threads publicam
+    por meio de add_callback_threadsafe.
+    """
+
+    def __init__(self, cache, exchange=CACHE_EXCHANGE, on_remote=None):
+        self.cache = cache
+        self.on_remote = on_remote  # chamado com o user_id de cada invalidação recebida
+        self.exchange = exchange
+        self.replica_id = uuid.uuid4().hex
+        self.host = os.getenv('RABBITMQ_HOST', 'rabbitmq')
+        self.user = os.getenv('RABBITMQ_USER', 'admin')
+        self.password = os.getenv('RABBITMQ_PASSWORD', 'admin')
+        self.connection = None
+        self.channel = None
+        self.published = 0
+        self.dropped = 0
+
+    def start(self):
+        """Inicia a thread consumidora (no modo offline não há outras réplicas)"""
+        if OFFLINE_MODE:
+            return
+        thread = threading.Thread(target=self._run, name='cache-invalidation', daemon=True)
+        thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                credentials = pika.PlainCredentials(self.user, self.password)
+                connection = pika.BlockingConnection(
+                    pika.ConnectionParameters(host=self.host, credentials=credentials)
+                )
+                channel = connection.channel()
+                channel.exchange_declare(exchange=self.exchange, exchange_type='fanout', durable=True)
+                result = channel.queue_declare(queue='', exclusive=True, auto_delete=True)
+                channel.queue_bind(exchange=self.exchange, queue=result.method.queue)
+                channel.basic_consume(
+                    queue=result.method.queue, on_message_callback=self._on_message, auto_ack=True
+                )
+                self.connection, self.channel = connection, channel
+                # Invalidações podem ter sido perdidas enquanto estava desconectado
+                self.cache.clear()
+                print("✅ Invalidação de cache conectada ao RabbitMQ", flush=True)
+                channel.start_consuming()
+            except Exception as e:
+                print(f"⚠️  Invalidação de cache desconectada: {e}. Tentando novamente em 5s...", flush=True)
+            finally:
+                self.connection, self.channel = None, None
+            time.sleep(5)
+
+    def _on_message(self, channel, method, properties, body):
+        try:
+            message = json.loads(body)
+        except ValueError:
+            return
+        if message.get('origin') != self.replica_id:
+            self.cache.invalidate(message.get('user_id'), remote=True)
+            if self.on_remote:
+                self.on_remote(message.get('user_id'))
+
+    def _publish(self, body):
+        try:
+            self.channel.basic_publish(exchange=self.exchange, routing_key='', body=body)
+            self.published += 1
+        except Exception as e:
+            self.dropped += 1
+            print(f"⚠️  Erro ao publicar invalidação de cache: {e}", flush=True)
+
+    def broadcast(self, user_id):
+        """Publica a invalidação do usuário para as outras réplicas"""
+        connection = self.connection
+        if OFFLINE_MODE:
+            return
+        if connection is None:
+            self.dropped += 1
+            return
+        body = json.dumps({'user_id': user_id, 'origin': self.replica_id})
+        try:
+            connection.add_callback_threadsafe(lambda: self._publish(body))
+        except Exception:
+            self.dropped += 1
+
+    def stats(self):
+        """Retorna contadores de invalidações publicadas"""
+        return {
+            'connected': self.connection is not None,
+            'offline': OFFLINE_MODE,
+            'published': self.published,
+            'dropped': self.dropped
+        }
@@ -2,11 +2,17 @@
 Interface REST para o Serviço de Usuários
 Comunica-se com o serviço via Sockets TCP
 """
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, g
 from flask_cors import CORS
 import socket
-import json
 import os
+import json
+import protocol
+from connection_pool import ConnectionPool, PoolTimeout
+from token_cache import TokenVerifier, load_keys
+from metrics import (MetricsRegistry, RequestMetrics, response_error_type, render_stats,
+                     CONTENT_TYPE)
+from tracing import tracer
 
 app = Flask(__name__)
 CORS(app)
@@ -14,52 +20,198 @@ CORS(app)
 # Configurações
 SERVICE_HOST = os.getenv('USER_SERVICE_HOST', 'user_service')
 SERVICE_PORT = int(os.getenv('USER_SERVICE_PORT', 5001))
+# 'framed' (padrão) ou 'legacy' para o protocolo antigo sem cabeçalho
+SERVICE_PROTOCOL = os.getenv('USER_SERVICE_PROTOCOL', 'framed')
+# Tempo limite (s) para cadastros em massa, que fazem vários hashes de senha
+BULK_TIMEOUT = float(os.getenv('USER_SERVICE_BULK_TIMEOUT', 120))
+
+# Início de toda resposta JSON de sucesso do serviço (json.dumps, 'success' primeiro)
+SUCCESS_PREFIX = b'{"success": true'
+
+# Pool de conexões persistentes com o serviço
+service_pool = ConnectionPool(SERVICE_HOST, SERVICE_PORT)
+
+# Verificação local de tokens (JWT_SECRET_KEY) com cache; sem chave, usa o serviço
+token_verifier = TokenVerifier(load_keys())
+
+# Spans da interface aparecem com nome próprio no trace
+tracer.service_name = os.getenv('TRACE_SERVICE_NAME', 'servico-usuario-interface')
+
+# Métricas por rota e por chamada ao serviço (GET /metrics)
+metrics_registry = MetricsRegistry()
+route_metrics = RequestMetrics(metrics_registry, 'user_gateway_http', ('method', 'route'), 'Requisições HTTP')
+service_metrics = RequestMetrics(metrics_registry, 'user_gateway_service', ('action',), 'Chamadas ao serviço')
 
-def send_to_service(action, data=None):
+@app.before_request
+def start_route_metrics():
+    rule = request.url_rule.rule if request.url_rule else 'unmatched'
+    g.metrics_labels = (request.method, rule)
+    g.metrics_start = route_metrics.start(*g.metrics_labels)
+    # Span raiz da requisição (ou continuação de um traceparent recebido)
+    g.trace_span = tracer.start_span(
+        f'HTTP {request.method} {rule}', request.headers.get('traceparent'),
+        **{'http.method': request.method, 'http.route': rule}
+    )
+    g.trace_token = tracer.activate(g.trace_span)
+
+@app.after_request
+def count_route_errors(response):
+    if response.status_code >= 400 and 'metrics_labels' in g:
+        route_metrics.error(f'{response.status_code // 100}xx', *g.metrics_labels)
+    if 'trace_span' in g:
+        g.trace_span.set('http.status_code', response.status_code)
+        traceparent = g.trace_span.traceparent()
+        if traceparent:
+            response.headers['traceparent'] = traceparent
+    return response
+
+@app.teardown_request
+def finish_route_metrics(error=None):
+    if 'metrics_start' in g:
+        route_metrics.finish(g.metrics_start, *g.metrics_labels)
+    if 'trace_span' in g:
+        g.trace_span.end(error=error)
+        tracer.deactivate(g.trace_token)
+
+def send_to_service(action, data=None, timeout=10, raw=False):
+    """
+    Envia requisição para o serviço, medindo latência e erros por ação.
+    Com raw=True, uma resposta JSON de sucesso volta como bytes, sem
+    desserializar; erros continuam vindo como dicionário.
+    """
+    with service_metrics.track(action), tracer.span(f'socket {action}', action=action) as span:
+        response = call_service(action, data, timeout, span.traceparent(), raw)
+        error_type = response_error_type(response)
+        if error_type:
+            span.set('error.type', error_type)
+    if error_type:
+        service_metrics.error(error_type, action)
+    return response
+
+def call_service(action, data=None, timeout=10, traceparent=None, raw=False):
     """Envia requisição para o serviço via Socket TCP"""
     try:
-        # Criar socket
-        client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        client_socket.settimeout(10)
-        
-        # Conectar ao serviço
-        client_socket.connect((SERVICE_HOST, SERVICE_PORT))
-        
         # Preparar mensagem
         message = {
             'action': action,
             'data': data or {}
         }
+        if traceparent:
+            # O serviço continua o trace a partir deste span
+            message['traceparent'] = traceparent
         
-        # Enviar requisição
-        message_json = json.dumps(message)
-        client_socket.sendall(message_json.encode('utf-8'))
-        
-        # Receber resposta
-        response_data = b''
-        while True:
-            chunk = client_socket.recv(4096)
-            if not chunk:
-                break
-            response_data += chunk
-            if len(chunk) < 4096:
-                break
-        
-        # Decodificar resposta
-        response = json.loads(response_data.decode('utf-8'))
+        if SERVICE_PROTOCOL != 'legacy':
+            # Conexão persistente obtida do pool
+            if not raw:
+                return service_pool.request(message, timeout)
+            payload, encoding = service_pool.request(message, timeout, raw=True)
+            if encoding == protocol.ENCODING_JSON and payload.startswith(SUCCESS_PREFIX):
+                return payload
+            return protocol.decode_payload(payload, encoding)
         
-        client_socket.close()
-        return response
+        # Modo legado: JSON puro, uma requisição por conexão
+        client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        client_socket.settimeout(timeout)
+        try:
+            client_socket.connect((SERVICE_HOST, SERVICE_PORT))
+            protocol.write_legacy(client_socket, message)
+            return protocol.read_legacy(client_socket)
+        finally:
+            client_socket.close()
     except socket.timeout:
         return {'success': False, 'message': 'Timeout na comunicação com o serviço'}
+    except PoolTimeout:
+        return {'success': False, 'overloaded': True, 'message': 'Nenhuma conexão livre com o serviço'}
     except Exception as e:
         return {'success': False, 'message': f'Erro na comunicação: {str(e)}'}
 
+class ServiceOverloaded(Exception):
+    """O serviço recusou a requisição por sobrecarga"""
+    
+    def __init__(self, response):
+        super().__init__(response.get('message'))
+        self.response = response
+
+def verify_token_remote(token):
+    """Verifica o token no serviço (usado quando não há chave local)"""
+    response = send_to_service('verify_token', {'token': token})
+    if response.get('overloaded'):
+        raise ServiceOverloaded(response)
+    if response.get('success'):
+        return response.get('payload')
+    return None
+
+def authorize_request():
+    """
+    Verifica o token do cabeçalho Authorization.
+    Retorna (payload, None) ou (None, resposta de erro).
+    """
+    token = request.headers.get('Authorization', '').replace('Bearer ', '')
+    if not token:
+        return None, (jsonify({
+            'success': False,
+            'message': 'Token de autenticação não fornecido'
+        }), 401)
+    
+    try:
+        payload = token_verifier.verify(token, fallback=verify_token_remote)
+    except ServiceOverloaded as e:
+        return None, (jsonify(e.response), 503)
+    
+    if not payload:
+        return None, (jsonify({
+            'success': False,
+            'message': 'Token inválido ou expirado'
+        }), 401)
+    return payload, None
+
+def relay_json(action, data, success_status, error_status):
+    """
+    Repassa o JSON do serviço como corpo da resposta HTTP, sem desserializar
+    nem serializar de novo (usuários montados dos fragmentos em cache).
+    """
+    response = send_to_service(action, data, raw=True)
+    if isinstance(response, bytes):
+        return Response(response, status=success_status, mimetype='application/json')
+    return jsonify(response), status_for(response, success_status, error_status)
+
+def status_for(response, success_status, error_status):
+    """Define o status HTTP a partir da resposta do serviço"""
+    if response.get('success'):
+        return success_status
+    if response.get('overloaded'):
+        return 503
+    return error_status
+
 @app.route('/health', methods=['GET'])
 def health():
     """Endpoint de health check"""
     return jsonify({'status': 'healthy', 'service': 'user_interface'}), 200
 
+@app.route('/stats', methods=['GET'])
+def stats():
+    """Expõe profundidade de fila e descartes do serviço (para autoscaling)"""
+    response = send_to_service('stats')
+    response['gateway'] = {
+        'connection_pool': service_pool.stats(),
+        'token_cache': token_verifier.stats()
+    }
+    return jsonify(response), status_for(response, 200, 502)
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Métricas da interface e do serviço no formato texto do Prometheus"""
+    body = metrics_registry.render() + render_stats('user_gateway', {
+        'connection_pool': service_pool.stats(),
+        'token_cache': token_verifier.stats()
+    })
+    response = send_to_service('metrics')
+    up = 1 if response.get('success') else 0
+    body += f'# TYPE user_gateway_service_up gauge\nuser_gateway_service_up {up}\n'
+    if up:
+        body += response['metrics']
+    return Response(body, content_type=CONTENT_TYPE)
+
 @app.route('/users', methods=['POST'])
 def create_user():
     """Cria um novo usuário"""
@@ -78,7 +230,29 @@ def create_user():
         # Enviar para o serviço
         response = send_to_service('create_user', data)
         
-        status_code = 201 if response.get('success') else 400
+        status_code = status_for(response, 201, 400)
+        return jsonify(response), status_code
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Erro ao processar requisição: {str(e)}'
+        }), 500
+
+@app.route('/users/bulk', methods=['POST'])
+def bulk_create_users():
+    """Cria vários usuários em uma única chamada ao serviço"""
+    try:
+        data = request.json
+        
+        if not isinstance(data, dict) or not isinstance(data.get('users'), list):
+            return jsonify({
+                'success': False,
+                'message': 'Campo obrigatório ausente: users (lista)'
+            }), 400
+        
+        response = send_to_service('bulk_create_users', {'users': data['users']}, timeout=BULK_TIMEOUT)
+        
+        status_code = status_for(response, 200, 400)
         return jsonify(response), status_code
     except Exception as e:
         return jsonify({
@@ -100,7 +274,7 @@ def authenticate():
         
         response = send_to_service('authenticate', data)
         
-        status_code = 200 if response.get('success') else 401
+        status_code = status_for(response, 200, 401)
         return jsonify(response), status_code
     except Exception as e:
         return jsonify({
@@ -112,10 +286,7 @@ def authenticate():
 def get_user(user_id):
     """Retorna informações de um usuário"""
     try:
-        response = send_to_service('get_user', {'user_id': user_id})
-        
-        status_code = 200 if response.get('success') else 404
-        return jsonify(response), status_code
+        return relay_json('get_user', {'user_id': user_id}, 200, 404)
     except Exception as e:
         return jsonify({
             'success': False,
@@ -130,24 +301,13 @@ def update_user(user_id):
         data['user_id'] = user_id
         
         # Verificar token de autenticação
-        token = request.headers.get('Authorization', '').replace('Bearer ', '')
-        if not token:
-            return jsonify({
-                'success': False,
-                'message': 'Token de autenticação não fornecido'
-            }), 401
-        
-        # Verificar token
-        token_response = send_to_service('verify_token', {'token': token})
-        if not token_response.get('success'):
-            return jsonify({
-                'success': False,
-                'message': 'Token inválido ou expirado'
-            }), 401
+        payload, error = authorize_request()
+        if error:
+            return error
         
         response = send_to_service('update_user', data)
         
-        status_code = 200 if response.get('success') else 400
+        status_code = status_for(response, 200, 400)
         return jsonify(response), status_code
     except Exception as e:
         return jsonify({
@@ -160,23 +320,11 @@ def delete_user(user_id):
     """Desativa um usuário"""
     try:
         # Verificar token de autenticação
-        token = request.headers.get('Authorization', '').replace('Bearer ', '')
-        if not token:
-            return jsonify({
-                'success': False,
-                'message': 'Token de autenticação não fornecido'
-            }), 401
-        
-        # Verificar token
-        token_response = send_to_service('verify_token', {'token': token})
-        if not token_response.get('success'):
-            return jsonify({
-                'success': False,
-                'message': 'Token inválido ou expirado'
-            }), 401
+        payload, error = authorize_request()
+        if error:
+            return error
         
         # Verificar se é admin
-        payload = token_response.get('payload', {})
         if payload.get('role') != 'administrador':
             return jsonify({
                 'success': False,
@@ -184,8 +332,11 @@ def delete_user(user_id):
             }), 403
         
         response = send_to_service('delete_user', {'user_id': user_id})
+        if response.get('success'):
+            # Tokens do usuário desativado deixam de valer imediatamente
+            token_verifier.revoke_user(user_id)
         
-        status_code = 200 if response.get('success') else 404
+        status_code = status_for(response, 200, 404)
         return jsonify(response), status_code
     except Exception as e:
         return jsonify({
@@ -193,37 +344,99 @@ def delete_user(user_id):
             'message': f'Erro ao processar requisição: {str(e)}'
         }), 500
 
+def list_arguments():
+    """Lê filtros (role, active) e campos (fields) da query string"""
+    filters = {}
+    if 'role' in request.args:
+        filters['role'] = request.args.get('role')
+    if 'active' in request.args:
+        filters['active'] = int(request.args.get('active'))
+    
+    data = {'filters': filters}
+    if 'fields' in request.args:
+        data['fields'] = [f.strip() for f in request.args.get('fields').split(',') if f.strip()]
+    return data
+
 @app.route('/users', methods=['GET'])
 def list_users():
     """Lista usuários com filtros opcionais"""
     try:
         # Verificar token de autenticação
-        token = request.headers.get('Authorization', '').replace('Bearer ', '')
-        if not token:
-            return jsonify({
-                'success': False,
-                'message': 'Token de autenticação não fornecido'
-            }), 401
+        payload, error = authorize_request()
+        if error:
+            return error
         
-        # Verificar token
-        token_response = send_to_service('verify_token', {'token': token})
-        if not token_response.get('success'):
-            return jsonify({
-                'success': False,
-                'message': 'Token inválido ou expirado'
-            }), 401
+        # Filtros e projeção de campos da query string
+        data = list_arguments()
         
-        # Obter filtros da query string
-        filters = {}
-        if 'role' in request.args:
-            filters['role'] = request.args.get('role')
-        if 'active' in request.args:
-            filters['active'] = int(request.args.get('active'))
+        # Paginação por cursor
+        if 'cursor' in request.args:
+            data['cursor'] = request.args.get('cursor')
+        if 'limit' in request.args:
+            try:
+                data['limit'] = int(request.args.get('limit'))
+            except ValueError:
+                return jsonify({
+                    'success': False,
+                    'message': 'limit deve ser um número inteiro'
+                }), 400
+        if request.args.get('total') == '0':
+            data['include_total'] = False
         
-        response = send_to_service('list_users', {'filters': filters})
+        return relay_json('list_users', data, 200, 400)
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Erro ao processar requisição: {str(e)}'
+        }), 500
+
+@app.route('/users/export', methods=['GET'])
+def export_users():
+    """Exporta usuários em NDJSON, repassando os frames do serviço sem buffer"""
+    try:
+        # Verificar token de autenticação
+        payload, error = authorize_request()
+        if error:
+            return error
         
-        status_code = 200 if response.get('success') else 400
-        return jsonify(response), status_code
+        if SERVICE_PROTOCOL == 'legacy':
+            return jsonify(protocol.STREAM_UNSUPPORTED), 501
+        
+        data = list_arguments()
+        data['stream'] = True
+        message = {'action': 'list_users', 'data': data}
+        traceparent = tracer.current_traceparent()
+        if traceparent:
+            message['traceparent'] = traceparent
+        frames = service_pool.stream(message)
+        try:
+            first = next(frames)
+        except PoolTimeout:
+            return jsonify({'success': False, 'overloaded': True, 'message': 'Nenhuma conexão livre com o serviço'}), 503
+        
+        chunk, encoding, flags = first
+        if not flags & protocol.FLAG_STREAM:
+            # Erro de validação/sobrecarga ou resultado vazio
+            response = protocol.decode_payload(chunk, encoding)
+            if not response.get('success'):
+                return jsonify(response), status_for(response, 200, 400)
+            return Response(b'', mimetype='application/x-ndjson')
+        
+        def generate():
+            try:
+                yield chunk
+                for frame, encoding, flags in frames:
+                    if flags & protocol.FLAG_STREAM:
+                        yield frame
+                        continue
+                    summary = protocol.decode_payload(frame, encoding)
+                    # Falha no meio da exportação: a última linha indica o erro
+                    if not summary.get('success'):
+                        yield json.dumps(summary).encode('utf-8') + b'\n'
+            finally:
+                frames.close()
+        
+        return Response(generate(), mimetype='application/x-ndjson')
     except Exception as e:
         return jsonify({
             'success': False,
@@ -242,10 +455,65 @@ def verify_token():
                 'message': 'Token não fornecido'
             }), 400
         
-        response = send_to_service('verify_token', data)
+        try:
+            payload = token_verifier.verify(data['token'], fallback=verify_token_remote)
+        except ServiceOverloaded as e:
+            return jsonify(e.response), 503
         
-        status_code = 200 if response.get('success') else 401
-        return jsonify(response), status_code
+        if not payload:
+            return jsonify({'success': False, 'message': 'Token inválido ou expirado'}), 401
+        return jsonify({'success': True, 'payload': payload}), 200
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Erro ao processar requisição: {str(e)}'
+        }), 500
+
+@app.route('/users/revoke-tokens', methods=['POST'])
+def revoke_tokens():
+    """Remove tokens do cache antes do exp (apenas administradores)"""
+    try:
+        payload, error = authorize_request()
+        if error:
+            return error
+        if payload.get('role') != 'administrador':
+            return jsonify({
+                'success': False,
+                'message': 'Permissão negada. Apenas administradores podem revogar tokens.'
+            }), 403
+        
+        data = request.json or {}
+        if 'token' in data:
+            token_verifier.revoke_token(data['token'])
+        if 'user_id' in data:
+            token_verifier.revoke_user(int(data['user_id']))
+        return jsonify({'success': True, 'message': 'Tokens revogados'}), 200
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Erro ao processar requisição: {str(e)}'
+        }), 500
+
+@app.route('/admin/profile', methods=['POST'])
+def profile():
+    """Inicia, encerra ou consulta o profiling do serviço (apenas administradores)"""
+    try:
+        payload, error = authorize_request()
+        if error:
+            return error
+        if payload.get('role') != 'administrador':
+            return jsonify({
+                'success': False,
+                'message': 'Permissão negada. Apenas administradores podem usar o profiling.'
+            }), 403
+        
+        data = request.json or {}
+        # O serviço confere o token novamente antes de executar o comando
+        data['token'] = request.headers.get('Authorization', '').replace('Bearer ', '')
+        response = send_to_service('profile', data)
+        if response.get('forbidden'):
+            return jsonify(response), 403
+        return jsonify(response), status_for(response, 200, 400)
     except Exception as e:
         return jsonify({
             'success': False,
@@ -2,43 +2,242 @@
 Serviço de Usuários - Servidor Socket TCP
 Gerencia todas as operações relacionadas aos usuários
 """
-import socket
+import os
 import json
+import base64
 import threading
-import bcrypt
 from datetime import datetime, timedelta
 import jwt
-from models import User, UserRole
-from database import get_db, init_db, close_db
+from sqlalchemy import func, insert
+from sqlalchemy.exc import IntegrityError
+from models import User, UserRole, OutboxMessage
+from database import get_db, init_db, close_db, pool_stats, replicas, DATABASE_URL
+from config import OFFLINE_MODE
+import protocol
 from rabbitmq_publisher import publisher
+from async_server import AsyncUserServer
+from threaded_server import ThreadedUserServer
+from worker_pool import OverloadedError, overloaded_response
+from password_hasher import PasswordHasher
+from user_cache import UserCache, UserFragmentCache, CacheInvalidationBus
+from outbox_relay import OutboxRelay
+from metrics import MetricsRegistry, RequestMetrics, response_error_type, render_stats, CONTENT_TYPE
+from tracing import tracer
+from profiler import profiler
 
 # Configurações
 HOST = '0.0.0.0'
 PORT = 5001
-SECRET_KEY = 'sua_chave_secreta_aqui_mude_em_producao'
+SECRET_KEY = os.getenv('JWT_SECRET_KEY', 'sua_chave_secreta_aqui_mude_em_producao')
+# Número máximo de sub-requisições em uma ação 'batch'
+BATCH_MAX_SIZE = int(os.getenv('BATCH_MAX_SIZE', 50))
+# Número máximo de usuários em uma ação 'bulk_create_users'
+BULK_MAX_SIZE = int(os.getenv('BULK_MAX_SIZE', 1000))
+# Tamanho padrão e máximo de página em list_users
+LIST_PAGE_SIZE = int(os.getenv('LIST_PAGE_SIZE', 100))
+LIST_MAX_PAGE_SIZE = int(os.getenv('LIST_MAX_PAGE_SIZE', 1000))
+# Linhas lidas do cursor do banco e enviadas por frame na listagem em streaming
+LIST_STREAM_CHUNK_SIZE = int(os.getenv('LIST_STREAM_CHUNK_SIZE', 500))
+# Motor do servidor: 'threads' (pool de workers limitado) ou 'asyncio'
+SERVER_ENGINE = os.getenv('SERVER_ENGINE', 'threads')
+# Ações reconhecidas por dispatch (rótulos das métricas)
+ACTIONS = (
+    'create_user', 'bulk_create_users', 'authenticate', 'get_user', 'update_user',
+    'delete_user', 'list_users', 'verify_token', 'batch', 'stats', 'metrics', 'profile', 'hello'
+)
+
+def encode_cursor(last_id):
+    """Gera o cursor opaco da próxima página a partir do último id"""
+    raw = json.dumps({'after': last_id}).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def decode_cursor(cursor):
+    """Retorna o id a partir do qual a próxima página começa"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii'))
+        return int(json.loads(raw)['after'])
+    except (ValueError, KeyError, TypeError, AttributeError):
+        raise ValueError('Cursor inválido')
+
+class BatchContext:
+    """Estado de uma ação 'batch' em execução na thread atual"""
+    
+    def __init__(self, db, transactional):
+        self.db = db
+        self.transactional = transactional
+        self.invalidations = []
+        self.written = []
 
 class UserService:
     """Serviço de gerenciamento de usuários"""
     
     def __init__(self):
         self.secret_key = SECRET_KEY
-        # Conectar ao RabbitMQ
-        print("🔄 Conectando ao RabbitMQ...")
-        publisher.connect()
+        self.local = threading.local()
+        self.stats_providers = {}
+        # Contagem, erros, latência e requisições em andamento por ação (ação 'metrics')
+        self.metrics_registry = MetricsRegistry()
+        self.request_metrics = RequestMetrics(
+            self.metrics_registry, 'user_service', ('action',), 'Requisições'
+        )
+        # bcrypt roda em um pool de processos separado
+        self.hasher = PasswordHasher()
+        self.register_stats('hashing', self.hasher.stats)
+        # Ocupação e espera do pool de conexões com o banco
+        self.register_stats('database', pool_stats)
+        # Leituras em réplicas, com medição de atraso e read-your-writes
+        replicas.start()
+        self.register_stats('replicas', replicas.stats)
+        # Cache de leitura de usuários, invalidado entre réplicas via RabbitMQ;
+        # os fragmentos JSON por versão são invalidados junto
+        self.user_fragments = UserFragmentCache()
+        self.user_cache = UserCache(fragments=self.user_fragments)
+        self.cache_bus = CacheInvalidationBus(
+            self.user_cache,
+            on_remote=lambda user_id: replicas.mark_written(f'user:{user_id}')
+        )
+        self.cache_bus.start()
+        self.register_stats('user_cache', lambda: dict(
+            self.user_cache.stats(), invalidation_bus=self.cache_bus.stats(),
+            fragments=self.user_fragments.stats()
+        ))
+        # Notificações são publicadas por uma thread dedicada, fora da requisição
+        publisher.start()
+        self.register_stats('publisher', publisher.stats)
+        # Relay da outbox: publica as notificações gravadas junto com os usuários
+        self.outbox_relay = OutboxRelay(publisher)
+        self.outbox_relay.start()
+        self.register_stats('outbox', self.outbox_relay.stats)
+        self.register_stats('tracing', tracer.stats)
+    
+    def register_stats(self, name, provider):
+        """Registra uma função que fornece estatísticas para a ação 'stats'"""
+        self.stats_providers[name] = provider
+    
+    def get_stats(self):
+        """Coleta as estatísticas de todos os componentes registrados"""
+        return {
+            'success': True,
+            'stats': {name: provider() for name, provider in self.stats_providers.items()}
+        }
+    
+    def get_metrics(self):
+        """Retorna as métricas por ação e as estatísticas no formato do Prometheus"""
+        text = self.metrics_registry.render() + render_stats('user_service', self.get_stats()['stats'])
+        return {'success': True, 'content_type': CONTENT_TYPE, 'metrics': text}
+    
+    def profile(self, data):
+        """Inicia, encerra ou consulta o profiling de handle_request (apenas administradores)"""
+        payload = self.verify_token(data.get('token'))
+        if not payload or payload.get('role') != UserRole.ADMIN.value:
+            return {'success': False, 'forbidden': True,
+                    'message': 'Permissão negada. Apenas administradores podem usar o profiling.'}
+        
+        command = data.get('command', 'status')
+        try:
+            if command == 'start':
+                result = profiler.start(
+                    data.get('mode', 'sampling'),
+                    seconds=data.get('seconds'),
+                    requests=data.get('requests'),
+                    action=data.get('action')
+                )
+            elif command == 'stop':
+                result = profiler.stop()
+            elif command == 'status':
+                result = profiler.status()
+            else:
+                return {'success': False, 'message': 'Comando inválido: use start, stop ou status'}
+        except ValueError as e:
+            return {'success': False, 'message': str(e)}
+        return {'success': True, 'profile': result}
+    
+    def current_batch(self):
+        """Retorna o batch em execução na thread atual (se houver)"""
+        return getattr(self.local, 'batch', None)
+    
+    def open_session(self):
+        """Retorna a sessão do batch atual ou uma nova sessão"""
+        batch = self.current_batch()
+        return batch.db if batch else get_db()
+    
+    def open_read_session(self, *keys):
+        """Sessão para leitura: réplica, exceto em batch ou logo após escrita nas chaves"""
+        batch = self.current_batch()
+        return batch.db if batch else replicas.read_session(*keys)
+    
+    def release_session(self, db):
+        """Fecha a sessão, exceto quando ela pertence a um batch"""
+        if not self.current_batch():
+            db.close()
+    
+    def commit(self, db):
+        """Confirma a sessão; em batch transacional apenas envia ao banco"""
+        batch = self.current_batch()
+        if batch and batch.transactional:
+            db.flush()
+        else:
+            db.commit()
+            self.outbox_relay.wake()
+    
+    def cache_active(self):
+        """O cache não é usado dentro de um batch transacional"""
+        batch = self.current_batch()
+        return not (batch and batch.transactional)
+    
+    def fragment_response(self, fields, key, fragments, many=True):
+        """Resposta montada dos fragmentos JSON; em batch, um dicionário comum"""
+        response = protocol.PreEncoded(fields, key, fragments, many)
+        return response.to_dict() if self.current_batch() else response
+    
+    def mark_written(self, user_id=None, emails=()):
+        """Leituras do usuário seguem no primário logo após a escrita (read-your-writes)"""
+        keys = [f'email:{email}' for email in emails if email]
+        if user_id is not None:
+            keys.append(f'user:{user_id}')
+        replicas.mark_written(*keys)
+        batch = self.current_batch()
+        if batch and batch.transactional:
+            # A janela recomeça no commit do batch
+            batch.written.extend(keys)
+    
+    def invalidate_user(self, user_id):
+        """Invalida o usuário no cache local e nas demais réplicas"""
+        self.user_cache.invalidate(user_id)
+        batch = self.current_batch()
+        if batch and batch.transactional:
+            # Repetida após o commit, quando a alteração fica visível
+            batch.invalidations.append(user_id)
+            return
+        self.cache_bus.broadcast(user_id)
+    
+    def notify(self, db, email, assunto, mensagem):
+        """Grava a notificação na outbox, na mesma transação da alteração"""
+        payload = {
+            'email': email,
+            'assunto': assunto,
+            'mensagem': mensagem
+        }
+        db.add(OutboxMessage(
+            key=email, payload=json.dumps(payload), traceparent=tracer.current_traceparent()
+        ))
     
     def hash_password(self, password):
         """Gera hash da senha"""
-        return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        with tracer.span('bcrypt.hash'):
+            return self.hasher.hash(password)
     
     def verify_password(self, password, password_hash):
         """Verifica se a senha está correta"""
-        return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+        with tracer.span('bcrypt.verify'):
+            return self.hasher.verify(password, password_hash)
     
     def generate_token(self, user_id, role):
         """Gera token JWT"""
         payload = {
             'user_id': user_id,
             'role': role,
+            'iat': datetime.utcnow(),
             'exp': datetime.utcnow() + timedelta(hours=24)
         }
         return jwt.encode(payload, self.secret_key, algorithm='HS256')
@@ -55,7 +254,11 @@ class UserService:
     
     def create_user(self, data):
         """Cria um novo usuário"""
-        db = get_db()
+        # Duplicidade já conhecida pelo cache dispensa a consulta ao banco
+        if self.cache_active() and self.user_cache.find_id(email=data.get('email'), cpf=data.get('cpf')):
+            return {'success': False, 'message': 'CPF ou email já cadastrados'}
+        
+        db = self.open_session()
         try:
             # Verificar se CPF ou email já existem
             existing_user = db.query(User).filter(
@@ -80,34 +283,199 @@ class UserService:
             )
             
             db.add(user)
-            db.commit()
-            db.refresh(user)
             
-            # Publicar notificação de boas-vindas
-            try:
-                publisher.publish_notification(
-                    email=user.email,
-                    assunto='Bem-vindo ao Sistema de Consultas Médicas',
-                    mensagem=f'Olá {user.name}! Sua conta foi criada com sucesso. '
-                            f'Você está cadastrado como {user.role.value}.'
-                )
-            except Exception as e:
-                print(f"⚠️  Erro ao publicar notificação: {e}")
+            # Notificação de boas-vindas (outbox, mesma transação)
+            assunto, mensagem = self.welcome_message(user.name, user.role)
+            self.notify(db, email=user.email, assunto=assunto, mensagem=mensagem)
+            
+            self.commit(db)
+            db.refresh(user)
+            self.mark_written(user.id, [user.email])
             
             return {
                 'success': True,
                 'message': 'Usuário criado com sucesso',
                 'user': user.to_dict()
             }
+        except OverloadedError:
+            db.rollback()
+            raise
         except Exception as e:
             db.rollback()
             return {'success': False, 'message': f'Erro ao criar usuário: {str(e)}'}
         finally:
-            db.close()
+            self.release_session(db)
+    
+    def welcome_message(self, name, role):
+        """Retorna assunto e mensagem da notificação de boas-vindas"""
+        return (
+            'Bem-vindo ao Sistema de Consultas Médicas',
+            f'Olá {name}! Sua conta foi criada com sucesso. '
+            f'Você está cadastrado como {role.value}.'
+        )
+    
+    def bulk_create_users(self, data):
+        """
+        Cadastra vários usuários de uma vez.
+        Duplicidades são verificadas em uma única consulta, as senhas são
+        processadas em paralelo sem conexão aberta e usuários e notificações
+        são inseridos com executemany em uma transação curta. Conflitos de
+        CPF ou email com cadastros concorrentes falham apenas as linhas
+        envolvidas. Retorna o resultado de cada linha.
+        """
+        rows = data.get('users')
+        if not isinstance(rows, list) or not rows:
+            return {'success': False, 'message': 'Lista de usuários vazia ou inválida'}
+        if len(rows) > BULK_MAX_SIZE:
+            return {'success': False, 'message': f'Lote excede o limite de {BULK_MAX_SIZE} usuários'}
+        
+        results = [None] * len(rows)
+        
+        def fail(index, message):
+            results[index] = {'index': index, 'success': False, 'message': message}
+        
+        # Validação e duplicidades dentro do próprio lote
+        seen_cpfs, seen_emails = set(), set()
+        valid = []
+        for index, row in enumerate(rows):
+            if not isinstance(row, dict):
+                fail(index, 'Linha inválida')
+                continue
+            missing = [f for f in ('name', 'cpf', 'email', 'password', 'role') if not row.get(f)]
+            if missing:
+                fail(index, f"Campos obrigatórios ausentes: {', '.join(missing)}")
+                continue
+            if str(row['role']).upper() not in UserRole.__members__:
+                fail(index, f"Tipo de usuário inválido: {row['role']}")
+                continue
+            if row['cpf'] in seen_cpfs or row['email'] in seen_emails:
+                fail(index, 'CPF ou email repetidos no lote')
+                continue
+            seen_cpfs.add(row['cpf'])
+            seen_emails.add(row['email'])
+            valid.append(index)
+        
+        try:
+            # Duplicidades no banco: uma consulta para o lote inteiro, com a
+            # conexão devolvida antes do bcrypt
+            pending = self.untaken_rows(rows, valid, fail)
+            hashes = {}
+            if pending:
+                with tracer.span('bcrypt.hash_many', count=len(pending)):
+                    hashes = dict(zip(pending, self.hasher.hash_many([rows[i]['password'] for i in pending])))
+            
+            ids = {}
+            while pending:
+                try:
+                    ids = self.insert_users(rows, pending, hashes)
+                    break
+                except IntegrityError as e:
+                    if self.current_batch():
+                        raise
+                    # CPF ou email cadastrados por outra requisição entre a
+                    # verificação e o INSERT: falham só as linhas em conflito
+                    remaining = self.untaken_rows(rows, pending, fail)
+                    if remaining == pending:
+                        for index in pending:
+                            fail(index, f'Erro ao cadastrar usuário: {str(e.orig)}')
+                        remaining = []
+                    pending = remaining
+            
+            for index in pending:
+                results[index] = {
+                    'index': index,
+                    'success': True,
+                    'user_id': ids.get(rows[index]['email'])
+                }
+            
+            return {
+                'success': True,
+                'created': len(pending),
+                'failed': len(rows) - len(pending),
+                'results': results
+            }
+        except OverloadedError:
+            raise
+        except Exception as e:
+            return {'success': False, 'message': f'Erro ao cadastrar usuários: {str(e)}'}
+    
+    def untaken_rows(self, rows, indexes, fail):
+        """Marca as linhas com CPF ou email já cadastrados e retorna as restantes"""
+        if not indexes:
+            return []
+        db = self.open_session()
+        try:
+            existing = db.query(User.cpf, User.email).filter(
+                User.cpf.in_([rows[i]['cpf'] for i in indexes]) |
+                User.email.in_([rows[i]['email'] for i in indexes])
+            ).all()
+        finally:
+            self.release_session(db)
+        taken_cpfs = {cpf for cpf, _ in existing}
+        taken_emails = {email for _, email in existing}
+        remaining = []
+        for index in indexes:
+            if rows[index]['cpf'] in taken_cpfs or rows[index]['email'] in taken_emails:
+                fail(index, 'CPF ou email já cadastrados')
+            else:
+                remaining.append(index)
+        return remaining
+    
+    def insert_users(self, rows, indexes, hashes):
+        """Insere usuários e notificações com executemany em uma transação curta"""
+        now = datetime.utcnow()
+        traceparent = tracer.current_traceparent()
+        users = []
+        notifications = []
+        for index in indexes:
+            row = rows[index]
+            role = UserRole[row['role'].upper()]
+            users.append({
+                'name': row['name'],
+                'cpf': row['cpf'],
+                'email': row['email'],
+                'password_hash': hashes[index],
+                'role': role,
+                'phone': row.get('phone'),
+                'crm': row.get('crm'),
+                'specialty': row.get('specialty'),
+                'active': 1,
+                'created_at': now,
+                'updated_at': now
+            })
+            assunto, mensagem = self.welcome_message(row['name'], role)
+            notifications.append({
+                'key': row['email'],
+                'payload': json.dumps({
+                    'email': row['email'],
+                    'assunto': assunto,
+                    'mensagem': mensagem
+                }),
+                'created_at': now,
+                'attempts': 0,
+                'traceparent': traceparent
+            })
+        
+        db = self.open_session()
+        try:
+            db.execute(insert(User), users)
+            db.execute(insert(OutboxMessage), notifications)
+            # INSERT em lote não retorna os ids no MySQL: uma consulta pelos emails
+            ids = dict(db.query(User.email, User.id).filter(
+                User.email.in_([user['email'] for user in users])
+            ).all())
+            self.commit(db)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            self.release_session(db)
+        self.mark_written(emails=list(ids))
+        return ids
     
     def authenticate(self, data):
         """Autentica um usuário"""
-        db = get_db()
+        db = self.open_read_session(f"email:{data.get('email')}")
         try:
             user = db.query(User).filter(User.email == data['email']).first()
             
@@ -128,32 +496,50 @@ class UserService:
                 'token': token,
                 'user': user.to_dict()
             }
+        except OverloadedError:
+            raise
         except Exception as e:
             return {'success': False, 'message': f'Erro na autenticação: {str(e)}'}
         finally:
-            db.close()
+            self.release_session(db)
     
     def get_user(self, user_id):
         """Retorna informações de um usuário"""
-        db = get_db()
+        use_cache = self.cache_active()
+        fragment_generation = self.user_fragments.generation
+        if use_cache:
+            cached = self.user_cache.get(user_id)
+            if cached is not None:
+                fragment = (self.user_fragments.get(cached['id'], cached['updated_at'])
+                            or self.user_fragments.put(cached, fragment_generation))
+                return self.fragment_response({'success': True}, 'user', [fragment], many=False)
+        generation = self.user_cache.generation
+        
+        db = self.open_read_session(f'user:{user_id}')
         try:
             user = db.query(User).filter(User.id == user_id).first()
             
             if not user:
                 return {'success': False, 'message': 'Usuário não encontrado'}
             
-            return {
-                'success': True,
-                'user': user.to_dict()
-            }
+            if not use_cache:
+                # Batch transacional: dados ainda não confirmados ficam fora dos caches
+                return {'success': True, 'user': user.to_dict()}
+            
+            fragment = self.user_fragments.get(user.id, User.format_field('updated_at', user.updated_at))
+            if fragment is None:
+                fragment = self.user_fragments.put(user.to_dict(), fragment_generation)
+            self.user_cache.put(fragment[0], generation)
+            
+            return self.fragment_response({'success': True}, 'user', [fragment], many=False)
         except Exception as e:
             return {'success': False, 'message': f'Erro ao buscar usuário: {str(e)}'}
         finally:
-            db.close()
+            self.release_session(db)
     
     def update_user(self, user_id, data):
         """Atualiza informações de um usuário"""
-        db = get_db()
+        db = self.open_session()
         try:
             user = db.query(User).filter(User.id == user_id).first()
             
@@ -161,10 +547,14 @@ class UserService:
                 return {'success': False, 'message': 'Usuário não encontrado'}
             
             # Atualizar campos permitidos
+            old_email = user.email
             if 'name' in data:
                 user.name = data['name']
             if 'email' in data:
-                # Verificar se email já existe
+                # Verificar se email já existe (primeiro no cache)
+                cached_id = self.user_cache.find_id(email=data['email']) if self.cache_active() else None
+                if cached_id is not None and cached_id != user.id:
+                    return {'success': False, 'message': 'Email já cadastrado'}
                 existing = db.query(User).filter(
                     User.email == data['email'],
                     User.id != user_id
@@ -183,56 +573,56 @@ class UserService:
             
             user.updated_at = datetime.utcnow()
             
-            db.commit()
-            db.refresh(user)
+            # Notificação de atualização (outbox, mesma transação)
+            self.notify(
+                db,
+                email=user.email,
+                assunto='Dados Atualizados',
+                mensagem=f'Olá {user.name}! Seus dados foram atualizados com sucesso.'
+            )
             
-            # Publicar notificação de atualização
-            try:
-                publisher.publish_notification(
-                    email=user.email,
-                    assunto='Dados Atualizados',
-                    mensagem=f'Olá {user.name}! Seus dados foram atualizados com sucesso.'
-                )
-            except Exception as e:
-                print(f"⚠️  Erro ao publicar notificação: {e}")
+            self.commit(db)
+            db.refresh(user)
+            self.mark_written(user.id, [old_email, user.email])
+            self.invalidate_user(user.id)
             
             return {
                 'success': True,
                 'message': 'Usuário atualizado com sucesso',
                 'user': user.to_dict()
             }
+        except OverloadedError:
+            db.rollback()
+            raise
         except Exception as e:
             db.rollback()
             return {'success': False, 'message': f'Erro ao atualizar usuário: {str(e)}'}
         finally:
-            db.close()
+            self.release_session(db)
     
     def delete_user(self, user_id):
         """Desativa um usuário (soft delete)"""
-        db = get_db()
+        db = self.open_session()
         try:
             user = db.query(User).filter(User.id == user_id).first()
             
             if not user:
                 return {'success': False, 'message': 'Usuário não encontrado'}
             
-            # Salvar email antes de desativar
-            user_email = user.email
-            user_name = user.name
-            
             user.active = 0
-            db.commit()
             
-            # Publicar notificação de desativação
-            try:
-                publisher.publish_notification(
-                    email=user_email,
-                    assunto='Conta Desativada',
-                    mensagem=f'Olá {user_name}! Sua conta foi desativada. '
-                            f'Entre em contato com o suporte se precisar de ajuda.'
-                )
-            except Exception as e:
-                print(f"⚠️  Erro ao publicar notificação: {e}")
+            # Notificação de desativação (outbox, mesma transação)
+            self.notify(
+                db,
+                email=user.email,
+                assunto='Conta Desativada',
+                mensagem=f'Olá {user.name}! Sua conta foi desativada. '
+                        f'Entre em contato com o suporte se precisar de ajuda.'
+            )
+            
+            self.commit(db)
+            self.mark_written(user.id, [user.email])
+            self.invalidate_user(user.id)
             
             return {
                 'success': True,
@@ -242,39 +632,238 @@ class UserService:
             db.rollback()
             return {'success': False, 'message': f'Erro ao desativar usuário: {str(e)}'}
         finally:
-            db.close()
+            self.release_session(db)
     
-    def list_users(self, filters=None):
-        """Lista usuários com filtros opcionais"""
-        db = get_db()
+    def list_fields(self, fields):
+        """Valida a projeção de campos da listagem (o id é sempre incluído)"""
+        fields = list(fields or User.PUBLIC_FIELDS)
+        unknown = [f for f in fields if f not in User.PUBLIC_FIELDS]
+        if unknown:
+            raise ValueError(f"Campos inválidos: {', '.join(unknown)}")
+        if 'id' not in fields:
+            fields.insert(0, 'id')
+        return fields
+    
+    def list_conditions(self, filters):
+        """Converte os filtros da listagem em condições da consulta"""
+        conditions = []
+        if filters:
+            if 'role' in filters:
+                conditions.append(User.role == UserRole[filters['role'].upper()])
+            if 'active' in filters:
+                conditions.append(User.active == filters['active'])
+        return conditions
+    
+    def list_users(self, filters=None, cursor=None, limit=None, fields=None, include_total=True):
+        """
+        Lista usuários com filtros opcionais.
+        Paginação por cursor (keyset em id) e projeção de campos.
+        """
         try:
-            query = db.query(User)
+            limit = min(int(limit or LIST_PAGE_SIZE), LIST_MAX_PAGE_SIZE)
+            if limit < 1:
+                raise ValueError('limit deve ser positivo')
+            after_id = decode_cursor(cursor) if cursor else None
+            fields = self.list_fields(fields)
+        except ValueError as e:
+            return {'success': False, 'message': str(e)}
+        
+        # Projeção completa: cada linha vira o fragmento JSON da sua versão
+        use_fragments = fields == list(User.PUBLIC_FIELDS) and self.cache_active()
+        fragment_generation = self.user_fragments.generation
+        
+        db = self.open_read_session()
+        try:
+            conditions = self.list_conditions(filters)
             
-            if filters:
-                if 'role' in filters:
-                    query = query.filter(User.role == UserRole[filters['role'].upper()])
-                if 'active' in filters:
-                    query = query.filter(User.active == filters['active'])
+            total = None
+            if include_total:
+                total = db.query(func.count(User.id)).filter(*conditions).scalar()
             
-            users = query.all()
+            query = db.query(*[getattr(User, f) for f in fields]).filter(*conditions)
+            if after_id is not None:
+                query = query.filter(User.id > after_id)
+            # Uma linha extra indica se existe próxima página
+            rows = query.order_by(User.id).limit(limit + 1).all()
+            has_more = len(rows) > limit
+            rows = rows[:limit]
             
-            return {
+            if use_fragments:
+                version = fields.index('updated_at')
+                found = self.user_fragments.lookup(
+                    [(row[0], User.format_field('updated_at', row[version])) for row in rows]
+                )
+                built = iter(self.user_fragments.store([
+                    {name: User.format_field(name, value) for name, value in zip(fields, row)}
+                    for row, fragment in zip(rows, found) if fragment is None
+                ], fragment_generation))
+                fragments = [fragment or next(built) for fragment in found]
+                response = {
+                    'success': True,
+                    'count': len(rows),
+                    'next_cursor': encode_cursor(rows[-1][0]) if has_more else None
+                }
+                if include_total:
+                    response['total'] = total
+                return self.fragment_response(response, 'users', fragments)
+            
+            users = [
+                {name: User.format_field(name, value) for name, value in zip(fields, row)}
+                for row in rows
+            ]
+            
+            response = {
                 'success': True,
-                'users': [user.to_dict() for user in users],
-                'count': len(users)
+                'users': users,
+                'count': len(users),
+                'next_cursor': encode_cursor(users[-1]['id']) if has_more else None
             }
+            if include_total:
+                response['total'] = total
+            return response
         except Exception as e:
             return {'success': False, 'message': f'Erro ao listar usuários: {str(e)}'}
         finally:
+            self.release_session(db)
+    
+    def list_users_stream(self, filters=None, fields=None):
+        """
+        Lista todos os usuários em streaming (exportação).
+        As linhas são lidas por um cursor no servidor do banco e enviadas em
+        frames NDJSON, sem montar o resultado completo em memória.
+        """
+        if self.current_batch():
+            return {'success': False, 'message': 'Streaming não é permitido em batch'}
+        try:
+            fields = self.list_fields(fields)
+            conditions = self.list_conditions(filters)
+        except (ValueError, KeyError) as e:
+            return {'success': False, 'message': f'Filtro ou campo inválido: {str(e)}'}
+        
+        def chunks():
+            # Sessão própria: o streaming pode continuar em outra thread do executor
+            db = replicas.new_read_session()
+            count = 0
+            try:
+                query = (db.query(*[getattr(User, f) for f in fields])
+                         .filter(*conditions)
+                         .order_by(User.id)
+                         .yield_per(LIST_STREAM_CHUNK_SIZE))
+                lines = []
+                for row in query:
+                    user = {name: User.format_field(name, value) for name, value in zip(fields, row)}
+                    lines.append(json.dumps(user).encode('utf-8') + b'\n')
+                    if len(lines) >= LIST_STREAM_CHUNK_SIZE:
+                        count += len(lines)
+                        yield b''.join(lines)
+                        lines = []
+                if lines:
+                    count += len(lines)
+                    yield b''.join(lines)
+                stream.summary = {'success': True, 'count': count}
+            except Exception as e:
+                stream.summary = {
+                    'success': False,
+                    'count': count,
+                    'message': f'Erro ao listar usuários: {str(e)}'
+                }
+            finally:
+                db.close()
+        
+        stream = protocol.StreamResponse(chunks())
+        return stream
+    
+    def batch(self, data):
+        """Executa várias ações em ordem usando uma única sessão do banco"""
+        requests = data.get('requests')
+        transactional = bool(data.get('transaction', False))
+        
+        if not isinstance(requests, list) or not requests:
+            return {'success': False, 'message': 'Lista de requisições vazia ou inválida'}
+        if not all(isinstance(sub, dict) and isinstance(sub.get('data', {}), dict) for sub in requests):
+            return {'success': False, 'message': "Cada requisição do batch deve ser um objeto ('data' também)"}
+        if len(requests) > BATCH_MAX_SIZE:
+            return {'success': False, 'message': f'Batch excede o limite de {BATCH_MAX_SIZE} requisições'}
+        if any(sub.get('action') == 'batch' for sub in requests):
+            return {'success': False, 'message': 'Batch aninhado não é permitido'}
+        if self.current_batch():
+            return {'success': False, 'message': 'Batch já em execução'}
+        
+        db = get_db()
+        batch = BatchContext(db, transactional)
+        self.local.batch = batch
+        results = []
+        try:
+            for sub in requests:
+                result = self.handle_request(sub)
+                results.append(result)
+                if not result.get('success'):
+                    if transactional:
+                        break
+                    # Descarta alterações pendentes da sub-requisição que falhou
+                    db.rollback()
+            
+            success = len(results) == len(requests) and all(r.get('success') for r in results)
+            if transactional:
+                if success:
+                    db.commit()
+                    self.outbox_relay.wake()
+                else:
+                    db.rollback()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            self.local.batch = None
             db.close()
+        
+        # Invalidações do batch transacional só saem após o commit
+        # (as notificações já foram gravadas na outbox dentro da transação)
+        if success:
+            replicas.mark_written(*batch.written)
+            for user_id in batch.invalidations:
+                self.invalidate_user(user_id)
+        
+        response = {
+            'success': success,
+            'results': results,
+            'transaction': transactional
+        }
+        if transactional:
+            response['committed'] = success
+        return response
     
     def handle_request(self, request_data):
         """Processa requisição recebida"""
         action = request_data.get('action')
+        # Ações desconhecidas não viram rótulos novos nas métricas
+        label = action if action in ACTIONS else 'unknown'
+        # Continua o trace da interface REST (ou do batch em execução)
+        with self.request_metrics.track(label), \
+                tracer.span(f'user_service.{label}', request_data.get('traceparent'), action=label) as span:
+            try:
+                if profiler.session is not None:
+                    response = profiler.call(label, self.dispatch, request_data)
+                else:
+                    response = self.dispatch(request_data)
+            except OverloadedError:
+                response = overloaded_response()
+            error_type = response_error_type(response)
+            if error_type:
+                span.set('error.type', error_type)
+        if error_type:
+            self.request_metrics.error(error_type, label)
+        return response
+    
+    def dispatch(self, request_data):
+        """Encaminha a requisição para a ação correspondente"""
+        action = request_data.get('action')
         data = request_data.get('data', {})
         
         if action == 'create_user':
             return self.create_user(data)
+        elif action == 'bulk_create_users':
+            return self.bulk_create_users(data)
         elif action == 'authenticate':
             return self.authenticate(data)
         elif action == 'get_user':
@@ -284,79 +873,60 @@ class UserService:
         elif action == 'delete_user':
             return self.delete_user(data.get('user_id'))
         elif action == 'list_users':
-            return self.list_users(data.get('filters'))
+            if data.get('stream'):
+                return self.list_users_stream(data.get('filters'), data.get('fields'))
+            return self.list_users(
+                data.get('filters'),
+                cursor=data.get('cursor'),
+                limit=data.get('limit'),
+                fields=data.get('fields'),
+                include_total=data.get('include_total', True)
+            )
         elif action == 'verify_token':
             payload = self.verify_token(data.get('token'))
             if payload:
                 return {'success': True, 'payload': payload}
             return {'success': False, 'message': 'Token inválido ou expirado'}
+        elif action == 'batch':
+            return self.batch(data)
+        elif action == 'stats':
+            return self.get_stats()
+        elif action == 'metrics':
+            return self.get_metrics()
+        elif action == 'profile':
+            return self.profile(data)
+        elif action == 'hello':
+            # Handshake: codificações de payload aceitas (protocol.negotiate)
+            return protocol.negotiate(data.get('encodings'))
         else:
             return {'success': False, 'message': 'Ação não reconhecida'}
 
-def handle_client(client_socket, address, service):
-    """Gerencia conexão com um cliente"""
-    print(f"Nova conexão de {address}")
-    try:
-        # Receber dados do cliente
-        data = b''
-        while True:
-            chunk = client_socket.recv(4096)
-            if not chunk:
-                break
-            data += chunk
-            if len(chunk) < 4096:
-                break
-        
-        if data:
-            # Decodificar mensagem
-            message = data.decode('utf-8')
-            request_data = json.loads(message)
-            
-            print(f"Requisição recebida: {request_data.get('action')}")
-            
-            # Processar requisição
-            response = service.handle_request(request_data)
-            
-            # Enviar resposta
-            response_json = json.dumps(response)
-            client_socket.sendall(response_json.encode('utf-8'))
-            print(f"Resposta enviada para {address}")
-    except Exception as e:
-        print(f"Erro ao processar requisição de {address}: {e}")
-        error_response = json.dumps({'success': False, 'message': str(e)})
-        client_socket.sendall(error_response.encode('utf-8'))
-    finally:
-        client_socket.close()
-
 def start_server():
     """Inicia o servidor socket"""
+    if OFFLINE_MODE:
+        print(f"🔌 Modo offline: banco {DATABASE_URL}, notificações no broker em memória")
     print("Inicializando banco de dados...")
     init_db()
     
     print(f"Iniciando Serviço de Usuários em {HOST}:{PORT}")
     service = UserService()
     
-    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    server_socket.bind((HOST, PORT))
-    server_socket.listen(5)
-    
-    print(f"Servidor rodando em {HOST}:{PORT}")
-    print("Aguardando conexões...")
-    
     try:
-        while True:
-            client_socket, address = server_socket.accept()
-            client_thread = threading.Thread(
-                target=handle_client,
-                args=(client_socket, address, service)
-            )
-            client_thread.daemon = True
-            client_thread.start()
+        if SERVER_ENGINE == 'asyncio':
+            server = AsyncUserServer(service, HOST, PORT)
+            service.register_stats('server', server.stats)
+            server.run()
+        else:
+            server = ThreadedUserServer(service, HOST, PORT)
+            service.register_stats('server', server.stats)
+            server.serve_forever()
     except KeyboardInterrupt:
         print("\nEncerrando servidor...")
     finally:
-        server_socket.close()
+        service.hasher.shutdown()
+        service.outbox_relay.stop()
+        replicas.stop()
+        publisher.close()
         close_db()
 
 if __name__ == '__main__':
@@ -0,0 +1,104 @@
+"""
+Pool de workers com fila limitada e controle de admissão
+Requisições que esperam na fila além do prazo são descartadas com uma
+resposta de sobrecarga em vez de acumular threads e conexões ao MySQL.
+"""
+import os
+import queue
+import threading
+import time
+
+# Número de workers que processam requisições
+WORKER_POOL_SIZE = int(os.getenv('WORKER_POOL_SIZE', 32))
+# Número máximo de requisições aguardando na fila
+WORKER_QUEUE_SIZE = int(os.getenv('WORKER_QUEUE_SIZE', 256))
+# Tempo máximo (ms) que uma requisição pode esperar na fila
+QUEUE_DEADLINE = int(os.getenv('QUEUE_DEADLINE_MS', 2000)) / 1000.0
+
+class OverloadedError(Exception):
+    """Serviço sobrecarregado: a requisição não pôde ser admitida"""
+
+def overloaded_response():
+    """Resposta padrão para requisições descartadas por sobrecarga"""
+    return {
+        'success': False,
+        'overloaded': True,
+        'message': 'Serviço sobrecarregado, tente novamente em instantes'
+    }
+
+class BoundedWorkerPool:
+    """Pool de threads de tamanho fixo com fila limitada e prazo de espera"""
+
+    def __init__(self, workers, queue_size, queue_deadline=None, name='worker'):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.queue_deadline = queue_deadline
+        self.name = name
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.completed = 0
+        self.shed_queue_full = 0
+        self.shed_deadline = 0
+        self.max_queue_wait = 0.0
+        self.threads = []
+        for i in range(workers):
+            thread = threading.Thread(target=self._run, name=f'{name}-{i}', daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def submit(self, fn, *args, on_expired=None):
+        """
+        Enfileira `fn(*args)`. Retorna False se a fila estiver cheia.
+        Se a tarefa esperar mais que o prazo, `on_expired(*args)` é
+        executado no lugar de `fn`.
+        """
+        try:
+            self.queue.put_nowait((time.monotonic(), fn, args, on_expired))
+            return True
+        except queue.Full:
+            with self.lock:
+                self.shed_queue_full += 1
+            return False
+
+    def _run(self):
+        while True:
+            enqueued_at, fn, args, on_expired = self.queue.get()
+            waited = time.monotonic() - enqueued_at
+            expired = self.queue_deadline is not None and waited > self.queue_deadline
+            with self.lock:
+                self.max_queue_wait = max(self.max_queue_wait, waited)
+                if expired:
+                    self.shed_deadline += 1
+                else:
+                    self.in_flight += 1
+            try:
+                if expired:
+                    if on_expired:
+                        on_expired(*args)
+                else:
+                    fn(*args)
+            except Exception as e:
+                print(f"Erro no worker {self.name}: {e}")
+            finally:
+                if not expired:
+                    with self.lock:
+                        self.in_flight -= 1
+                        self.completed += 1
+                self.queue.task_done()
+
+    def stats(self):
+        """Retorna profundidade da fila e contadores de descarte"""
+        with self.lock:
+            return {
+                'workers': self.workers,
+                'queue_size': self.queue_size,
+                'queue_depth': self.queue.qsize(),
+                'queue_deadline': self.queue_deadline,
+                'in_flight': self.in_flight,
+                'completed': self.completed,
+                'shed_queue_full': self.shed_queue_full,
+                'shed_deadline': self.shed_deadline,
+                'shed_total': self.shed_queue_full + self.shed_deadline,
+                'max_queue_wait': round(self.max_queue_wait, 4)
+            }